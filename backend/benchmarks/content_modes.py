@@ -0,0 +1,124 @@
+"""
+Compare the wall-clock latency of ContentGenerator's generation modes.
+
+The Gemini model is replaced by a stub that sleeps for a fixed time to first
+token plus the time it would take to stream its output at a fixed rate, so the
+numbers reflect the number of round trips and tokens rather than network noise.
+
+Usage (from the backend directory):
+    python -m benchmarks.content_modes --runs 5 --latency 0.8 --tokens-per-second 250
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from unittest import mock
+
+from content_generation.content_generation import ContentGenerator
+from content_generation.llm_clients import llm_clients
+
+ANALYSIS = {
+    "recommended_difficulty": "intermediate",
+    "sections": ["Introduction", "Core Concepts", "Applications", "Conclusion"],
+    "key_concepts": ["Concept 1", "Concept 2", "Concept 3"],
+}
+
+CONTENT = {
+    "topic": "Benchmark Topic",
+    "summary": "A concise summary of the topic. " * 4,
+    "sections": [
+        {
+            "title": title,
+            "content": "Detailed section content. " * 60,
+            "key_points": ["Key point 1", "Key point 2", "Key point 3"],
+        }
+        for title in ANALYSIS["sections"]
+    ],
+    "references": ["Reference 1", "Reference 2"],
+    "difficulty_level": "intermediate",
+}
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """
+    Stands in for the shared GenerativeModel with a simple latency model
+    """
+
+    calls = 0
+    lock = threading.Lock()
+
+    def __init__(self, model_name, latency, tokens_per_second):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+
+    def generate_content(self, prompt, generation_config=None, **kwargs):
+        with StubModel.lock:
+            StubModel.calls += 1
+        schema = (generation_config or {}).get("response_schema", {}).get("properties", {})
+        if "analysis" in schema:
+            text = json.dumps({"analysis": ANALYSIS, "content": CONTENT})
+        elif "key_points" in schema:
+            text = json.dumps(CONTENT["sections"][0])
+        elif "summary" in schema:
+            text = json.dumps({"summary": CONTENT["summary"], "references": CONTENT["references"]})
+        elif "Analyze the topic" in prompt:
+            text = json.dumps(ANALYSIS)
+        else:
+            text = json.dumps(CONTENT)
+
+        # Roughly four characters per token
+        time.sleep(self.latency + (len(text) / 4) / self.tokens_per_second)
+        return StubResponse(text)
+
+
+def run_mode(mode, runs, latency, tokens_per_second):
+    timings = []
+    StubModel.calls = 0
+    factory = lambda name: StubModel(name, latency, tokens_per_second)
+    with mock.patch.object(llm_clients, "generative_model", side_effect=factory):
+        for _ in range(runs):
+            start = time.perf_counter()
+            ContentGenerator("Benchmark Topic", "intermediate", mode=mode).generate_content()
+            timings.append(time.perf_counter() - start)
+    return {
+        "mode": mode,
+        "runs": runs,
+        "model_calls_per_run": StubModel.calls / runs,
+        "mean_seconds": statistics.mean(timings),
+        "min_seconds": min(timings),
+        "max_seconds": max(timings),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Generations per mode")
+    parser.add_argument("--latency", type=float, default=0.8, help="Stub time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=250, help="Stub output token rate")
+    args = parser.parse_args()
+
+    results = [
+        run_mode(mode, args.runs, args.latency, args.tokens_per_second)
+        for mode in ContentGenerator.MODES
+    ]
+    for result in results:
+        print(
+            f"{result['mode']:>8}: {result['mean_seconds']:.3f}s mean "
+            f"({result['min_seconds']:.3f}s - {result['max_seconds']:.3f}s), "
+            f"{result['model_calls_per_run']:.0f} model call(s) per generation"
+        )
+    slowest = max(results, key=lambda result: result["mean_seconds"])
+    for result in results:
+        if result is not slowest:
+            saved = slowest["mean_seconds"] - result["mean_seconds"]
+            print(f"{result['mode']} mode saves {saved:.3f}s per generation over {slowest['mode']} mode")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""
+Benchmark the main API endpoints end to end under concurrent load.
+
+Requests go through the full Django stack, served in-process by the WSGI or
+ASGI handler (or by a running server with --url), while Gemini and YouTube
+are replaced by the local stand-in from benchmarks/standin.py. Each scenario
+reports throughput, p50/p95/p99 latency, database queries per request and the
+memory high-water mark, and the results are written as JSON so that runs can
+be compared with --compare.
+
+The in-process benchmark creates its own database (a temporary copy of the
+schema), so it does not touch db.sqlite3. With --url, benchmark users are
+signed up with the server, which should be started with API_STANDIN_URL set.
+
+Usage (from the backend directory):
+    python -m benchmarks.endpoints --server both --requests 200 --concurrency 16
+    python -m benchmarks.endpoints --scenarios login,profile --output before.json
+    python -m benchmarks.endpoints --compare before.json
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.standin import StandinConfig, start_standin
+
+SCENARIOS = ("generate-content", "generate-questions", "user-contents", "video-links", "login", "profile")
+PASSWORD = "benchmark-password"
+
+# Queries made while serving the current request
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def percentile(values, p):
+    """
+    The p-th percentile (0-100) of sorted values, interpolating between ranks
+    """
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class Scenario:
+    """
+    The request a scenario sends for its i-th iteration
+    """
+
+    def __init__(self, name, users, distinct):
+        self.name = name
+        self.users = users
+        self.distinct = distinct
+
+    def request(self, i):
+        user = self.users[i % len(self.users)]
+        auth = {"Authorization": f"Token {user['token']}"}
+        topic = f"Benchmark topic {i % self.distinct}"
+        if self.name == "generate-content":
+            return "POST", "/api/generate-content/", {"topic": topic, "difficulty": "intermediate"}, auth
+        if self.name == "generate-questions":
+            content = f"{topic}. " + "Light bends when it passes from air into glass. " * 40
+            return "POST", "/api/generate-questions/", {
+                "content": content, "num_questions": 5, "difficulty": "easy",
+            }, auth
+        if self.name == "user-contents":
+            return "GET", "/api/user-contents/", None, auth
+        if self.name == "video-links":
+            return "POST", "/api/video-links/", {"topic": topic, "max_results": 5}, auth
+        if self.name == "login":
+            return "POST", "/api/login/", {"username": user["username"], "password": PASSWORD}, {}
+        if self.name == "profile":
+            return "GET", "/api/profile/", None, auth
+        raise ValueError(f"Unknown scenario '{self.name}'")
+
+
+def _summarize(scenario, server, concurrency, results, duration, python_peak):
+    latencies = sorted(latency for latency, _, _ in results)
+    queries = [count for _, _, count in results if count is not None]
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    return {
+        "scenario": scenario,
+        "server": server,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": statuses,
+        "duration_seconds": duration,
+        "throughput_rps": len(results) / duration if duration else 0.0,
+        "latency_ms": {
+            "mean": statistics.mean(latencies) * 1000,
+            "p50": percentile(latencies, 50) * 1000,
+            "p95": percentile(latencies, 95) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": latencies[-1] * 1000,
+        },
+        "db_queries": {
+            "total": sum(queries),
+            "per_request_mean": statistics.mean(queries),
+            "per_request_max": max(queries),
+        } if queries else None,
+        "rss_high_water_mb": rss_mb,
+        "python_peak_mb": python_peak / (1024 * 1024) if python_peak is not None else None,
+    }
+
+
+def _send(client, scenario, i):
+    method, path, body, headers = scenario.request(i)
+    counter = [0]
+    token = _request_queries.set(counter)
+    start = time.perf_counter()
+    try:
+        response = client.request(method, path, json=body, headers=headers)
+        status = response.status_code
+    except httpx.HTTPError:
+        status = "error"
+    finally:
+        _request_queries.reset(token)
+    return time.perf_counter() - start, status, counter[0]
+
+
+async def _asend(client, scenario, i):
+    method, path, body, headers = scenario.request(i)
+    counter = [0]
+    token = _request_queries.set(counter)
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path, json=body, headers=headers)
+        status = response.status_code
+    except httpx.HTTPError:
+        status = "error"
+    finally:
+        _request_queries.reset(token)
+    return time.perf_counter() - start, status, counter[0]
+
+
+def run_threaded(make_client, scenario, requests, concurrency, count_queries):
+    """
+    Send requests from concurrency threads, each with its own client
+    """
+    local = threading.local()
+
+    def send(i):
+        if not hasattr(local, "client"):
+            local.client = make_client()
+        latency, status, queries = _send(local.client, scenario, i)
+        return latency, status, queries if count_queries else None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(send, range(requests)))
+
+
+def run_async(app, scenario, requests, concurrency):
+    """
+    Send requests from concurrency tasks sharing one ASGI client
+    """
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://localhost", timeout=None) as client:
+            async def send(i):
+                async with semaphore:
+                    return await _asend(client, scenario, i)
+            return await asyncio.gather(*[send(i) for i in range(requests)])
+
+    return asyncio.run(main())
+
+
+def _run(server, scenario, requests, args, apps):
+    if server == "asgi":
+        return run_async(apps["asgi"], scenario, requests, args.concurrency)
+    if server == "wsgi":
+        make_client = lambda: httpx.Client(
+            transport=httpx.WSGITransport(app=apps["wsgi"]), base_url="http://localhost", timeout=None
+        )
+        return run_threaded(make_client, scenario, requests, args.concurrency, True)
+    make_client = lambda: httpx.Client(base_url=args.url, timeout=None)
+    return run_threaded(make_client, scenario, requests, args.concurrency, False)
+
+
+def run_scenario(name, server, users, args, apps):
+    scenario = Scenario(name, users, args.distinct_topics)
+    if args.warmup:
+        # Unmeasured requests, so imports and first connections are not timed
+        _run(server, scenario, args.warmup, args, apps)
+    if args.tracemalloc:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    results = _run(server, scenario, args.requests, args, apps)
+    duration = time.perf_counter() - start
+    python_peak = None
+    if args.tracemalloc:
+        python_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return _summarize(name, server, args.concurrency, results, duration, python_peak)
+
+
+def setup_django(args):
+    """
+    Start the API stand-in and set Django up against a fresh benchmark database
+    """
+    standin, standin_url = start_standin(StandinConfig(
+        latency=args.api_latency, error_rate=args.api_error_rate, seed=args.seed
+    ))
+    os.environ["API_STANDIN_URL"] = standin_url
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+
+    import django
+    from django.conf import settings
+    django.setup()
+    settings.ALLOWED_HOSTS = ["*"]
+    settings.QUESTION_BANK_ENABLED = args.question_bank
+    database = settings.DATABASES["default"]
+    if database["ENGINE"].endswith("sqlite3"):
+        # A file rather than an in-memory database, so every thread sees the same data
+        database.setdefault("TEST", {})["NAME"] = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+
+    from django.test.utils import setup_databases
+    old_config = setup_databases(verbosity=0, interactive=False)
+
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    def instrument(connection, **kwargs):
+        if _count_queries not in connection.execute_wrappers:
+            connection.execute_wrappers.append(_count_queries)
+
+    connection_created.connect(instrument, weak=False)
+    for connection in connections.all():
+        instrument(connection)
+    return standin, old_config
+
+
+def create_users(count):
+    from rest_framework.authtoken.models import Token
+    from user_profiles.models import CustomUser
+
+    users = []
+    for i in range(count):
+        user = CustomUser.objects.create_user(username=f"benchmark-{i}", password=PASSWORD)
+        users.append({"username": user.username, "token": Token.objects.create(user=user).key})
+    return users
+
+
+def create_users_over_http(url, count):
+    """
+    Sign benchmark users up with a running server
+    """
+    suffix = datetime.now().strftime("%Y%m%d%H%M%S")
+    users = []
+    with httpx.Client(base_url=url, timeout=None) as client:
+        for i in range(count):
+            username = f"benchmark-{suffix}-{i}"
+            response = client.post("/api/signup/", json={"username": username, "password": PASSWORD})
+            response.raise_for_status()
+            users.append({"username": username, "token": response.json()["token"]})
+    return users
+
+
+def compare(results, baseline_path):
+    """
+    Print how each scenario changed against a previous results file
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["server"], r["scenario"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get((result["server"], result["scenario"]))
+        if before is None:
+            continue
+
+        def change(after, previous):
+            return f"{(after - previous) / previous * 100:+.1f}%" if previous else "n/a"
+
+        print(
+            f"{result['server']:>4} {result['scenario']:<20} "
+            f"throughput {change(result['throughput_rps'], before['throughput_rps'])}, "
+            f"p95 {change(result['latency_ms']['p95'], before['latency_ms']['p95'])}, "
+            f"p99 {change(result['latency_ms']['p99'], before['latency_ms']['p99'])}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("wsgi", "asgi", "both"), default="both")
+    parser.add_argument("--url", help="Benchmark a running server at this URL instead (no query counts)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--users", type=int, default=8, help="Benchmark users to spread requests over")
+    parser.add_argument("--distinct-topics", type=int, default=10, help="Topics requests cycle through")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Stand-in Gemini/YouTube latency in seconds")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="Share of failing stand-in API calls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--question-bank", action="store_true", help="Pre-generate question banks while running")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also measure peak Python allocations (slower)")
+    parser.add_argument("--output", help="Results file (default benchmarks/results/endpoints-<time>.json)")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    if args.url:
+        # The server has its own database and API settings; start it with
+        # API_STANDIN_URL pointing at a running stand-in
+        standin = old_config = None
+        apps = {}
+        servers = ["url"]
+        users = create_users_over_http(args.url, args.users)
+    else:
+        standin, old_config = setup_django(args)
+        from django.core.asgi import get_asgi_application
+        from django.core.wsgi import get_wsgi_application
+
+        apps = {"wsgi": get_wsgi_application(), "asgi": get_asgi_application()}
+        servers = ["wsgi", "asgi"] if args.server == "both" else [args.server]
+        users = create_users(args.users)
+
+    results = []
+    try:
+        for server in servers:
+            for name in scenarios:
+                result = run_scenario(name, server, users, args, apps)
+                results.append(result)
+                latency = result["latency_ms"]
+                queries = result["db_queries"]
+                print(
+                    f"{server:>4} {name:<20} {result['throughput_rps']:8.1f} req/s  "
+                    f"p50 {latency['p50']:7.1f}ms  p95 {latency['p95']:7.1f}ms  p99 {latency['p99']:7.1f}ms  "
+                    f"{queries['per_request_mean'] if queries else float('nan'):5.1f} queries/req  "
+                    f"{result['errors']} errors  {result['rss_high_water_mb']:.0f}MB RSS"
+                )
+    finally:
+        if standin is not None:
+            from django.test.utils import teardown_databases
+            teardown_databases(old_config, verbosity=0)
+            standin.shutdown()
+
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results", f"endpoints-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "options": vars(args),
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,549 @@
+"""
+A local stand-in for the Gemini and YouTube Data APIs, for load tests and
+offline runs that must not use real API quota.
+
+It speaks enough of both protocols for the app's clients to run unchanged:
+Gemini generateContent and streamGenerateContent (JSON array and SSE), with
+JSON output built from the request's response schema, function declaration
+or the JSON example in its prompt, and YouTube search.list and videos.list.
+Output is deterministic: the same request always gets the same fixture.
+Latency, server errors, truncated or malformed model output and rate
+limiting can be injected, and the sequence of injected faults is
+reproducible for a given --seed.
+
+Point the app at it by setting API_STANDIN_URL, e.g.:
+    python -m benchmarks.standin --port 8765 --latency 0.5 --error-rate 0.05
+    API_STANDIN_URL=http://127.0.0.1:8765 python manage.py runserver
+
+Every option can also be set with the environment variable in its help text.
+Use start_standin() to run it in-process instead.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from content_generation import json_repair
+
+WORDS = (
+    "energy system model process structure function theory method example "
+    "principle pattern change force value result analysis concept element "
+    "reaction signal balance network surface motion field layer source"
+).split()
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+# Gemini's Type enum, which the REST transport sends as integers
+SCHEMA_TYPES = {1: "string", 2: "number", 3: "integer", 4: "boolean", 5: "array", 6: "object"}
+
+
+class StandinConfig:
+    """
+    Fault injection settings, defaulting to the STANDIN_* environment variables
+    """
+
+    def __init__(self, **options):
+        def option(name, default, cast=float):
+            value = options.get(name)
+            if value is None:
+                value = os.getenv(f"STANDIN_{name.upper()}", default)
+            return cast(value)
+
+        # Seconds before the first byte of a response, drawn from the distribution
+        self.latency = option("latency", 0.0)
+        self.latency_distribution = option("latency_distribution", "fixed", str)
+        if self.latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_distribution must be one of: {', '.join(LATENCY_DISTRIBUTIONS)}")
+        # Pace of streamed and generated model output; 0 sends it at once
+        self.tokens_per_second = option("tokens_per_second", 0.0)
+        # Shares of requests answered with a 5xx error, and of model responses
+        # whose JSON is cut off or malformed
+        self.error_rate = option("error_rate", 0.0)
+        self.truncated_rate = option("truncated_rate", 0.0)
+        self.malformed_rate = option("malformed_rate", 0.0)
+        # Requests per second allowed per API before answering 429/403; 0 for no limit
+        self.rate_limit = option("rate_limit", 0.0)
+        # YouTube quota units for the server's lifetime (search.list costs 100, videos.list 1); 0 for no quota
+        self.youtube_quota = option("youtube_quota", 0, int)
+        self.seed = option("seed", 0, int)
+
+
+class _TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def _words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def _resolve(schema, root):
+    ref = schema.get("$ref")
+    if ref:
+        for part in ref.lstrip("#/").split("/"):
+            root = root.get(part, {})
+        return root
+    return schema
+
+
+def fixture(schema, rng, name="", root=None):
+    """
+    Build a value matching a Gemini (OpenAPI subset) or JSON schema
+    """
+    root = root if root is not None else schema
+    schema = _resolve(schema, root)
+    for combined in ("anyOf", "oneOf", "allOf"):
+        if schema.get(combined):
+            return fixture(schema[combined][0], rng, name, root)
+    if schema.get("enum"):
+        return schema["enum"][0]
+
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    kind = SCHEMA_TYPES.get(kind, str(kind).lower())
+    if kind == "object":
+        properties = schema.get("properties", {})
+        # Like Gemini, write properties alphabetically unless the schema orders them
+        order = schema.get("propertyOrdering") or schema.get("property_ordering") or sorted(properties)
+        return {key: fixture(properties[key], rng, key, root) for key in order if key in properties}
+    if kind == "array":
+        count = max(int(schema.get("minItems", 0)), 3)
+        return [fixture(schema.get("items", {}), rng, name, root) for _ in range(count)]
+    if kind == "integer":
+        return rng.randint(1, 10)
+    if kind == "number":
+        return round(rng.uniform(0, 10), 2)
+    if kind == "boolean":
+        return rng.random() < 0.5
+
+    if name == "answer_option":
+        return rng.choice("abcd")
+    if name in ("difficulty", "difficulty_level", "recommended_difficulty"):
+        return "intermediate"
+    if name == "content":
+        return ". ".join(_words(rng, 12).capitalize() for _ in range(6)) + "."
+    return _words(rng, 6).capitalize()
+
+
+def _example_value(example, rng, name=""):
+    """
+    Build a value shaped like an example value, with fixture strings
+    """
+    if isinstance(example, dict):
+        return {key: _example_value(value, rng, key) for key, value in example.items()}
+    if isinstance(example, list):
+        return [_example_value(example[0], rng, name) for _ in range(3)] if example else []
+    if isinstance(example, str):
+        return fixture({"type": "string"}, rng, name)
+    return example
+
+
+def prompt_example(prompt, rng):
+    """
+    Build a value shaped like the JSON example in a prompt without a response
+    schema, or None if it has none
+    """
+    start = prompt.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    for end in range(start, len(prompt)):
+        depth += {"{": 1, "}": -1}.get(prompt[end], 0)
+        if depth == 0:
+            break
+    # Drop comments and "a" or "b" alternatives, which prompts use to explain values
+    example = re.sub(r"//[^\n]*", "", prompt[start:end + 1])
+    example = re.sub(r'("[^"]*")(\s+or\s+"[^"]*")+', r"\1", example)
+    try:
+        return _example_value(json_repair.loads(example, allow_truncated=True), rng)
+    except json.JSONDecodeError:
+        return None
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, StandinHandler)
+        self.config = config
+        self.faults = random.Random(config.seed)
+        self.faults_lock = threading.Lock()
+        self.buckets = {api: _TokenBucket(config.rate_limit) for api in ("gemini", "youtube")}
+        self.youtube_units = 0
+        self.counts_lock = threading.Lock()
+        self.counts = {}
+
+    def roll(self, rate):
+        if rate <= 0:
+            return False
+        with self.faults_lock:
+            return self.faults.random() < rate
+
+    def latency(self):
+        config = self.config
+        with self.faults_lock:
+            if config.latency_distribution == "uniform":
+                return self.faults.uniform(0, 2 * config.latency)
+            if config.latency_distribution == "exponential":
+                return self.faults.expovariate(1 / config.latency) if config.latency else 0.0
+            if config.latency_distribution == "lognormal":
+                # Median of latency with a long right tail
+                return config.latency * self.faults.lognormvariate(0, 0.5)
+        return config.latency
+
+    def count(self, name):
+        with self.counts_lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StandinServer
+
+    def log_message(self, format, *args):
+        pass
+
+    # Plumbing
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return raw, json.loads(raw or b"{}")
+
+    def _rng(self, *parts):
+        digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big") ^ self.server.config.seed)
+
+    def _pace(self, text):
+        rate = self.server.config.tokens_per_second
+        if rate > 0:
+            time.sleep(len(text) / 4 / rate)
+
+    def do_POST(self):
+        match = re.match(r"^/v1beta/(models/[^:/]+):(generateContent|streamGenerateContent)$", urlparse(self.path).path)
+        if not match:
+            return self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+        raw, request = self._body()
+        self._gemini(match.group(1), match.group(2) == "streamGenerateContent", raw, request)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/youtube/v3/search":
+            return self._youtube_search(parse_qs(url.query))
+        if url.path == "/youtube/v3/videos":
+            return self._youtube_videos(parse_qs(url.query))
+        self._send_json(404, {"error": {"code": 404, "message": "Not found"}})
+
+    # Gemini
+
+    def _gemini_error(self, status, message, reason):
+        self._send_json(status, {"error": {"code": status, "message": message, "status": reason}})
+
+    def _gemini(self, model, stream, raw, request):
+        server = self.server
+        server.count("gemini")
+        time.sleep(server.latency())
+        if not server.buckets["gemini"].take():
+            server.count("gemini_rate_limited")
+            return self._gemini_error(429, "Resource has been exhausted (e.g. check quota).", "RESOURCE_EXHAUSTED")
+        if server.roll(server.config.error_rate):
+            server.count("gemini_errors")
+            return self._gemini_error(503, "The model is overloaded. Please try again later.", "UNAVAILABLE")
+
+        rng = self._rng("gemini", model, raw)
+        config = request.get("generationConfig") or request.get("generation_config") or {}
+        # Tools are a list of tool objects in the REST API, a single one from pydantic-ai
+        tools = request.get("tools") or []
+        declarations = [
+            declaration
+            for tool in ([tools] if isinstance(tools, dict) else tools)
+            for declaration in tool.get("functionDeclarations") or tool.get("function_declarations") or []
+        ]
+        if declarations:
+            # Call the last tool, which for pydantic-ai agents returns the result
+            declaration = declarations[-1]
+            parts = [{"functionCall": {
+                "name": declaration["name"],
+                "args": fixture(declaration.get("parameters") or {}, rng),
+            }}]
+            text = json.dumps(parts[0]["functionCall"]["args"])
+            finish_reason = "STOP"
+        else:
+            schema = config.get("responseSchema") or config.get("response_schema")
+            if schema:
+                value = fixture(schema, rng)
+            else:
+                prompt = " ".join(
+                    part.get("text", "")
+                    for content in request.get("contents") or []
+                    for part in content.get("parts") or []
+                )
+                value = prompt_example(prompt, rng) or {"text": _words(rng, 40)}
+            text = json.dumps(value)
+            finish_reason = "STOP"
+            if server.roll(server.config.truncated_rate):
+                server.count("gemini_truncated")
+                text = text[:len(text) // 2]
+                finish_reason = "MAX_TOKENS"
+            elif server.roll(server.config.malformed_rate):
+                server.count("gemini_malformed")
+                # Python-style quotes and a trailing comma, as models sometimes produce
+                text = text.replace('"', "'")[:-1] + ",}"
+            parts = [{"text": text}]
+
+        usage = {
+            "promptTokenCount": max(1, len(raw) // 4),
+            "candidatesTokenCount": max(1, len(text) // 4),
+        }
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+
+        def response(parts, finish_reason=None, with_usage=False):
+            candidate = {"content": {"parts": parts, "role": "model"}, "index": 0}
+            if finish_reason:
+                candidate["finishReason"] = finish_reason
+            body = {"candidates": [candidate], "modelVersion": model.split("/")[-1]}
+            if with_usage:
+                body["usageMetadata"] = usage
+            return body
+
+        if not stream:
+            self._pace(text)
+            return self._send_json(200, response(parts, finish_reason, True))
+
+        if "text" in parts[0]:
+            size = max(1, len(text) // 8)
+            chunks = [[{"text": text[i:i + size]}] for i in range(0, len(text), size)]
+        else:
+            chunks = [parts]
+        events = [
+            response(chunk, finish_reason if i == len(chunks) - 1 else None, i == len(chunks) - 1)
+            for i, chunk in enumerate(chunks)
+        ]
+        self._stream(events, sse="sse" in parse_qs(urlparse(self.path).query).get("alt", []))
+
+    def _stream(self, events, sse):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/json; charset=UTF-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data):
+            data = data.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for i, event in enumerate(events):
+            self._pace(json.dumps(event))
+            if sse:
+                write(f"data: {json.dumps(event)}\r\n\r\n")
+            else:
+                write(("[" if i == 0 else ",\r\n") + json.dumps(event))
+        if not sse:
+            write("]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    # YouTube
+
+    def _youtube_error(self, status, message, reason, domain="youtube.quota"):
+        self._send_json(status, {"error": {
+            "code": status,
+            "message": message,
+            "errors": [{"message": message, "domain": domain, "reason": reason}],
+        }})
+
+    def _youtube_quota(self, units):
+        server = self.server
+        if server.config.youtube_quota <= 0:
+            return True
+        with server.counts_lock:
+            if server.youtube_units + units > server.config.youtube_quota:
+                return False
+            server.youtube_units += units
+            return True
+
+    def _youtube_fault(self, units):
+        """
+        Count a YouTube call and send an injected error if there is one.
+        Returns True if an error was sent.
+        """
+        server = self.server
+        server.count("youtube")
+        time.sleep(server.latency())
+        if not server.buckets["youtube"].take():
+            server.count("youtube_rate_limited")
+            self._youtube_error(403, "Rate limit exceeded.", "rateLimitExceeded", "usageLimits")
+            return True
+        if not self._youtube_quota(units):
+            server.count("youtube_quota_exceeded")
+            self._youtube_error(
+                403, "The request cannot be completed because you have exceeded your quota.", "quotaExceeded"
+            )
+            return True
+        if server.roll(server.config.error_rate):
+            server.count("youtube_errors")
+            self._youtube_error(500, "Backend Error", "backendError", "global")
+            return True
+        return False
+
+    def _youtube_search(self, query):
+        if self._youtube_fault(100):
+            return
+
+        q = query.get("q", [""])[0]
+        max_results = min(int(query.get("maxResults", ["5"])[0]), 50)
+        rng = self._rng("youtube", q, query.get("pageToken", [""])[0])
+        items = []
+        for i in range(max_results):
+            video_id = "".join(rng.choice("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-") for _ in range(11))
+            published = f"20{rng.randint(15, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z"
+            items.append({
+                "kind": "youtube#searchResult",
+                "etag": hashlib.md5(video_id.encode()).hexdigest(),
+                "id": {"kind": "youtube#video", "videoId": video_id},
+                "snippet": {
+                    "publishedAt": published,
+                    "channelId": f"UC{video_id}{video_id}"[:24],
+                    "title": f"{q} - {_words(rng, 4)}".strip(" -"),
+                    "description": _words(rng, 20),
+                    "thumbnails": {
+                        size: {"url": f"https://i.ytimg.com/vi/{video_id}/{image}.jpg", "width": width, "height": height}
+                        for size, image, width, height in (
+                            ("default", "default", 120, 90),
+                            ("medium", "mqdefault", 320, 180),
+                            ("high", "hqdefault", 480, 360),
+                        )
+                    },
+                    "channelTitle": _words(rng, 2).title(),
+                    "liveBroadcastContent": "none",
+                    "publishTime": published,
+                },
+            })
+        self._send_json(200, {
+            "kind": "youtube#searchListResponse",
+            "etag": hashlib.md5(q.encode()).hexdigest(),
+            "nextPageToken": f"P{rng.randint(1000, 9999)}",
+            "regionCode": "US",
+            "pageInfo": {"totalResults": 1000000, "resultsPerPage": max_results},
+            "items": items,
+        })
+
+    def _youtube_videos(self, query):
+        ids = [video_id for video_id in ",".join(query.get("id", [])).split(",") if video_id]
+        if len(ids) > 50:
+            return self._youtube_error(400, "The request specifies too many video IDs.", "badRequest", "youtube.parameter")
+        if self._youtube_fault(1):
+            return
+
+        parts = set(",".join(query.get("part", [])).split(","))
+        items = []
+        for video_id in ids:
+            rng = self._rng("youtube", "video", video_id)
+            item = {"kind": "youtube#video", "etag": hashlib.md5(video_id.encode()).hexdigest(), "id": video_id}
+            if "contentDetails" in parts:
+                minutes, seconds = rng.randint(1, 90), rng.randint(0, 59)
+                item["contentDetails"] = {
+                    "duration": f"PT{minutes // 60}H{minutes % 60}M{seconds}S" if minutes >= 60 else f"PT{minutes}M{seconds}S",
+                    "dimension": "2d",
+                    "definition": "hd",
+                    "caption": "false",
+                    "licensedContent": True,
+                    "projection": "rectangular",
+                }
+            if "statistics" in parts:
+                views = rng.randint(100, 5000000)
+                item["statistics"] = {
+                    "viewCount": str(views),
+                    "likeCount": str(views // rng.randint(20, 100)),
+                    "favoriteCount": "0",
+                    "commentCount": str(views // rng.randint(200, 1000)),
+                }
+            if "status" in parts:
+                item["status"] = {
+                    "uploadStatus": "processed",
+                    "privacyStatus": "public",
+                    "license": "youtube",
+                    "embeddable": rng.random() > 0.1,
+                    "publicStatsViewable": True,
+                    "madeForKids": False,
+                }
+            items.append(item)
+        self._send_json(200, {
+            "kind": "youtube#videoListResponse",
+            "etag": hashlib.md5(",".join(ids).encode()).hexdigest(),
+            "pageInfo": {"totalResults": len(items), "resultsPerPage": len(items)},
+            "items": items,
+        })
+
+
+def start_standin(config=None, host="127.0.0.1", port=0):
+    """
+    Start the stand-in on a background thread.
+
+    Returns (server, url); stop it with server.shutdown(). server.counts
+    holds the number of requests and injected faults.
+    """
+    server = StandinServer((host, port), config or StandinConfig())
+    threading.Thread(target=server.serve_forever, name="api-standin", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, help="Seconds before each response (STANDIN_LATENCY)")
+    parser.add_argument(
+        "--latency-distribution", choices=LATENCY_DISTRIBUTIONS,
+        help="How latency varies around --latency (STANDIN_LATENCY_DISTRIBUTION)"
+    )
+    parser.add_argument("--tokens-per-second", type=float, help="Model output rate (STANDIN_TOKENS_PER_SECOND)")
+    parser.add_argument("--error-rate", type=float, help="Share of 5xx responses (STANDIN_ERROR_RATE)")
+    parser.add_argument("--truncated-rate", type=float, help="Share of cut-off model output (STANDIN_TRUNCATED_RATE)")
+    parser.add_argument("--malformed-rate", type=float, help="Share of malformed model JSON (STANDIN_MALFORMED_RATE)")
+    parser.add_argument("--rate-limit", type=float, help="Requests per second per API (STANDIN_RATE_LIMIT)")
+    parser.add_argument("--youtube-quota", type=int, help="YouTube quota units per run (STANDIN_YOUTUBE_QUOTA)")
+    parser.add_argument("--seed", type=int, help="Seed of the fixtures and faults (STANDIN_SEED)")
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+
+    server = StandinServer((host, port), StandinConfig(**args))
+    print(f"Gemini and YouTube stand-in listening on http://{host}:{port}")
+    print(f"Set API_STANDIN_URL=http://{host}:{port} to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Requests: {json.dumps(server.counts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import json
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from django.test import SimpleTestCase
+from .endpoints import _summarize, percentile
+from .standin import StandinConfig, start_standin
+
+
+class StandinTests(SimpleTestCase):
+    def _start(self, **options):
+        server, url = start_standin(StandinConfig(**options))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server, url
+
+    def _get(self, url):
+        try:
+            with urlopen(url, timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def _generate(self, url, body):
+        request = Request(
+            f"{url}/v1beta/models/gemini-2.0-flash:generateContent",
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urlopen(request, timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_model_output_follows_the_response_schema_and_repeats(self):
+        _, url = self._start()
+        body = {
+            "contents": [{"parts": [{"text": "Write about optics"}]}],
+            "generationConfig": {"responseSchema": {
+                "type": "OBJECT",
+                "properties": {"summary": {"type": "STRING"}, "sections": {"type": "ARRAY", "items": {"type": "STRING"}}},
+            }},
+        }
+        first = self._generate(url, body)
+        self.assertEqual(first, self._generate(url, body))
+        value = json.loads(first[1]["candidates"][0]["content"]["parts"][0]["text"])
+        self.assertEqual(sorted(value), ["sections", "summary"])
+        self.assertEqual(len(value["sections"]), 3)
+
+    def test_injected_faults_are_counted(self):
+        server, url = self._start(error_rate=1.0)
+        status, body = self._generate(url, {"contents": []})
+        self.assertEqual((status, body["error"]["status"]), (503, "UNAVAILABLE"))
+        self.assertEqual(server.counts["gemini_errors"], 1)
+
+    def test_youtube_quota_runs_out(self):
+        server, url = self._start(youtube_quota=150)
+        status, body = self._get(f"{url}/youtube/v3/search?q=optics&maxResults=2&part=snippet")
+        self.assertEqual((status, len(body["items"])), (200, 2))
+        status, body = self._get(f"{url}/youtube/v3/search?q=optics&part=snippet")
+        self.assertEqual((status, body["error"]["errors"][0]["reason"]), (403, "quotaExceeded"))
+        # videos.list costs a single unit, so it still fits
+        status, body = self._get(f"{url}/youtube/v3/videos?id=abc&part=statistics")
+        self.assertEqual((status, body["items"][0]["id"]), (200, "abc"))
+
+
+class SummaryTests(SimpleTestCase):
+    def test_percentiles_interpolate_between_ranks(self):
+        values = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.assertEqual([percentile(values, p) for p in (0, 50, 100)], [1.0, 3.0, 5.0])
+        self.assertAlmostEqual(percentile(values, 95), 4.8)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summary_counts_statuses_errors_and_queries(self):
+        results = [(0.1, 200, 3), (0.3, 200, 5), (0.2, 504, None)]
+        summary = _summarize("profile", "wsgi", 2, results, 0.5, None)
+        self.assertEqual(summary["statuses"], {"200": 2, "504": 1})
+        self.assertEqual((summary["requests"], summary["errors"]), (3, 1))
+        self.assertAlmostEqual(summary["throughput_rps"], 6.0)
+        self.assertAlmostEqual(summary["latency_ms"]["p50"], 200.0)
+        self.assertEqual(summary["db_queries"], {"total": 8, "per_request_mean": 4, "per_request_max": 5})
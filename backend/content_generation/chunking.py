@@ -0,0 +1,131 @@
+import json
+import re
+from typing import Any, Dict, List
+
+if __name__ == "__main__":
+    import json_repair
+else:
+    from . import json_repair
+
+# Rough number of characters per token for English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in text without calling a tokenizer
+    """
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def section_text(section: Dict[str, Any]) -> str:
+    """
+    The text of a content section that questions are generated from
+    """
+    key_points = "\n".join(f"- {point}" for point in section.get("key_points", []))
+    return f"{section.get('title', '')}\n\n{section.get('content', '')}\n\nKey points:\n{key_points}"
+
+
+def _parse_content(content: Any) -> Any:
+    """
+    Return generated content as a dict if it is one (also when it was sent
+    as a JSON or Python repr string), otherwise as text
+    """
+    if isinstance(content, dict):
+        return content
+    text = str(content)
+    if text.lstrip().startswith("{"):
+        try:
+            parsed = json_repair.loads(text, allow_truncated=True)
+        except json.JSONDecodeError:
+            return text
+        if isinstance(parsed, dict):
+            return parsed
+    return text
+
+
+def _split_text(text: str, token_budget: int) -> List[str]:
+    """
+    Split text that is over the budget at paragraph, then sentence, boundaries
+    """
+    if estimate_tokens(text) <= token_budget:
+        return [text]
+
+    separator = "\n\n"
+    pieces = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+    if len(pieces) == 1:
+        separator = " "
+        pieces = [s for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
+        if len(pieces) == 1:
+            size = token_budget * CHARS_PER_TOKEN
+            return [text[i:i + size] for i in range(0, len(text), size)]
+
+    chunks = []
+    for piece in pieces:
+        chunks.extend(_split_text(piece, token_budget))
+    return _pack(chunks, token_budget, separator)
+
+
+def _pack(pieces: List[str], token_budget: int, separator: str) -> List[str]:
+    """
+    Join consecutive pieces into chunks of at most token_budget tokens
+    """
+    # Count characters rather than rounded per-piece token estimates
+    max_chars = token_budget * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    current_chars = 0
+    for piece in pieces:
+        chars = len(piece) + (len(separator) if current else 0)
+        if current and current_chars + chars > max_chars:
+            chunks.append(separator.join(current))
+            current, current_chars = [], 0
+            chars = len(piece)
+        current.append(piece)
+        current_chars += chars
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def chunk_content(content: Any, token_budget: int) -> List[str]:
+    """
+    Split content into chunks of at most token_budget tokens.
+
+    Generated content (a dict with sections) is split at section
+    boundaries, keeping consecutive sections together while they fit, and
+    each chunk starts with the topic. A section over the budget, and plain
+    text, are split at paragraph and then sentence boundaries.
+    """
+    content = _parse_content(content)
+    if not isinstance(content, dict) or not isinstance(content.get("sections"), list):
+        text = content if isinstance(content, str) else json.dumps(content)
+        return _split_text(text, token_budget)
+
+    header = f"Topic: {content.get('topic', '')}\n\n" if content.get("topic") else ""
+    budget = max(token_budget - estimate_tokens(header), 1)
+
+    pieces = []
+    summary = content.get("summary")
+    if summary:
+        pieces.extend(_split_text(f"Summary\n\n{summary}", budget))
+    for section in content["sections"]:
+        if isinstance(section, dict):
+            pieces.extend(_split_text(section_text(section), budget))
+    return [header + chunk for chunk in _pack(pieces, budget, "\n\n")] or [header]
+
+
+def allocate_questions(chunks: List[str], num_questions: int) -> List[int]:
+    """
+    Split num_questions between chunks in proportion to their size.
+
+    Uses the largest remainder method, so the counts add up exactly.
+    """
+    sizes = [estimate_tokens(chunk) for chunk in chunks]
+    total = sum(sizes)
+    shares = [num_questions * size / total for size in sizes]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(chunks)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in by_remainder[:num_questions - sum(counts)]:
+        counts[i] += 1
+    return counts
@@ -1,40 +1,81 @@
-import google.generativeai as genai
+import asyncio
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pydantic import ValidationError
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
+from google.generativeai import protos
 if __name__ == "__main__":
-    from schemas import ContentResponse, ContentSection
+    from schemas import ContentResponse, ContentSection, AnalyzedContentResponse, ContentOverview, gemini_response_schema, SCHEMA_PROPERTY_ORDERING
+    from streaming import ContentStreamParser
+    from llm_clients import llm_clients
+    import json_repair
 else:
-    from .schemas import ContentResponse, ContentSection
+    from .schemas import ContentResponse, ContentSection, AnalyzedContentResponse, ContentOverview, gemini_response_schema, SCHEMA_PROPERTY_ORDERING
+    from .streaming import ContentStreamParser
+    from .llm_clients import llm_clients
+    from . import json_repair
 
 load_dotenv()
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+def _response_text(response) -> str:
+    """
+    Return the text of a model response, raising json_repair.TruncatedJSON
+    if the model stopped because it reached max_output_tokens
+    """
+    for candidate in response.candidates:
+        if candidate.finish_reason == protos.Candidate.FinishReason.MAX_TOKENS:
+            raise json_repair.TruncatedJSON("Output stopped at max_output_tokens", response.text, len(response.text))
+    return response.text
 
 # Create a Gemini-based content generator (without using pydantic_ai.Agent)
 class ContentGenerator:
     """
     A generator that creates educational content on a given topic.
 
-    The generator uses a multi-step approach:
+    In "fast" mode (the default) the topic analysis and the content are
+    requested together in one schema-constrained call.
+
+    In "quality" mode the generator uses a multi-step approach:
     1. Analyze the topic to determine appropriate content structure
     2. Generate comprehensive content in the required format
     3. Validate and refine the content
+
+    In "sections" mode the topic is analyzed first and then every section, plus
+    the summary, is generated in its own concurrent call. A section that fails
+    to parse or validate is retried on its own, with a higher output token
+    limit if it was cut off.
     """
 
-    def __init__(self, topic: str, difficulty: str = "intermediate"):
+    MODES = ("fast", "quality", "sections")
+
+    # Maximum concurrent model calls per generation in "sections" mode
+    section_concurrency = int(os.getenv("CONTENT_SECTION_CONCURRENCY", 4))
+    # Extra attempts for a section that fails to parse or validate
+    section_retries = int(os.getenv("CONTENT_SECTION_RETRIES", 1))
+    # Output token limit of a section call; a section cut off at it is retried with twice the limit
+    section_max_tokens = int(os.getenv("CONTENT_SECTION_MAX_TOKENS", 1024))
+
+    def __init__(
+        self,
+        topic: str,
+        difficulty: str = "intermediate",
+        mode: str = "fast",
+        on_sections: Optional[Callable[[List[str]], None]] = None,
+    ):
+        if mode not in self.MODES:
+            raise ValueError(f"Mode must be one of {list(self.MODES)}")
         self.gemini_model = "gemini-2.0-flash"
         self.topic = topic
         self.difficulty = difficulty
+        self.mode = mode
+        # Called with the section titles as soon as the analysis has planned them
+        self.on_sections = on_sections
 
-    def analyze_topic(self) -> Dict[str, Any]:
-        """
-        Analyze the topic to determine appropriate section structure
-        """
-        prompt = f"""
+    def _analysis_prompt(self) -> str:
+        return f"""
         You are a structured data generator.
         
         Analyze the topic '{self.topic}' and determine:
@@ -52,63 +93,115 @@ class ContentGenerator:
         IMPORTANT: Return ONLY the JSON object with no explanation, no markdown formatting, and no backticks.
         """
 
-        model = genai.GenerativeModel(self.gemini_model)
-        try:
-            response = model.generate_content(prompt)
-            response_text = response.text.strip()
+    def _default_analysis(self) -> Dict[str, Any]:
+        return {
+            "recommended_difficulty": self.difficulty,
+            "sections": [
+                "Introduction",
+                "Core Concepts",
+                "Applications",
+                "Conclusion",
+            ],
+            "key_concepts": [f"Important aspects of {self.topic}"],
+        }
+
+    def _apply_analysis(self, analysis: Dict[str, Any]) -> None:
+        # Adjust difficulty based on analysis if needed, keeping the requested
+        # one if the model recommends a level that isn't valid
+        if "recommended_difficulty" in analysis:
+            self.difficulty = json_repair.normalize_difficulty(
+                analysis.get("recommended_difficulty"), self.difficulty
+            )
+        if self.on_sections is not None:
+            try:
+                self.on_sections(analysis.get("sections") or self._default_analysis()["sections"])
+            except Exception as e:
+                # The callback must not fail the generation
+                print(f"Error in on_sections callback: {str(e)}")
 
-            # Print raw response for debugging
-            # print(f"Raw analyze_topic response: {response_text[:100]}...")
+    def _content_prompt(self, analysis: Dict[str, Any]) -> str:
+        return f"""
+        You are a structured data generator.
+        
+        Generate comprehensive educational content about {self.topic} at a {self.difficulty} level.
+        
+        Structure your response as a valid JSON object with this exact format:
+        {{
+        "topic": "{self.topic}",
+        "summary": "A concise summary of the topic",
+        "sections": [
+            {{
+            "title": "Section title",
+            "content": "Detailed section content",
+            "key_points": ["Key point 1", "Key point 2", "Key point 3"]
+            }}
+        ],
+        "references": ["Reference 1", "Reference 2"],
+        "difficulty_level": "{self.difficulty}"
+        }}
+        
+        Make sure to include these key concepts: {analysis.get('key_concepts', [])}
+        
+        Make sure the content is:
+        1. Educational and accurate
+        2. Well-structured with logical sections
+        3. Includes at least 3 key points for each section
+        4. Appropriate for {self.difficulty} level learners
+        
+        IMPORTANT: Return ONLY the JSON object with no explanation, no markdown formatting, and no backticks.
+        """
 
-            # Check if response is wrapped in code block markers
-            if response_text.startswith("```json"):
-                response_text = response_text.split("```json", 1)[1]
-            if response_text.startswith("```"):
-                response_text = response_text.split("```", 1)[1]
-            if response_text.endswith("```"):
-                response_text = response_text.rsplit("```", 1)[0]
+    @staticmethod
+    def _content_config() -> Dict[str, Any]:
+        return {
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "max_output_tokens": 4096,
+        }
 
-            # Trim whitespace
-            response_text = response_text.strip()
+    def _single_call_prompt(self) -> str:
+        return f"""
+        You are a structured data generator.
 
-            # Try to parse JSON
-            return json.loads(response_text)
-        except Exception as e:
-            print(f"Error parsing analysis: {str(e)}")
-            # Return default structure
-            return {
-                "recommended_difficulty": self.difficulty,
-                "sections": [
-                    "Introduction",
-                    "Core Concepts",
-                    "Applications",
-                    "Conclusion",
-                ],
-                "key_concepts": [f"Important aspects of {self.topic}"],
-            }
+        First analyze the topic '{self.topic}' under "analysis":
+        1. The appropriate difficulty level (beginner/intermediate/advanced)
+        2. The logical sections that should be included
+        3. Key concepts that must be covered
 
-    def generate_content(self) -> ContentResponse:
-        """
-        Generate structured educational content based on topic analysis
-        """
-        try:
-            # First analyze the topic
-            analysis = self.analyze_topic()
+        Then, under "content", generate comprehensive educational content about
+        {self.topic} at a {self.difficulty} level, following the sections from your analysis.
+        Set "topic" to "{self.topic}" and "difficulty_level" to "{self.difficulty}".
 
-            # Adjust difficulty based on analysis if needed
-            if "recommended_difficulty" in analysis:
-                self.difficulty = analysis.get(
-                    "recommended_difficulty", self.difficulty
-                )
+        Make sure the content is:
+        1. Educational and accurate
+        2. Well-structured with logical sections
+        3. Covers every key concept from your analysis
+        4. Includes at least 3 key points for each section
+        5. Appropriate for {self.difficulty} level learners
+        """
 
-            # Build the content generation prompt
-            prompt = f"""
-            You are a structured data generator.
-            
-            Generate comprehensive educational content about {self.topic} at a {self.difficulty} level.
-            
-            Structure your response as a valid JSON object with this exact format:
-            {{
+    @staticmethod
+    def _single_call_config() -> Dict[str, Any]:
+        return {
+            **ContentGenerator._content_config(),
+            "response_mime_type": "application/json",
+            "response_schema": gemini_response_schema(AnalyzedContentResponse),
+        }
+
+    def _stream_prompt(self) -> str:
+        if SCHEMA_PROPERTY_ORDERING:
+            return self._single_call_prompt()
+        # Without schema property ordering the stream is generated from the
+        # prompt's layout instead, so the summary comes before the sections
+        return self._single_call_prompt() + f"""
+        Return a JSON object with exactly these keys, in this order:
+        {{
+        "analysis": {{
+            "recommended_difficulty": "{self.difficulty}",
+            "sections": ["Section 1", "Section 2"],
+            "key_concepts": ["Concept 1", "Concept 2"]
+        }},
+        "content": {{
             "topic": "{self.topic}",
             "summary": "A concise summary of the topic",
             "sections": [
@@ -120,75 +213,83 @@ class ContentGenerator:
             ],
             "references": ["Reference 1", "Reference 2"],
             "difficulty_level": "{self.difficulty}"
-            }}
-            
-            Make sure to include these key concepts: {analysis.get('key_concepts', [])}
-            
-            Make sure the content is:
-            1. Educational and accurate
-            2. Well-structured with logical sections
-            3. Includes at least 3 key points for each section
-            4. Appropriate for {self.difficulty} level learners
-            
-            IMPORTANT: Return ONLY the JSON object with no explanation, no markdown formatting, and no backticks.
-            """
+        }}
+        }}
 
-            # Generate the content
-            model = genai.GenerativeModel(self.gemini_model)
-            response = model.generate_content(
-                prompt,
-                generation_config={
-                    "temperature": 0.7,
-                    "top_p": 0.95,
-                    "max_output_tokens": 4096,
-                },
-            )
+        IMPORTANT: Write "summary" before "sections". Return ONLY the JSON object with no explanation, no markdown formatting, and no backticks.
+        """
 
-            # Get the response text and clean it
-            response_text = response.text.strip()
+    def _stream_config(self) -> Dict[str, Any]:
+        if SCHEMA_PROPERTY_ORDERING:
+            return self._single_call_config()
+        return {**self._content_config(), "response_mime_type": "application/json"}
 
-            # Print raw response for debugging
-            # print(
-            #     f"Raw generate_content response (first 100 chars): {response_text[:100]}..."
-            # )
+    def _section_prompt(self, title: str, analysis: Dict[str, Any]) -> str:
+        return f"""
+        You are a structured data generator.
 
-            # Check if response is wrapped in code block markers
-            if response_text.startswith("```json"):
-                response_text = response_text.split("```json", 1)[1]
-            if response_text.startswith("```"):
-                response_text = response_text.split("```", 1)[1]
-            if response_text.endswith("```"):
-                response_text = response_text.rsplit("```", 1)[0]
+        You are writing one section of educational content about {self.topic} at a
+        {self.difficulty} level. The content has these sections: {analysis.get('sections', [])}
 
-            # Trim whitespace
-            response_text = response_text.strip()
+        Write only the section titled '{title}'. Cover the key concepts from this list
+        that belong in this section: {analysis.get('key_concepts', [])}
 
-            try:
-                # Try to parse JSON
-                content_json = json.loads(response_text)
-
-                # Attempt to validate with Pydantic
-                validated_content = ContentResponse(**content_json)
-                return validated_content
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                print(f"Problematic text: {response_text[:200]}...")
-                raise
-            except ValidationError as e:
-                # If validation fails, try to fix the content
-                print(f"Validation error: {e}")
-                return self.fix_content(content_json, str(e))
-        except Exception as e:
-            print(f"Error in generate_content: {e}")
-            raise
-
-    def fix_content(
-        self, content_json: Dict[str, Any], error_message: str
-    ) -> ContentResponse:
+        Make sure the section is:
+        1. Educational and accurate
+        2. Focused on its own title without repeating the other sections
+        3. Includes at least 3 key points
+        4. Appropriate for {self.difficulty} level learners
         """
-        Fix content that failed validation
+
+    def _overview_prompt(self, analysis: Dict[str, Any]) -> str:
+        return f"""
+        You are a structured data generator.
+
+        Write a concise summary of educational content about {self.topic} at a
+        {self.difficulty} level, covering these sections: {analysis.get('sections', [])}
+        and these key concepts: {analysis.get('key_concepts', [])}
+
+        Also list a few references suitable for {self.difficulty} level learners.
         """
-        fix_prompt = f"""
+
+    @staticmethod
+    def _section_config(max_output_tokens: int) -> Dict[str, Any]:
+        return {
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "max_output_tokens": max_output_tokens,
+            "response_mime_type": "application/json",
+            "response_schema": gemini_response_schema(ContentSection),
+        }
+
+    @staticmethod
+    def _overview_config() -> Dict[str, Any]:
+        return {
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "max_output_tokens": 1024,
+            "response_mime_type": "application/json",
+            "response_schema": gemini_response_schema(ContentOverview),
+        }
+
+    def _load_section(self, response_text: str, title: str) -> ContentSection:
+        section_json = json_repair.repair_section(json_repair.loads(response_text))
+        # Keep the planned title so sections line up with the analysis
+        section_json["title"] = title
+        return ContentSection(**section_json)
+
+    def _assemble(self, overview: ContentOverview, sections: List[ContentSection]) -> ContentResponse:
+        return ContentResponse(
+            topic=self.topic,
+            summary=overview.summary,
+            sections=sections,
+            references=overview.references,
+            difficulty_level=self.difficulty,
+        )
+
+    @staticmethod
+    def _fix_prompt(content_json: Dict[str, Any], error_message: str) -> str:
+        return f"""
         The following content has validation errors:
         
         {json.dumps(content_json, indent=2)}
@@ -214,20 +315,409 @@ class ContentGenerator:
         Return only the fixed JSON.
         """
 
-        model = genai.GenerativeModel(self.gemini_model)
-        response = model.generate_content(fix_prompt)
-        fixed_content = json.loads(response.text)
+    def _load_content(self, response_text: str, single_call: bool) -> Dict[str, Any]:
+        """
+        Parse the content JSON out of a generation response
+        """
+        try:
+            # Parse the JSON, repairing fences, trailing commas and similar problems locally
+            content_json = json_repair.loads(response_text)
+        except json.JSONDecodeError as e:
+            print(f"JSON decode error: {e}")
+            print(f"Problematic text: {response_text[:200]}...")
+            raise
+
+        # Single-call responses nest the content next to the analysis
+        if single_call:
+            return content_json.get("content", {})
+        return content_json
+
+    # Synchronous API
+
+    def analyze_topic(self) -> Dict[str, Any]:
+        """
+        Analyze the topic to determine appropriate section structure
+        """
+        model = llm_clients.generative_model(self.gemini_model)
+        try:
+            response = model.generate_content(self._analysis_prompt())
+            # Print raw response for debugging
+            # print(f"Raw analyze_topic response: {response.text[:100]}...")
+
+            # Try to parse JSON; a cut-off analysis still plans the sections it got to
+            return json_repair.loads(response.text, allow_truncated=True)
+        except Exception as e:
+            print(f"Error parsing analysis: {str(e)}")
+            # Return default structure
+            return self._default_analysis()
+
+    def generate_content(self) -> ContentResponse:
+        """
+        Generate structured educational content using the configured mode
+        """
+        if self.mode == "quality":
+            return self.generate_content_with_analysis()
+        if self.mode == "sections":
+            return self.generate_content_by_section()
+        return self.generate_content_single_call()
+
+    def _validate(self, content_json: Dict[str, Any]) -> ContentResponse:
+        try:
+            # Attempt to validate with Pydantic, repairing mechanical problems locally first
+            return self._validate_locally(content_json)
+        except ValidationError as e:
+            # If validation still fails, ask the model to fix the content
+            print(f"Validation error: {e}")
+            return self.fix_content(content_json, str(e))
+
+    def _validate_locally(self, content_json: Dict[str, Any]) -> ContentResponse:
+        try:
+            return ContentResponse(**content_json)
+        except ValidationError:
+            return ContentResponse(**json_repair.repair_content(content_json, self.difficulty))
+
+    def generate_content_single_call(self) -> ContentResponse:
+        """
+        Analyze the topic and generate its content in one structured call
+        """
+        try:
+            model = llm_clients.generative_model(self.gemini_model)
+            response = model.generate_content(
+                self._single_call_prompt(),
+                generation_config=self._single_call_config(),
+            )
+            return self._validate(self._load_content(_response_text(response), single_call=True))
+        except Exception as e:
+            print(f"Error in generate_content: {e}")
+            raise
+
+    def generate_content_with_analysis(self) -> ContentResponse:
+        """
+        Generate structured educational content based on a separate topic analysis
+        """
+        try:
+            # First analyze the topic
+            analysis = self.analyze_topic()
+            self._apply_analysis(analysis)
+
+            # Generate the content
+            model = llm_clients.generative_model(self.gemini_model)
+            response = model.generate_content(
+                self._content_prompt(analysis),
+                generation_config=self._content_config(),
+            )
+            return self._validate(self._load_content(_response_text(response), single_call=False))
+        except Exception as e:
+            print(f"Error in generate_content: {e}")
+            raise
+
+    def stream_content(self) -> Iterator[Tuple[str, Any]]:
+        """
+        Generate content using the configured mode, yielding (event, data) pairs.
+
+        A "summary" event is yielded first and then a "section" event for
+        each section, as soon as they are complete: in "fast" and "quality"
+        mode while the content call streams, in "sections" mode as each
+        concurrent call finishes. The last pair is ("content",
+        ContentResponse) with the full validated document.
+        """
+        if self.mode == "sections":
+            yield from self._stream_by_section()
+            return
+
+        if self.mode == "quality":
+            analysis = self.analyze_topic()
+            self._apply_analysis(analysis)
+            # The content prompt lays out the summary before the sections
+            prompt, config, single_call = self._content_prompt(analysis), self._content_config(), False
+        else:
+            prompt, config, single_call = self._stream_prompt(), self._stream_config(), True
+
+        model = llm_clients.generative_model(self.gemini_model)
+        response = model.generate_content(prompt, generation_config=config, stream=True)
+
+        parser = ContentStreamParser()
+        chunks = []
+        for chunk in response:
+            chunks.append(chunk.text)
+            yield from parser.feed(chunk.text)
+
+        yield "content", self._validate(self._load_content("".join(chunks), single_call=single_call))
+
+    def _stream_by_section(self) -> Iterator[Tuple[str, Any]]:
+        analysis = self.analyze_topic()
+        self._apply_analysis(analysis)
+        titles = analysis.get("sections") or self._default_analysis()["sections"]
+
+        with ThreadPoolExecutor(max_workers=self.section_concurrency) as pool:
+            overview = pool.submit(self.generate_overview, analysis)
+            sections = [pool.submit(self.generate_section, title, analysis) for title in titles]
+            try:
+                yield "summary", overview.result().summary
+                indexes = {future: index for index, future in enumerate(sections)}
+                for future in as_completed(sections):
+                    yield "section", {"index": indexes[future], **future.result().model_dump()}
+            except BaseException:
+                # Don't start the calls of a stream that failed or was closed
+                for future in sections:
+                    future.cancel()
+                raise
+            yield "content", self._assemble(overview.result(), [section.result() for section in sections])
+
+    def generate_section(self, title: str, analysis: Dict[str, Any]) -> ContentSection:
+        """
+        Generate a single content section, retrying it alone if it is invalid
+        """
+        model = llm_clients.generative_model(self.gemini_model)
+        max_tokens = self.section_max_tokens
+        for attempt in range(self.section_retries + 1):
+            try:
+                response = model.generate_content(
+                    self._section_prompt(title, analysis),
+                    generation_config=self._section_config(max_tokens),
+                )
+                return self._load_section(_response_text(response), title)
+            except (json.JSONDecodeError, ValidationError) as e:
+                print(f"Invalid section '{title}' (attempt {attempt + 1}): {e}")
+                if attempt == self.section_retries:
+                    raise
+                if isinstance(e, json_repair.TruncatedJSON):
+                    max_tokens *= 2
+
+    def generate_overview(self, analysis: Dict[str, Any]) -> ContentOverview:
+        """
+        Generate the summary and references
+        """
+        model = llm_clients.generative_model(self.gemini_model)
+        response = model.generate_content(
+            self._overview_prompt(analysis),
+            generation_config=self._overview_config(),
+        )
+        return ContentOverview(**json_repair.loads(_response_text(response)))
+
+    def generate_content_by_section(self) -> ContentResponse:
+        """
+        Analyze the topic, then generate the overview and every section concurrently
+        """
+        try:
+            analysis = self.analyze_topic()
+            self._apply_analysis(analysis)
+            titles = analysis.get("sections") or self._default_analysis()["sections"]
+
+            with ThreadPoolExecutor(max_workers=self.section_concurrency) as pool:
+                overview = pool.submit(self.generate_overview, analysis)
+                sections = [pool.submit(self.generate_section, title, analysis) for title in titles]
+                return self._assemble(overview.result(), [section.result() for section in sections])
+        except Exception as e:
+            print(f"Error in generate_content: {e}")
+            raise
+
+    def fix_content(
+        self, content_json: Dict[str, Any], error_message: str
+    ) -> ContentResponse:
+        """
+        Fix content that failed validation
+        """
+        model = llm_clients.generative_model(self.gemini_model)
+        response = model.generate_content(self._fix_prompt(content_json, error_message))
+        fixed_content = json_repair.loads(_response_text(response))
+
+        return ContentResponse(**json_repair.repair_content(fixed_content, self.difficulty))
 
-        return ContentResponse(**fixed_content)
+    # Asynchronous API, mirroring the synchronous one with the async Gemini client
 
+    async def aanalyze_topic(self) -> Dict[str, Any]:
+        """
+        Analyze the topic to determine appropriate section structure
+        """
+        model = llm_clients.agenerative_model(self.gemini_model)
+        try:
+            response = await model.generate_content_async(self._analysis_prompt())
+            return json_repair.loads(response.text, allow_truncated=True)
+        except Exception as e:
+            print(f"Error parsing analysis: {str(e)}")
+            return self._default_analysis()
 
-def generate_content_for_topic(topic, difficulty="beginner"):
+    async def agenerate_content(self) -> ContentResponse:
+        """
+        Generate structured educational content using the configured mode
+        """
+        if self.mode == "quality":
+            return await self.agenerate_content_with_analysis()
+        if self.mode == "sections":
+            return await self.agenerate_content_by_section()
+        return await self.agenerate_content_single_call()
+
+    async def _avalidate(self, content_json: Dict[str, Any]) -> ContentResponse:
+        try:
+            return self._validate_locally(content_json)
+        except ValidationError as e:
+            print(f"Validation error: {e}")
+            return await self.afix_content(content_json, str(e))
+
+    async def agenerate_content_single_call(self) -> ContentResponse:
+        """
+        Analyze the topic and generate its content in one structured call
+        """
+        try:
+            model = llm_clients.agenerative_model(self.gemini_model)
+            response = await model.generate_content_async(
+                self._single_call_prompt(),
+                generation_config=self._single_call_config(),
+            )
+            return await self._avalidate(self._load_content(_response_text(response), single_call=True))
+        except Exception as e:
+            print(f"Error in generate_content: {e}")
+            raise
+
+    async def agenerate_content_with_analysis(self) -> ContentResponse:
+        """
+        Generate structured educational content based on a separate topic analysis
+        """
+        try:
+            analysis = await self.aanalyze_topic()
+            self._apply_analysis(analysis)
+
+            model = llm_clients.agenerative_model(self.gemini_model)
+            response = await model.generate_content_async(
+                self._content_prompt(analysis),
+                generation_config=self._content_config(),
+            )
+            return await self._avalidate(self._load_content(_response_text(response), single_call=False))
+        except Exception as e:
+            print(f"Error in generate_content: {e}")
+            raise
+
+    async def astream_content(self) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Async version of stream_content, yielding the same (event, data) pairs
+        """
+        if self.mode == "sections":
+            async for event in self._astream_by_section():
+                yield event
+            return
+
+        if self.mode == "quality":
+            analysis = await self.aanalyze_topic()
+            self._apply_analysis(analysis)
+            prompt, config, single_call = self._content_prompt(analysis), self._content_config(), False
+        else:
+            prompt, config, single_call = self._stream_prompt(), self._stream_config(), True
+
+        model = llm_clients.agenerative_model(self.gemini_model)
+        parser = ContentStreamParser()
+        chunks = []
+        async for chunk in model.stream_content_async(prompt, generation_config=config):
+            chunks.append(chunk.text)
+            for event in parser.feed(chunk.text):
+                yield event
+
+        yield "content", await self._avalidate(self._load_content("".join(chunks), single_call=single_call))
+
+    async def _astream_by_section(self) -> AsyncIterator[Tuple[str, Any]]:
+        analysis = await self.aanalyze_topic()
+        self._apply_analysis(analysis)
+        titles = analysis.get("sections") or self._default_analysis()["sections"]
+
+        semaphore = asyncio.Semaphore(self.section_concurrency)
+        overview = asyncio.ensure_future(self.agenerate_overview(analysis, semaphore))
+        sections = [asyncio.ensure_future(self.agenerate_section(title, analysis, semaphore)) for title in titles]
+        try:
+            yield "summary", (await overview).summary
+            indexes = {task: index for index, task in enumerate(sections)}
+            pending = set(sections)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=indexes.get):
+                    yield "section", {"index": indexes[task], **task.result().model_dump()}
+        except BaseException:
+            # Stop the calls of a stream that failed or was closed
+            for task in [overview, *sections]:
+                task.cancel()
+            raise
+        yield "content", self._assemble(overview.result(), [task.result() for task in sections])
+
+    async def agenerate_section(
+        self, title: str, analysis: Dict[str, Any], semaphore: asyncio.Semaphore
+    ) -> ContentSection:
+        """
+        Generate a single content section, retrying it alone if it is invalid
+        """
+        model = llm_clients.agenerative_model(self.gemini_model)
+        max_tokens = self.section_max_tokens
+        for attempt in range(self.section_retries + 1):
+            try:
+                async with semaphore:
+                    response = await model.generate_content_async(
+                        self._section_prompt(title, analysis),
+                        generation_config=self._section_config(max_tokens),
+                    )
+                return self._load_section(_response_text(response), title)
+            except (json.JSONDecodeError, ValidationError) as e:
+                print(f"Invalid section '{title}' (attempt {attempt + 1}): {e}")
+                if attempt == self.section_retries:
+                    raise
+                if isinstance(e, json_repair.TruncatedJSON):
+                    max_tokens *= 2
+
+    async def agenerate_overview(
+        self, analysis: Dict[str, Any], semaphore: asyncio.Semaphore
+    ) -> ContentOverview:
+        """
+        Generate the summary and references
+        """
+        model = llm_clients.agenerative_model(self.gemini_model)
+        async with semaphore:
+            response = await model.generate_content_async(
+                self._overview_prompt(analysis),
+                generation_config=self._overview_config(),
+            )
+        return ContentOverview(**json_repair.loads(_response_text(response)))
+
+    async def agenerate_content_by_section(self) -> ContentResponse:
+        """
+        Analyze the topic, then generate the overview and every section concurrently
+        """
+        try:
+            analysis = await self.aanalyze_topic()
+            self._apply_analysis(analysis)
+            titles = analysis.get("sections") or self._default_analysis()["sections"]
+
+            semaphore = asyncio.Semaphore(self.section_concurrency)
+            overview, *sections = await asyncio.gather(
+                self.agenerate_overview(analysis, semaphore),
+                *[self.agenerate_section(title, analysis, semaphore) for title in titles],
+            )
+            return self._assemble(overview, sections)
+        except Exception as e:
+            print(f"Error in generate_content: {e}")
+            raise
+
+    async def afix_content(
+        self, content_json: Dict[str, Any], error_message: str
+    ) -> ContentResponse:
+        """
+        Fix content that failed validation
+        """
+        model = llm_clients.agenerative_model(self.gemini_model)
+        response = await model.generate_content_async(self._fix_prompt(content_json, error_message))
+        fixed_content = json_repair.loads(_response_text(response))
+
+        return ContentResponse(**json_repair.repair_content(fixed_content, self.difficulty))
+
+
+def generate_content_for_topic(topic, difficulty="beginner", mode="fast", on_sections=None):
     """
     Generate structured educational content based on a topic
 
     Args:
         topic (str): The topic to generate content for
         difficulty (str): The difficulty level (beginner/intermediate/advanced)
+        mode (str): "fast" for a single model call, "quality" for separate
+            analysis and generation calls, "sections" for an analysis call
+            followed by concurrent calls per section
+        on_sections (callable): Called with the planned section titles once
+            the topic is analyzed ("quality" and "sections" modes only)
 
     Returns:
         dict: The validated content response
@@ -237,7 +727,7 @@ def generate_content_for_topic(topic, difficulty="beginner"):
     """
     try:
         # Create and run the generator
-        generator = ContentGenerator(topic=topic, difficulty=difficulty)
+        generator = ContentGenerator(topic=topic, difficulty=difficulty, mode=mode, on_sections=on_sections)
         content_response = generator.generate_content()
 
         # Return as dictionary
@@ -251,6 +741,23 @@ def generate_content_for_topic(topic, difficulty="beginner"):
         raise ValueError(f"Content generation failed: {str(e)}")
 
 
+async def agenerate_content_for_topic(topic, difficulty="beginner", mode="fast", on_sections=None):
+    """
+    Async version of generate_content_for_topic
+    """
+    try:
+        generator = ContentGenerator(topic=topic, difficulty=difficulty, mode=mode, on_sections=on_sections)
+        content_response = await generator.agenerate_content()
+        return content_response.model_dump()
+
+    except json.JSONDecodeError:
+        raise ValueError("Failed to parse model response as JSON")
+    except ValidationError as e:
+        raise ValueError(f"Content validation failed: {str(e)}")
+    except Exception as e:
+        raise ValueError(f"Content generation failed: {str(e)}")
+
+
 if __name__ == "__main__":
     topic = "National Defence Academy(NDA) Selection"  # Example topic
     difficulty = "intermediate"  # Changed from "easy" to an accepted value
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightTimeout(Exception):
+    """
+    Raised when a follower gives up waiting for the leader's result
+    """
+
+
+class _Call:
+    """
+    A single in-progress call that followers can wait on
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+        # (event loop, future) pairs of async followers
+        self.waiters = []
+
+    def resolve(self, future: asyncio.Future) -> None:
+        if future.done():
+            return
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            future.set_result(self.result)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share the same key.
+
+    The first caller for a key (the leader) runs the function. Every caller
+    that arrives while the leader is still running (a follower) waits for the
+    leader's result instead of running the function again. If the leader
+    raises, the same exception is raised in every follower.
+
+    Sync callers use do() and async callers use ado(); both share the same
+    registry, so a sync and an async request for the same key are coalesced
+    too, even when they run on different threads or event loops. A leader
+    that can't hand over a single function uses lead() and finish().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: float = None) -> Any:
+        """
+        Run fn once for all concurrent callers of key and return its result.
+
+        Args:
+            key: Identifies calls that should be coalesced
+            fn: The function to run if this caller becomes the leader
+            timeout: Seconds a follower waits before raising InFlightTimeout
+
+        Returns:
+            The value returned by fn
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                call.followers += 1
+                leader = False
+
+        if not leader:
+            logger.info(f"Waiting on in-flight call for {key}")
+            if not call.done.wait(timeout):
+                raise InFlightTimeout(f"Timed out waiting for in-flight call for {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e if isinstance(e, Exception) else InFlightTimeout(f"In-flight call for {key} was cancelled")
+            raise
+        finally:
+            self._finish(key, call)
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]], timeout: float = None) -> Any:
+        """
+        Async version of do(); fn is a coroutine function
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+            else:
+                call.followers += 1
+                future = asyncio.get_running_loop().create_future()
+                call.waiters.append((asyncio.get_running_loop(), future))
+                leader = False
+
+        if not leader:
+            logger.info(f"Waiting on in-flight call for {key}")
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise InFlightTimeout(f"Timed out waiting for in-flight call for {key}")
+
+        try:
+            call.result = await fn()
+            return call.result
+        except BaseException as e:
+            call.error = e if isinstance(e, Exception) else InFlightTimeout(f"In-flight call for {key} was cancelled")
+            raise
+        finally:
+            self._finish(key, call)
+
+    def lead(self, key: Hashable) -> Optional[_Call]:
+        """
+        Become the leader for key without handing over a function, for
+        callers that produce the result step by step, e.g. while streaming
+        it. Returns the call to pass to finish() once the result is known,
+        or None if a call for key is already in flight.
+        """
+        with self._lock:
+            if key in self._calls:
+                return None
+            call = _Call()
+            self._calls[key] = call
+            return call
+
+    def finish(self, key: Hashable, call: _Call, result: Any = None, error: Exception = None) -> None:
+        """
+        Finish a call started with lead(), returning result to every
+        follower, or raising error in them if it is set
+        """
+        call.result = result
+        call.error = error
+        self._finish(key, call)
+
+    def _finish(self, key: Hashable, call: _Call) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+            waiters = list(call.waiters)
+        if call.followers:
+            logger.info(f"Shared result for {key} with {call.followers} waiting request(s)")
+        call.done.set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(call.resolve, future)
+            except RuntimeError:
+                # The follower's event loop has already closed
+                pass
+
+    def in_flight(self) -> int:
+        """
+        Return the number of keys currently being computed
+        """
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,127 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .content_generation import generate_content_for_topic
+from .models import ContentJob, GeneratedContent
+from .services import store_generated_content, record_user_content
+from .topics import normalize_topic
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_content_job(topic, difficulty, mode, user):
+    """
+    Queue content generation for a topic and return (job, created).
+
+    If a job for the same topic and difficulty is already queued or running,
+    the user is added to it instead of creating a new one.
+    """
+    topic_key = normalize_topic(topic)
+    for _ in range(2):
+        job = ContentJob.objects.filter(
+            topic_key=topic_key,
+            difficulty_level=difficulty,
+            status__in=ContentJob.ACTIVE_STATUSES
+        ).first()
+        if job is not None:
+            job.requested_by.add(user)
+            return job, False
+
+        try:
+            with transaction.atomic():
+                job = ContentJob.objects.create(
+                    topic=topic,
+                    difficulty_level=difficulty,
+                    mode=mode
+                )
+        except IntegrityError:
+            # Another request queued the same content first, join its job
+            continue
+        job.requested_by.add(user)
+        logger.info(f"Queued content job {job.id} for topic: '{topic}' at {difficulty} level")
+        return job, True
+
+    raise IntegrityError(f"Could not queue a content job for topic: '{topic}'")
+
+
+def claim_next_job(worker):
+    """
+    Claim the oldest available job for a worker, or return None.
+
+    Queued jobs and running jobs whose lease has expired are available. Each
+    claim is a conditional update, so two workers can never claim the same job.
+    """
+    now = timezone.now()
+    available = ContentJob.objects.filter(
+        Q(status=ContentJob.QUEUED) |
+        Q(status=ContentJob.RUNNING, lease_expires_at__lt=now)
+    )
+    for job in available.only('id', 'status', 'lease_expires_at')[:10]:
+        claimed = ContentJob.objects.filter(
+            id=job.id,
+            status=job.status,
+            lease_expires_at=job.lease_expires_at
+        ).update(
+            status=ContentJob.RUNNING,
+            worker=worker,
+            lease_expires_at=now + timedelta(seconds=settings.CONTENT_JOB_LEASE_SECONDS),
+            attempts=F('attempts') + 1,
+            updated_at=now
+        )
+        if claimed:
+            if job.status == ContentJob.RUNNING:
+                logger.warning(f"Recovered content job {job.id} from an expired lease")
+            return ContentJob.objects.get(id=job.id)
+    return None
+
+
+def renew_lease(job_id, worker):
+    """
+    Extend the lease of a job the worker still holds
+    """
+    ContentJob.objects.filter(
+        id=job_id,
+        worker=worker,
+        status=ContentJob.RUNNING
+    ).update(
+        lease_expires_at=timezone.now() + timedelta(seconds=settings.CONTENT_JOB_LEASE_SECONDS)
+    )
+
+
+def _finish_job(job, held_by, **fields):
+    # Only the worker holding the lease may finish the job
+    return ContentJob.objects.filter(
+        id=job.id,
+        worker=held_by,
+        status=ContentJob.RUNNING
+    ).update(lease_expires_at=None, updated_at=timezone.now(), **fields)
+
+
+def run_job(job, worker):
+    """
+    Generate and store the content for a claimed job
+    """
+    try:
+        content = GeneratedContent.objects.filter(
+            topic_key=job.topic_key,
+            difficulty_level=job.difficulty_level
+        ).first()
+        if content is None:
+            logger.info(f"Running content job {job.id} for topic: '{job.topic}'")
+            generated = generate_content_for_topic(job.topic, job.difficulty_level, job.mode)
+            content = store_generated_content(job.topic, job.difficulty_level, generated)
+
+        for user in job.requested_by.all():
+            record_user_content(user, content)
+        _finish_job(job, worker, status=ContentJob.DONE, result=content, error='')
+        logger.info(f"Finished content job {job.id}")
+    except Exception as e:
+        if job.attempts >= settings.CONTENT_JOB_MAX_ATTEMPTS:
+            logger.error(f"Content job {job.id} failed: {str(e)}")
+            _finish_job(job, worker, status=ContentJob.FAILED, error=str(e))
+        else:
+            logger.warning(f"Content job {job.id} failed, will retry: {str(e)}")
+            _finish_job(job, worker, status=ContentJob.QUEUED, worker='', error=str(e))
@@ -0,0 +1,318 @@
+import json
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# How often each repair has fired since the process started
+_repair_counts = Counter()
+_repair_lock = threading.Lock()
+
+_DIFFICULTY_ALIASES = {
+    "beginner": "beginner",
+    "basic": "beginner",
+    "easy": "beginner",
+    "introductory": "beginner",
+    "intermediate": "intermediate",
+    "medium": "intermediate",
+    "moderate": "intermediate",
+    "advanced": "advanced",
+    "hard": "advanced",
+    "expert": "advanced",
+}
+
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+class TruncatedJSON(json.JSONDecodeError):
+    """
+    The model's output stopped before its JSON document ended
+    """
+
+
+def _count(repair: str) -> None:
+    with _repair_lock:
+        _repair_counts[repair] += 1
+
+
+def repair_stats() -> Dict[str, int]:
+    """
+    Return how many times each repair has been applied
+    """
+    with _repair_lock:
+        return dict(_repair_counts)
+
+
+def strip_code_fences(text: str) -> str:
+    """
+    Remove markdown code block markers around a JSON response
+    """
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text.split("```json", 1)[1]
+    if text.startswith("```"):
+        text = text.split("```", 1)[1]
+    if text.endswith("```"):
+        text = text.rsplit("```", 1)[0]
+    return text.strip()
+
+
+def _json_spans(text: str) -> List[str]:
+    """
+    Candidate JSON documents in text, dropping any explanation around them
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return [text]
+    start = min(starts)
+    end = max(text.rfind("}"), text.rfind("]"))
+    spans = []
+    # The document may have been truncated after its last closing bracket
+    if end < len(text) - 1:
+        spans.append(text[start:])
+    if end > start:
+        spans.append(text[start:end + 1])
+    return spans
+
+
+def _fix_quotes_and_literals(text: str) -> Tuple[str, bool, bool]:
+    """
+    Convert single-quoted strings to double-quoted ones and Python literals
+    (True/False/None) to JSON ones, leaving double-quoted strings untouched.
+    """
+    out = []
+    quotes_fixed = literals_fixed = False
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char == '"':
+            # Copy a double-quoted string as is
+            j = i + 1
+            while j < len(text) and text[j] != '"':
+                j += 2 if text[j] == "\\" else 1
+            out.append(text[i:j + 1])
+            i = j + 1
+        elif char == "'":
+            quotes_fixed = True
+            j = i + 1
+            chunk = []
+            while j < len(text) and text[j] != "'":
+                if text[j] == "\\" and j + 1 < len(text):
+                    chunk.append(text[j + 1] if text[j + 1] == "'" else text[j:j + 2])
+                    j += 2
+                    continue
+                chunk.append('\\"' if text[j] == '"' else text[j])
+                j += 1
+            out.append('"' + "".join(chunk) + '"')
+            i = j + 1
+        elif char.isalpha():
+            j = i
+            while j < len(text) and text[j].isalnum():
+                j += 1
+            word = text[i:j]
+            if word in _PYTHON_LITERALS:
+                literals_fixed = True
+                word = _PYTHON_LITERALS[word]
+            out.append(word)
+            i = j
+        else:
+            out.append(char)
+            i += 1
+    return "".join(out), quotes_fixed, literals_fixed
+
+
+def _remove_trailing_commas(text: str) -> Tuple[str, bool]:
+    out = []
+    fixed = False
+    in_string = escape = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            rest = text[i + 1:].lstrip()
+            if rest[:1] in ("}", "]"):
+                fixed = True
+                continue
+        out.append(char)
+    return "".join(out), fixed
+
+
+def _close_truncated(text: str) -> Tuple[str, bool]:
+    """
+    Close an unterminated string and any open arrays and objects
+    """
+    stack: List[str] = []
+    in_string = escape = False
+    # Whether the open string is an object key
+    string_is_key = False
+    expecting_key = []
+    for char in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            string_is_key = bool(stack) and stack[-1] == "{" and expecting_key[-1]
+        elif char in "{[":
+            stack.append(char)
+            expecting_key.append(char == "{")
+        elif char in "}]":
+            if stack:
+                stack.pop()
+                expecting_key.pop()
+        elif char == ":" and expecting_key:
+            expecting_key[-1] = False
+        elif char == "," and stack and stack[-1] == "{":
+            expecting_key[-1] = True
+
+    if not stack and not in_string:
+        return text, False
+
+    if in_string:
+        if escape:
+            text = text[:-1]
+        text += '"'
+        if string_is_key:
+            text += ": null"
+    text = text.rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    elif text.endswith(":"):
+        text += " null"
+    # Drop a dangling key with no value, e.g. {"a": 1, "b"
+    elif stack and stack[-1] == "{" and expecting_key[-1] and text.endswith('"'):
+        key_start = text.rfind('"', 0, len(text) - 1)
+        before = text[:key_start].rstrip()
+        if before.endswith(","):
+            text = before[:-1]
+        elif before.endswith("{"):
+            text = before
+
+    closers = {"{": "}", "[": "]"}
+    return text + "".join(closers[bracket] for bracket in reversed(stack)), True
+
+
+def loads(text: str, allow_truncated: bool = False) -> Any:
+    """
+    Parse a model's JSON response, repairing common mechanical problems.
+
+    Handles code fences, text around the JSON, single-quoted strings,
+    Python literals and trailing commas. A document truncated mid-way is
+    only closed and returned if allow_truncated is set, for callers that
+    can use partial data; otherwise TruncatedJSON is raised.
+    Raises json.JSONDecodeError if the text still cannot be parsed.
+    """
+    stripped = strip_code_fences(text)
+    if stripped != text.strip():
+        _count("code_fence")
+    try:
+        return json.loads(stripped)
+    except json.JSONDecodeError as e:
+        error = e
+
+    truncated = None
+    for span in _json_spans(stripped):
+        repairs = ["surrounding_text"] if span != stripped else []
+        try:
+            value = json.loads(_repair(span, repairs))
+        except json.JSONDecodeError:
+            continue
+        if "truncated" in repairs and not allow_truncated:
+            truncated = span
+            continue
+        for repair in repairs:
+            _count(repair)
+        return value
+    if truncated is not None:
+        _count("truncated_rejected")
+        raise TruncatedJSON("Output ends before the JSON document does", truncated, len(truncated))
+    raise error
+
+
+def _repair(text: str, repairs: List[str]) -> str:
+    text, quotes_fixed, literals_fixed = _fix_quotes_and_literals(text)
+    if quotes_fixed:
+        repairs.append("single_quotes")
+    if literals_fixed:
+        repairs.append("python_literals")
+
+    text, closed = _close_truncated(text)
+    if closed:
+        repairs.append("truncated")
+
+    text, commas_fixed = _remove_trailing_commas(text)
+    if commas_fixed:
+        repairs.append("trailing_comma")
+    return text
+
+
+def _sentences(text: str) -> List[str]:
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if len(s.strip()) > 10]
+
+
+def repair_section(section: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pad a section with fewer than two key points using sentences from its content
+    """
+    if not isinstance(section, dict):
+        return section
+    section = dict(section)
+    key_points = [p for p in section.get("key_points") or [] if isinstance(p, str) and p.strip()]
+    if len(key_points) < 2:
+        candidates = _sentences(str(section.get("content", ""))) + [str(section.get("title", ""))]
+        for candidate in candidates:
+            if len(key_points) >= 2:
+                break
+            if candidate and candidate not in key_points:
+                key_points.append(candidate)
+        if len(key_points) >= 2:
+            _count("key_points_padding")
+    section["key_points"] = key_points
+    return section
+
+
+def normalize_difficulty(level: Any, default: str) -> str:
+    """
+    Map a difficulty level the model wrote, e.g. "Medium", to one of
+    beginner, intermediate or advanced, or default if it isn't one
+    """
+    if level is None:
+        return default
+    return _DIFFICULTY_ALIASES.get(str(level).strip().lower(), default)
+
+
+def repair_content(content_json: Dict[str, Any], difficulty: str) -> Dict[str, Any]:
+    """
+    Fix content that fails ContentResponse validation in predictable ways.
+
+    Normalizes the difficulty level (falling back to the requested one),
+    fills in missing references and pads sections with too few key points.
+    """
+    if not isinstance(content_json, dict):
+        return content_json
+    content_json = dict(content_json)
+
+    level = content_json.get("difficulty_level")
+    normalized = normalize_difficulty(level, difficulty)
+    if normalized != level:
+        content_json["difficulty_level"] = normalized
+        _count("missing_difficulty" if level is None else "difficulty_case")
+
+    if content_json.get("references") is None:
+        content_json["references"] = []
+        _count("missing_references")
+
+    if isinstance(content_json.get("sections"), list):
+        content_json["sections"] = [repair_section(section) for section in content_json["sections"]]
+    return content_json
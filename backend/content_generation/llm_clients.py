@@ -0,0 +1,358 @@
+import asyncio
+import os
+import threading
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict
+
+import google.generativeai as genai
+import httpx
+from google.ai import generativelanguage as glm
+from google.generativeai import client as genai_client
+from pydantic_ai.models.gemini import GeminiModel
+from pydantic_ai.providers.google_gla import GoogleGLAProvider
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configure Gemini API
+genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+logger = logging.getLogger(__name__)
+
+# google-generativeai has no public way to give a GenerativeModel a client,
+# so shared clients are installed through its private attributes (_client,
+# _async_client and the client manager). That is only done on the releases
+# it was checked against; others use the SDK's own default clients.
+_CLIENT_INSTALL_VERSIONS = ((0, 7), (0, 8))
+
+
+def _installs_clients() -> bool:
+    """
+    Whether shared clients can be installed on GenerativeModels with the
+    installed google-generativeai release
+    """
+    try:
+        version = tuple(int(part) for part in genai.__version__.split(".")[:2])
+    except (AttributeError, ValueError):
+        return False
+    return version in _CLIENT_INSTALL_VERSIONS and hasattr(genai_client, "_client_manager")
+
+
+class _CountingClient:
+    """
+    A Gemini service client, created on first use, that counts the calls
+    made through it
+    """
+
+    _counted = ("generate_content", "stream_generate_content")
+
+    def __init__(self, factory: Callable[[], Any], registry: "LLMClientRegistry", backend: str):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+        self._registry = registry
+        self._backend = backend
+
+    def __getattr__(self, name: str) -> Any:
+        with self._lock:
+            if self._client is None:
+                self._client = self._factory()
+                self._registry._count(self._backend, "clients")
+        if name in self._counted:
+            self._registry._count(self._backend, "requests")
+        return getattr(self._client, name)
+
+
+class _ThreadedAsyncClient:
+    """
+    Async facade over a synchronous client, for backends (such as the REST
+    transport used with the API stand-in) that have no async client
+    """
+
+    def __init__(self, client: Any):
+        self._client = client
+
+    async def generate_content(self, *args, **kwargs):
+        return await asyncio.to_thread(self._client.generate_content, *args, **kwargs)
+
+    async def stream_generate_content(self, *args, **kwargs):
+        chunks = await asyncio.to_thread(lambda: list(self._client.stream_generate_content(*args, **kwargs)))
+
+        async def iterate():
+            for chunk in chunks:
+                yield chunk
+
+        return iterate()
+
+
+class _StandinGLAProvider(GoogleGLAProvider):
+    """
+    GoogleGLAProvider that sends requests to the API stand-in
+    """
+
+    def __init__(self, standin_url: str, **kwargs):
+        self._standin_url = standin_url
+        super().__init__(**kwargs)
+
+    @property
+    def base_url(self) -> str:
+        return f"{self._standin_url}/v1beta/models/"
+
+
+class _AsyncModel:
+    """
+    A shared GenerativeModel whose async calls run on the registry's event loop
+    """
+
+    def __init__(self, model: genai.GenerativeModel, registry: "LLMClientRegistry"):
+        self._model = model
+        self._registry = registry
+
+    async def generate_content_async(self, *args, **kwargs):
+        return await self._registry.arun(self._model.generate_content_async(*args, **kwargs))
+
+    async def stream_content_async(self, *args, **kwargs):
+        """
+        Stream a response, yielding its chunks as they arrive. The stream is
+        read on the registry's loop, where its connection lives.
+        """
+        response = await self.generate_content_async(*args, stream=True, **kwargs)
+        chunks = response.__aiter__()
+
+        async def next_chunk():
+            return await anext(chunks, None)
+
+        while (chunk := await self._registry.arun(next_chunk())) is not None:
+            yield chunk
+
+
+class LLMClientRegistry:
+    """
+    Process-wide Gemini clients with persistent connections.
+
+    Clients are created lazily on first use and shared by every request and
+    thread. The google-generativeai models use one gRPC channel per client,
+    which multiplexes concurrent calls over a single HTTP/2 connection. The
+    pydantic-ai models share one httpx connection pool whose size and
+    keep-alive are configurable.
+
+    Async clients hold connections bound to the event loop they were first
+    used on. So that they can be shared by requests running on different
+    loops (e.g. async views served by WSGI, where every request gets its own
+    loop), all async LLM calls are run on one background event loop owned by
+    the registry; arun() submits a coroutine to it and awaits the result.
+
+    stats() reports the requests made with each backend. For pydantic-ai it
+    also reports the TCP connections the httpx pool opened for them and the
+    share of requests that reused one. gRPC doesn't expose its connections,
+    so for google-generativeai only the clients created are reported.
+
+    Where _installs_clients() is false, the google-generativeai models use
+    the SDK's default clients instead of the registry's, which are shared
+    by the process as well but not counted.
+
+    When API_STANDIN_URL is set, every client talks to that local stand-in
+    (see benchmarks/standin.py) over HTTP instead of the Gemini API.
+    """
+
+    def __init__(self, pool_size: int = None, keepalive_seconds: float = None, timeout: float = None):
+        self.pool_size = pool_size or int(os.getenv("LLM_POOL_SIZE", 20))
+        self.keepalive_seconds = keepalive_seconds or float(os.getenv("LLM_KEEPALIVE_SECONDS", 60))
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT_SECONDS", 600))
+        self.standin_url = (os.getenv("API_STANDIN_URL") or "").rstrip("/") or None
+        self.installs_clients = _installs_clients()
+        if self.standin_url and not self.installs_clients:
+            # Point the SDK's default clients at the stand-in instead
+            genai.configure(
+                api_key=os.getenv("GEMINI_API_KEY") or "standin",
+                transport="rest",
+                client_options={"api_endpoint": self.standin_url},
+            )
+        self._lock = threading.Lock()
+        self._loop = None
+        self._sync_client = None
+        self._async_client = None
+        self._http_client = None
+        self._models: Dict[Any, Any] = {}
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, backend: str, name: str) -> None:
+        with self._stats_lock:
+            self._stats[backend, name] += 1
+
+    # Background event loop
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-clients", daemon=True)
+                thread.start()
+                self._loop = loop
+                logger.info("Started the LLM client event loop")
+            return self._loop
+
+    async def arun(self, coro: Awaitable[Any]) -> Any:
+        """
+        Run a coroutine that uses the shared async clients and return its result.
+
+        Cancelling the caller cancels the coroutine on the registry's loop.
+        """
+        loop = self._event_loop()
+        try:
+            if asyncio.get_running_loop() is loop:
+                return await coro
+        except RuntimeError:
+            pass
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    # google-generativeai
+
+    def _standin_generative_client(self) -> Any:
+        return glm.GenerativeServiceClient(
+            transport="rest",
+            client_options={"api_endpoint": self.standin_url, "api_key": os.getenv("GEMINI_API_KEY") or "standin"},
+        )
+
+    def _generative_client(self) -> _CountingClient:
+        with self._lock:
+            if self._sync_client is None:
+                factory = genai_client.get_default_generative_client
+                if self.standin_url:
+                    factory = self._standin_generative_client
+                self._sync_client = _CountingClient(factory, self, "gemini")
+            return self._sync_client
+
+    def _generative_async_client(self) -> _CountingClient:
+        with self._lock:
+            if self._async_client is None:
+                # Created on first use, which is always on the registry's loop
+                factory = lambda: genai_client._client_manager.make_client("generative_async")
+                if self.standin_url:
+                    factory = lambda: _ThreadedAsyncClient(self._standin_generative_client())
+                self._async_client = _CountingClient(factory, self, "gemini")
+            return self._async_client
+
+    def generative_model(self, model_name: str) -> genai.GenerativeModel:
+        """
+        Return the shared GenerativeModel for synchronous calls
+        """
+        with self._lock:
+            model = self._models.get(("sync", model_name))
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            if self.installs_clients:
+                model._client = self._generative_client()
+            with self._lock:
+                model = self._models.setdefault(("sync", model_name), model)
+        return model
+
+    def agenerative_model(self, model_name: str) -> _AsyncModel:
+        """
+        Return the shared GenerativeModel for asynchronous calls
+        """
+        with self._lock:
+            model = self._models.get(("async", model_name))
+        if model is None:
+            shared = genai.GenerativeModel(model_name)
+            if self.installs_clients:
+                shared._async_client = self._generative_async_client()
+            with self._lock:
+                model = self._models.setdefault(("async", model_name), _AsyncModel(shared, self))
+        return model
+
+    # pydantic-ai
+
+    async def _trace(self, event: str, info: Dict[str, Any]) -> None:
+        if event == "connection.connect_tcp.complete":
+            self._count("pydantic_ai", "connections")
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self._count("pydantic_ai", "requests")
+        request.extensions["trace"] = self._trace
+
+    def http_client(self) -> httpx.AsyncClient:
+        """
+        Return the shared httpx client; use it only through arun()
+        """
+        with self._lock:
+            if self._http_client is None or self._http_client.is_closed:
+                self._http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.pool_size,
+                        max_keepalive_connections=self.pool_size,
+                        keepalive_expiry=self.keepalive_seconds,
+                    ),
+                    timeout=httpx.Timeout(timeout=self.timeout, connect=5),
+                    event_hooks={"request": [self._on_request]},
+                )
+                logger.info(f"Created the shared LLM HTTP client with a pool of {self.pool_size} connections")
+            return self._http_client
+
+    def gemini_model(self, model_name: str) -> GeminiModel:
+        """
+        Return the shared pydantic-ai GeminiModel; run agents using it through arun()
+        """
+        with self._lock:
+            model = self._models.get(("pydantic_ai", model_name))
+        if model is None:
+            if self.standin_url:
+                provider = _StandinGLAProvider(
+                    self.standin_url,
+                    api_key=os.getenv("GEMINI_API_KEY") or "standin",
+                    http_client=self.http_client(),
+                )
+            else:
+                provider = GoogleGLAProvider(
+                    api_key=os.getenv("GEMINI_API_KEY"),
+                    http_client=self.http_client(),
+                )
+            model = GeminiModel(model_name, provider=provider)
+            with self._lock:
+                model = self._models.setdefault(("pydantic_ai", model_name), model)
+        return model
+
+    # Instrumentation
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the request counts of each backend, with the clients created
+        for google-generativeai and the connections opened and reused for
+        pydantic-ai
+        """
+        with self._stats_lock:
+            counts = dict(self._stats)
+        requests = counts.get(("pydantic_ai", "requests"), 0)
+        connections = counts.get(("pydantic_ai", "connections"), 0)
+        reused = max(requests - connections, 0)
+        return {
+            "gemini": {
+                "requests": counts.get(("gemini", "requests"), 0),
+                "clients": counts.get(("gemini", "clients"), 0),
+            },
+            "pydantic_ai": {
+                "requests": requests,
+                "connections": connections,
+                "reused": reused,
+                "reuse_ratio": reused / requests if requests else 0.0,
+            },
+        }
+
+    def close(self) -> None:
+        """
+        Close the shared clients; they are recreated on next use
+        """
+        with self._lock:
+            loop, http_client = self._loop, self._http_client
+            self._loop = self._sync_client = self._async_client = self._http_client = None
+            self._models.clear()
+        if loop is None:
+            return
+        if http_client is not None:
+            asyncio.run_coroutine_threadsafe(http_client.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+llm_clients = LLMClientRegistry()
@@ -0,0 +1,77 @@
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from content_generation.jobs import claim_next_job, renew_lease, run_job
+
+
+class Command(BaseCommand):
+    help = "Process queued content generation jobs with a local pool of workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.CONTENT_JOB_WORKERS,
+            help="Number of jobs processed at the same time"
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.CONTENT_JOB_POLL_INTERVAL,
+            help="Seconds to wait before checking for new jobs when the queue is empty"
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once the queue is empty instead of polling for new jobs"
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        poll_interval = options['poll_interval']
+        worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        stop = threading.Event()
+
+        self.stdout.write(f"Starting {concurrency} content worker(s) as {worker_prefix}")
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            workers = [
+                pool.submit(self.work, f"{worker_prefix}:{n}", poll_interval, options['once'], stop)
+                for n in range(concurrency)
+            ]
+            try:
+                for worker in workers:
+                    worker.result()
+            except KeyboardInterrupt:
+                self.stdout.write("Stopping workers after their current jobs")
+                stop.set()
+
+    def work(self, worker, poll_interval, once, stop):
+        while not stop.is_set():
+            close_old_connections()
+            job = claim_next_job(worker)
+            if job is None:
+                if once:
+                    return
+                stop.wait(poll_interval)
+                continue
+
+            # Keep the lease alive while the job runs so it is not reclaimed
+            finished = threading.Event()
+            heartbeat = threading.Thread(
+                target=self.heartbeat, args=(job.id, worker, finished), daemon=True
+            )
+            heartbeat.start()
+            try:
+                run_job(job, worker)
+                self.stdout.write(f"[{worker}] processed job {job.id}")
+            except Exception as e:
+                # The lease expires and the job is retried by another worker
+                self.stderr.write(f"[{worker}] error processing job {job.id}: {str(e)}")
+            finally:
+                finished.set()
+                heartbeat.join()
+
+    def heartbeat(self, job_id, worker, finished):
+        interval = settings.CONTENT_JOB_LEASE_SECONDS / 3
+        while not finished.wait(interval):
+            renew_lease(job_id, worker)
+        close_old_connections()
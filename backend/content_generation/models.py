@@ -1,16 +1,21 @@
 from django.db import models
+from .topics import normalize_topic
 
 class GeneratedContent(models.Model):
     """
     Model to store educational content generated for topics.
-    
+
     This stores the full JSON response from content generation,
     allowing for efficient retrieval of previously generated content.
+    There is exactly one row per topic and difficulty level, shared by
+    every user; which users requested it is tracked by UserContent.
+    Topics are matched on topic_key, the normalized form of the topic.
     """
     topic = models.CharField(max_length=255, db_index=True)
+    topic_key = models.CharField(max_length=255, db_index=True, editable=False)
     content = models.JSONField(help_text="The full generated content in JSON format")
     difficulty_level = models.CharField(
-        max_length=20, 
+        max_length=20,
         choices=[
             ('beginner', 'Beginner'),
             ('intermediate', 'Intermediate'),
@@ -18,17 +23,101 @@ class GeneratedContent(models.Model):
         ],
         default='intermediate'
     )
-    user = models.ForeignKey('user_profiles.CustomUser', on_delete=models.CASCADE, related_name='generated_contents')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
     class Meta:
         verbose_name = "Generated Content"
         verbose_name_plural = "Generated Contents"
-        # Create an index for topic + difficulty for faster lookups
-        unique_together = ['topic', 'difficulty_level']
+        # Create an index for topic key + difficulty for faster lookups
+        unique_together = ['topic_key', 'difficulty_level']
         # Order by most recently created first
         ordering = ['-created_at']
-    
+
+    def save(self, *args, **kwargs):
+        self.topic_key = normalize_topic(self.topic)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.topic} ({self.difficulty_level})"
+
+
+class UserContent(models.Model):
+    """
+    Links a user to a piece of shared GeneratedContent they have requested.
+
+    This is the user's content history; the content itself is stored once.
+    """
+    user = models.ForeignKey('user_profiles.CustomUser', on_delete=models.CASCADE, related_name='content_links')
+    content = models.ForeignKey(GeneratedContent, on_delete=models.CASCADE, related_name='user_links')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "User Content"
+        verbose_name_plural = "User Contents"
+        unique_together = ['user', 'content']
+        # Order by most recently requested first
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.user} -> {self.content}"
+
+
+class ContentJob(models.Model):
+    """
+    A queued content generation, processed by the run_content_workers command.
+
+    At most one job per topic key and difficulty can be queued or running at a
+    time; later requests for the same content join the active job.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    ACTIVE_STATUSES = [QUEUED, RUNNING]
+
+    topic = models.CharField(max_length=255)
+    topic_key = models.CharField(max_length=255, editable=False)
+    difficulty_level = models.CharField(max_length=20, default='intermediate')
+    mode = models.CharField(max_length=20, default='fast')
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            (QUEUED, 'Queued'),
+            (RUNNING, 'Running'),
+            (DONE, 'Done'),
+            (FAILED, 'Failed')
+        ],
+        default=QUEUED,
+        db_index=True
+    )
+    requested_by = models.ManyToManyField('user_profiles.CustomUser', related_name='content_jobs', blank=True)
+    result = models.ForeignKey(GeneratedContent, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    # Set while a worker holds the job; a running job whose lease has expired
+    # belongs to a crashed worker and is claimed again
+    worker = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Content Job"
+        verbose_name_plural = "Content Jobs"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['topic_key', 'difficulty_level'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_content_job'
+            )
+        ]
+        # Oldest jobs are processed first
+        ordering = ['created_at']
+
+    def save(self, *args, **kwargs):
+        self.topic_key = normalize_topic(self.topic)
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"{self.topic} ({self.difficulty_level})"
\ No newline at end of file
+        return f"{self.topic} ({self.difficulty_level}) [{self.status}]"
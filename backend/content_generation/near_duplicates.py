@@ -0,0 +1,188 @@
+import hashlib
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+if __name__ == "__main__":
+    from topics import normalize_topic
+else:
+    from .topics import normalize_topic
+
+# Modulus of the MinHash permutations, a Mersenne prime above 2**32
+_PRIME = (1 << 61) - 1
+
+
+# Words that don't tell one question from another
+_STOPWORDS = frozenset(
+    "a an the of to in on at by for with from into and or not no is are was were be been "
+    "being it its this that these those there what which who whom whose when where why how "
+    "do does did can could would should will shall may might must".split()
+)
+
+# Times each stem shingle is counted, so the stem outweighs the options
+STEM_WEIGHT = 3
+
+
+def question_shingles(question: Any) -> FrozenSet[str]:
+    """
+    Shingles of a multiple-choice question: the words of its stem (the
+    question text) and their pairs, plus the words of its options.
+
+    Stopwords are left out of the stem, and every stem shingle is counted
+    STEM_WEIGHT times, so two questions have to ask about the same thing to
+    match: "What is the SI unit of force?" and "...of energy?" differ
+    however alike their options are. Options still tell apart questions
+    with a generic stem such as "Which statement is correct?".
+
+    Options are treated as a bag of words, so the same options in a
+    different order still match. Words are normalized like topics (case,
+    punctuation and plurals are ignored).
+    """
+    words = [word for word in normalize_topic(question.question).split() if word not in _STOPWORDS]
+    stem = set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+    shingles = {f"{shingle}#{copy}" for shingle in stem for copy in range(STEM_WEIGHT)}
+    for option in (question.option_a, question.option_b, question.option_c, question.option_d):
+        shingles.update(f"option:{word}" for word in normalize_topic(option).split())
+    return frozenset(shingles)
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures whose agreement estimates Jaccard similarity
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, shingles: Iterable[str]) -> Tuple[int, ...]:
+        hashes = [
+            int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+            for shingle in shingles
+        ] or [0]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms)
+
+
+_default_hasher = MinHasher()
+
+
+class QuestionIndex:
+    """
+    In-memory MinHash/LSH index for finding near-duplicate questions.
+
+    Each question's signature is split into bands; questions that share a
+    band bucket are candidates, and candidates are confirmed by the exact
+    Jaccard similarity of their shingles. A lookup therefore only compares
+    the few questions that share a bucket instead of every indexed one.
+
+    Like TopicIndex, an index over stored questions picks up rows stored
+    elsewhere by syncing those with ids above sync_since(), which asks for a
+    full sync every resync_interval seconds since rows can be committed out
+    of id order.
+    """
+
+    # Seconds between full syncs
+    resync_interval = 300
+
+    def __init__(self, threshold: float = 0.6, bands: int = 16, hasher: MinHasher = None):
+        self.threshold = threshold
+        self.hasher = hasher or _default_hasher
+        self.bands = bands
+        self.rows = self.hasher.num_perm // bands
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[Hashable]] = defaultdict(set)
+        self._shingles: Dict[Hashable, FrozenSet[str]] = {}
+        # Highest id synced from the database; questions added locally don't move it
+        self.synced_id = 0
+        self._full_sync_at = None
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [
+            (band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def _find(self, shingles: FrozenSet[str], band_keys) -> Optional[Hashable]:
+        candidates = set()
+        for key in band_keys:
+            candidates.update(self._buckets.get(key, ()))
+        for candidate in candidates:
+            if jaccard(shingles, self._shingles[candidate]) >= self.threshold:
+                return candidate
+        return None
+
+    def find_duplicate(self, question: Any) -> Optional[Hashable]:
+        """
+        Return the id of an indexed near-duplicate of question, or None
+        """
+        shingles = question_shingles(question)
+        band_keys = self._band_keys(self.hasher.signature(shingles))
+        with self._lock:
+            return self._find(shingles, band_keys)
+
+    def add(self, question: Any, question_id: Hashable) -> None:
+        """
+        Index a question under question_id
+        """
+        shingles = question_shingles(question)
+        band_keys = self._band_keys(self.hasher.signature(shingles))
+        with self._lock:
+            self._add(question_id, shingles, band_keys)
+
+    def _add(self, question_id, shingles, band_keys) -> None:
+        if question_id in self._shingles:
+            return
+        self._shingles[question_id] = shingles
+        for key in band_keys:
+            self._buckets[key].add(question_id)
+
+    def add_if_new(self, question: Any, question_id: Hashable) -> bool:
+        """
+        Index question unless it is a near-duplicate of an indexed one.
+
+        Returns True if it was added.
+        """
+        shingles = question_shingles(question)
+        band_keys = self._band_keys(self.hasher.signature(shingles))
+        with self._lock:
+            if self._find(shingles, band_keys) is not None:
+                return False
+            self._add(question_id, shingles, band_keys)
+            return True
+
+    def sync_since(self) -> int:
+        """
+        Return the id above which stored questions should be synced, 0 when
+        a full sync is due
+        """
+        with self._lock:
+            if self._full_sync_at is None or time.monotonic() - self._full_sync_at >= self.resync_interval:
+                return 0
+            return self.synced_id
+
+    def sync(self, rows: Iterable[Any], since: int = 0) -> None:
+        """
+        Index stored questions (objects with an id) with ids above since,
+        the value sync_since() returned
+        """
+        highest = since
+        for row in rows:
+            self.add(row, row.id)
+            highest = max(highest, row.id)
+        with self._lock:
+            self.synced_id = max(self.synced_id, highest)
+            if not since:
+                self._full_sync_at = time.monotonic()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._shingles)
@@ -2,54 +2,147 @@ import os
 import asyncio
 import json
 import logging
-from pydantic_ai.providers.google_gla import GoogleGLAProvider
-from pydantic_ai.models.gemini import GeminiModel
-from pydantic_ai import Agent
-from typing import List
+from dataclasses import dataclass, field
+from pydantic_ai import Agent, RunContext
+from typing import List, Tuple
 from dotenv import load_dotenv
 
 if __name__ == "__main__":
     from schemas import ResponseQuestions
+    from llm_clients import llm_clients
+    from chunking import chunk_content, allocate_questions
+    from near_duplicates import QuestionIndex
 else:
     from .schemas import ResponseQuestions
+    from .llm_clients import llm_clients
+    from .chunking import chunk_content, allocate_questions
+    from .near_duplicates import QuestionIndex
 
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QuestionRequest:
+    num_questions: int
+    difficulty: str
+    # Questions already generated, which the model should not repeat
+    avoid: List[str] = field(default_factory=list)
+
+
+# One agent serves every request; the request details are passed as deps
+question_agent = Agent(
+    deps_type=QuestionRequest,
+    result_type=List[ResponseQuestions],
+)
+
+
+@question_agent.system_prompt
+def question_system_prompt(ctx: RunContext[QuestionRequest]) -> str:
+    # The information itself is the user message, so it is only sent once
+    prompt = (
+        f"You are a teacher tasked with creating {ctx.deps.num_questions} multiple-choice questions on the information provided by the user. "
+        "Each question should have four options (a, b, c, d) and a correct answer."
+        f"Make sure the difficulty of each question is {ctx.deps.difficulty}. "
+        f"Focus your questions on the core text provided, using the additional information only for context and enrichment."
+        "The questions should be clear, concise, and relevant to the text."
+    )
+    if ctx.deps.avoid:
+        avoid = "\n".join(f"- {question}" for question in ctx.deps.avoid)
+        prompt += f" Do not repeat or rephrase any of these questions:\n{avoid}"
+    return prompt
+
+
 class QuestionGeneratorAgent:
+    # Maximum estimated tokens of content sent in one model call
+    chunk_tokens = int(os.getenv("QUESTION_CHUNK_TOKENS", 3000))
+    # Maximum concurrent model calls per quiz for long content
+    chunk_concurrency = int(os.getenv("QUESTION_CHUNK_CONCURRENCY", 4))
+    # Shingle similarity (0-1) at which two questions count as duplicates
+    duplicate_threshold = float(os.getenv("QUESTION_DUPLICATE_THRESHOLD", 0.6))
+    # Extra requests for the questions dropped as duplicates
+    top_up_rounds = int(os.getenv("QUESTION_TOP_UP_ROUNDS", 1))
+
     def __init__(self):
-        self.model = GeminiModel(
-            "gemini-2.0-flash",
-            provider=GoogleGLAProvider(
-                api_key=os.getenv("GEMINI_API_KEY"),
-            ),
-        )
+        # Shared model backed by the process-wide connection pool
+        self.model = llm_clients.gemini_model("gemini-2.0-flash")
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
 
+    async def generate_chunk_questions(
+        self, text: str, num_questions: int, difficulty: str, avoid: List[str] = None
+    ) -> Tuple[List[ResponseQuestions], int]:
+        """
+        Generate questions from a single chunk of text.
+
+        Returns the questions and the number of prompt tokens used.
+        """
+        response = await llm_clients.arun(
+            question_agent.run(
+                text,
+                deps=QuestionRequest(num_questions, difficulty, avoid or []),
+                model=self.model,
+            )
+        )
+        return response.data, response.usage().request_tokens or 0
+
     async def generate_questions(
-        self, text: str, num_questions: int = 5, difficulty: str = "easy"
+        self,
+        text: str,
+        num_questions: int = 5,
+        difficulty: str = "easy",
+        exclude: QuestionIndex = None,
     ) -> List[ResponseQuestions]:
         """
         Generates multiple-choice questions based on the given text.
-        If use_rag is True, enhances the input with web content.
-        """
 
-        agent = Agent(
-            self.model,
-            result_type=List[ResponseQuestions],
-            system_prompt=(
-                f"You are a teacher tasked with creating {num_questions} multiple-choice questions on the following information: {text} "
-                "Each question should have four options (a, b, c, d) and a correct answer."
-                f"Make sure the difficulty of each question is {difficulty}. "
-                f"Focus your questions on the core text provided, using the additional information only for context and enrichment."
-                "The questions should be clear, concise, and relevant to the text."
-            ),
-        )
+        Content longer than chunk_tokens is split into chunks along its
+        sections. Each chunk gets a share of the questions in proportion to
+        its size and the chunks are processed in parallel.
 
-        response = await agent.run(text)
-        return response.data
+        Questions that are near-duplicates of each other, or of a question
+        in exclude, are dropped, and only the shortfall is requested again
+        (up to top_up_rounds times).
+        """
+        num_questions = int(num_questions)
+        chunks = chunk_content(text, self.chunk_tokens)
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+        index = QuestionIndex(self.duplicate_threshold)
+        questions = []
+        prompt_tokens = calls = dropped = 0
+
+        async def generate_chunk(chunk, count, avoid):
+            async with semaphore:
+                return await self.generate_chunk_questions(chunk, count, difficulty, avoid)
+
+        for _ in range(self.top_up_rounds + 1):
+            shortfall = num_questions - len(questions)
+            if shortfall <= 0:
+                break
+            avoid = [question.question for question in questions]
+            results = await asyncio.gather(*[
+                generate_chunk(chunk, count, avoid)
+                for chunk, count in zip(chunks, allocate_questions(chunks, shortfall))
+                if count > 0
+            ])
+            calls += len(results)
+            for chunk_questions, tokens in results:
+                prompt_tokens += tokens
+                for question in chunk_questions:
+                    duplicate = exclude is not None and exclude.find_duplicate(question) is not None
+                    if not duplicate and index.add_if_new(question, len(questions)):
+                        questions.append(question)
+                    else:
+                        dropped += 1
+
+        logger.info(
+            f"Generated {len(questions)} questions in {calls} call(s) over {len(chunks)} chunk(s) "
+            f"using {prompt_tokens} prompt tokens, dropping {dropped} near-duplicate(s)"
+        )
+        return questions[:num_questions]
 
 
 if __name__ == "__main__":
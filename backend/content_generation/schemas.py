@@ -36,4 +36,70 @@ class ContentResponse(BaseModel):
         valid_levels = ["beginner", "intermediate", "advanced"]
         if v.lower() not in valid_levels:
             raise ValueError(f"Difficulty level must be one of {valid_levels}")
-        return v.lower()
\ No newline at end of file
+        return v.lower()
+
+
+# Analysis produced alongside the content when generating in a single call
+class TopicAnalysis(BaseModel):
+    recommended_difficulty: str
+    sections: List[str]
+    key_concepts: List[str]
+
+
+class AnalyzedContentResponse(BaseModel):
+    analysis: TopicAnalysis
+    content: ContentResponse
+
+
+# Summary and references generated separately from the sections
+class ContentOverview(BaseModel):
+    summary: str
+    references: List[str] = Field(default_factory=list)
+
+
+# Keywords of the OpenAPI subset accepted by Gemini's response_schema
+_GEMINI_SCHEMA_KEYS = {"type", "format", "description", "nullable", "enum", "properties", "items", "required"}
+
+# Gemini writes an object's properties in alphabetical order unless the
+# schema sets property_ordering, which older SDK releases can't send
+try:
+    from google.ai.generativelanguage import Schema as _GeminiSchema
+    SCHEMA_PROPERTY_ORDERING = "property_ordering" in _GeminiSchema.meta.fields
+except ImportError:
+    SCHEMA_PROPERTY_ORDERING = False
+
+
+def gemini_response_schema(model: type[BaseModel]) -> dict:
+    """
+    Convert a Pydantic model to a schema usable as Gemini's response_schema.
+
+    Gemini accepts a small OpenAPI subset, so references are inlined,
+    Optional fields become nullable and unsupported keywords are dropped.
+    Where the SDK supports it, properties are ordered as the model declares
+    them, so e.g. a summary is generated before the sections it sums up.
+    """
+    schema = model.model_json_schema()
+    definitions = schema.get("$defs", {})
+
+    def convert(node: dict) -> dict:
+        if "$ref" in node:
+            return convert(definitions[node["$ref"].split("/")[-1]])
+        if "anyOf" in node:
+            variants = [v for v in node["anyOf"] if v.get("type") != "null"]
+            converted = convert(variants[0])
+            if len(variants) < len(node["anyOf"]):
+                converted["nullable"] = True
+            return converted
+
+        converted = {key: value for key, value in node.items() if key in _GEMINI_SCHEMA_KEYS}
+        if "properties" in converted:
+            converted["properties"] = {
+                name: convert(prop) for name, prop in converted["properties"].items()
+            }
+            if SCHEMA_PROPERTY_ORDERING:
+                converted["property_ordering"] = list(converted["properties"])
+        if "items" in converted:
+            converted["items"] = convert(converted["items"])
+        return converted
+
+    return convert(schema)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import GeneratedContent
+from .models import GeneratedContent, ContentJob
 
 class GeneratedContentSerializer(serializers.ModelSerializer):
     """
@@ -7,4 +7,16 @@ class GeneratedContentSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = GeneratedContent
-        fields = ['id', 'topic', 'content', 'difficulty_level', 'created_at', 'updated_at']
\ No newline at end of file
+        fields = ['id', 'topic', 'content', 'difficulty_level', 'created_at', 'updated_at']
+
+
+class ContentJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the ContentJob model, including the content once it is done.
+    """
+    job_id = serializers.IntegerField(source='id', read_only=True)
+    content = serializers.JSONField(source='result.content', read_only=True, default=None)
+
+    class Meta:
+        model = ContentJob
+        fields = ['job_id', 'topic', 'difficulty_level', 'status', 'attempts', 'error', 'content', 'created_at', 'updated_at']
@@ -0,0 +1,124 @@
+import logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import GeneratedContent, UserContent
+from .topics import TopicIndex, normalize_topic
+from quizzes.bank import schedule_question_bank
+
+logger = logging.getLogger(__name__)
+
+# Near-match index over the topics of stored content
+topic_index = TopicIndex()
+
+
+def find_stored_content(topic_key, difficulty):
+    """
+    Look up stored content for a normalized topic key.
+
+    Returns a (GeneratedContent, match) tuple where match is "exact" or
+    "fuzzy", or (None, None) if no stored topic is close enough.
+    """
+    content = GeneratedContent.objects.filter(
+        topic_key=topic_key,
+        difficulty_level=difficulty
+    ).first()
+    if content is not None:
+        return content, "exact"
+
+    # Pick up rows stored since the last lookup, including by other processes
+    since = topic_index.sync_since()
+    topic_index.sync(
+        GeneratedContent.objects.filter(id__gt=since)
+        .order_by('id')
+        .values_list('id', 'topic_key', 'difficulty_level'),
+        since,
+    )
+    # Unless fuzzy matching is on, only spelling variants of a topic are
+    # served; a neighbouring topic such as "World War 1" for "World War 2" never is
+    best = topic_index.best_match(
+        topic_key, difficulty, settings.CONTENT_TOPIC_MATCH_THRESHOLD,
+        variants_only=not settings.CONTENT_TOPIC_FUZZY_MATCH,
+    )
+    if best is not None:
+        content = GeneratedContent.objects.filter(id=best[0]).first()
+        if content is not None:
+            return content, "fuzzy"
+    return None, None
+
+
+def store_generated_content(topic, difficulty, generated):
+    """
+    Store newly generated content and add it to the topic index.
+
+    If another process stored the same topic first, its row is returned
+    instead of failing on the unique constraint.
+    """
+    try:
+        with transaction.atomic():
+            content = GeneratedContent.objects.create(
+                topic=topic,
+                content=generated,
+                difficulty_level=difficulty
+            )
+    except IntegrityError:
+        content = GeneratedContent.objects.get(
+            topic_key=normalize_topic(topic),
+            difficulty_level=difficulty
+        )
+        logger.info(f"Content for topic: '{topic}' was stored by another request")
+        return content
+
+    topic_index.add(content.id, content.topic_key, difficulty)
+    logger.info(f"Saved new content to database for topic: '{topic}'")
+    # Pre-generate quiz questions for the new content off the request path
+    schedule_question_bank(content.id)
+    return content
+
+
+def record_user_content(user, content):
+    """
+    Add content to the user's content history
+    """
+    UserContent.objects.get_or_create(user=user, content=content)
+
+
+# Async counterparts used by the async views
+
+async def afind_stored_content(topic_key, difficulty):
+    """
+    Async version of find_stored_content
+    """
+    content = await GeneratedContent.objects.filter(
+        topic_key=topic_key,
+        difficulty_level=difficulty
+    ).afirst()
+    if content is not None:
+        return content, "exact"
+
+    since = topic_index.sync_since()
+    topic_index.sync([
+        row async for row in GeneratedContent.objects.filter(id__gt=since)
+        .order_by('id')
+        .values_list('id', 'topic_key', 'difficulty_level')
+    ], since)
+    best = topic_index.best_match(
+        topic_key, difficulty, settings.CONTENT_TOPIC_MATCH_THRESHOLD,
+        variants_only=not settings.CONTENT_TOPIC_FUZZY_MATCH,
+    )
+    if best is not None:
+        content = await GeneratedContent.objects.filter(id=best[0]).afirst()
+        if content is not None:
+            return content, "fuzzy"
+    return None, None
+
+
+# Storing needs a transaction, which the async ORM does not support yet
+astore_generated_content = sync_to_async(store_generated_content)
+
+
+async def arecord_user_content(user, content):
+    """
+    Async version of record_user_content
+    """
+    await UserContent.objects.aget_or_create(user=user, content=content)
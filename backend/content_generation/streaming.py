@@ -0,0 +1,171 @@
+import json
+from typing import Callable, Iterator, List, Tuple, Union
+
+from pydantic import ValidationError
+
+if __name__ == "__main__":
+    from schemas import ContentSection
+else:
+    from .schemas import ContentSection
+
+Path = Tuple[Union[str, int], ...]
+
+
+class _Frame:
+    def __init__(self, kind: str, path: Path, start: int):
+        self.kind = kind
+        self.path = path
+        self.start = start
+        self.key = None
+        self.index = 0
+        self.expecting_key = kind == "object"
+
+
+class JSONStreamScanner:
+    """
+    Incremental scanner that reports JSON values as soon as they are complete.
+
+    Text is fed in arbitrary chunks. Whenever a value whose path is accepted
+    by `watch` is closed, `on_value(path, raw_text)` is called with the raw
+    JSON text of that value. Paths are tuples of object keys and array
+    indexes, e.g. ("content", "sections", 2).
+    """
+
+    def __init__(self, watch: Callable[[Path], bool], on_value: Callable[[Path, str], None]):
+        self.watch = watch
+        self.on_value = on_value
+        self.buffer = ""
+        self.pos = 0
+        self.stack: List[_Frame] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.string_is_key = False
+        self.scalar_start = None
+
+    def _value_path(self) -> Path:
+        frame = self.stack[-1]
+        if frame.kind == "object":
+            return frame.path + (frame.key,)
+        return frame.path + (frame.index,)
+
+    def _complete(self, path: Path, start: int, end: int) -> None:
+        if self.watch(path):
+            self.on_value(path, self.buffer[start:end])
+
+    def _end_scalar(self, end: int) -> None:
+        if self.scalar_start is not None and self.stack:
+            self._complete(self._value_path(), self.scalar_start, end)
+        self.scalar_start = None
+
+    def feed(self, text: str) -> None:
+        self.buffer += text
+        while self.pos < len(self.buffer):
+            i = self.pos
+            char = self.buffer[i]
+            self.pos += 1
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    frame = self.stack[-1] if self.stack else None
+                    if self.string_is_key:
+                        frame.key = json.loads(self.buffer[self.string_start:i + 1])
+                    elif frame is not None:
+                        self._complete(self._value_path(), self.string_start, i + 1)
+                continue
+
+            if self.scalar_start is not None:
+                if char in ",}] \t\r\n":
+                    self._end_scalar(i)
+                else:
+                    continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = i
+                frame = self.stack[-1] if self.stack else None
+                self.string_is_key = frame is not None and frame.kind == "object" and frame.expecting_key
+            elif char in "{[":
+                path = self._value_path() if self.stack else ()
+                self.stack.append(_Frame("object" if char == "{" else "array", path, i))
+            elif char in "}]":
+                if not self.stack:
+                    continue
+                frame = self.stack.pop()
+                self._complete(frame.path, frame.start, i + 1)
+            elif char == ":":
+                if self.stack:
+                    self.stack[-1].expecting_key = False
+            elif char == ",":
+                if self.stack:
+                    frame = self.stack[-1]
+                    if frame.kind == "object":
+                        frame.expecting_key = True
+                    else:
+                        frame.index += 1
+            elif not char.isspace() and self.stack:
+                self.scalar_start = i
+
+
+class ContentStreamParser:
+    """
+    Extracts the summary and each content section from a streamed content
+    document as soon as they are complete and individually valid.
+
+    Works for both a bare ContentResponse document and the single-call
+    document that nests it under "content".
+    """
+
+    def __init__(self):
+        self.events = []
+        self.scanner = JSONStreamScanner(self._watch, self._on_value)
+
+    @staticmethod
+    def _content_prefix(path: Path) -> bool:
+        return path == () or path == ("content",)
+
+    def _watch(self, path: Path) -> bool:
+        if len(path) >= 1 and path[-1] == "summary":
+            return self._content_prefix(path[:-1])
+        if len(path) >= 2 and path[-2] == "sections" and isinstance(path[-1], int):
+            return self._content_prefix(path[:-2])
+        return False
+
+    def _on_value(self, path: Path, raw: str) -> None:
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return
+
+        if path[-1] == "summary":
+            if isinstance(value, str):
+                self.events.append(("summary", value))
+            return
+
+        # Only stream sections that are valid on their own; the rest are
+        # repaired with the full document
+        try:
+            section = ContentSection(**value)
+        except (TypeError, ValidationError):
+            return
+        self.events.append(("section", {"index": path[-1], **section.model_dump()}))
+
+    def feed(self, text: str) -> Iterator[Tuple[str, dict]]:
+        """
+        Feed a chunk of streamed text and yield any (event, data) pairs it completes
+        """
+        self.scanner.feed(text)
+        events, self.events = self.events, []
+        yield from events
+
+
+def sse_event(event: str, data) -> str:
+    """
+    Format a server-sent event
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -1,3 +1,938 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from google.generativeai import protos
+from rest_framework.test import APIClient
+from quizzes.cache import question_memory_cache
+from quizzes.models import QuestionSet
+from user_profiles.models import CustomUser
+from . import jobs, json_repair, llm_clients, schemas, services, views
+from .chunking import allocate_questions, chunk_content, estimate_tokens
+from .content_generation import ContentGenerator, agenerate_content_for_topic
+from .inflight import InFlightTimeout, SingleFlight
+from .models import ContentJob, GeneratedContent, UserContent
+from .near_duplicates import QuestionIndex
+from .question_generation import QuestionGeneratorAgent
+from .schemas import ContentOverview, ContentResponse, ContentSection, ResponseQuestions
+from .topics import TopicIndex, normalize_topic
 
-# Create your tests here.
+
+# The tests never reach Gemini, so a placeholder key stands in for the one read from the environment
+_test_keys = mock.patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"})
+
+
+def setUpModule():
+    _test_keys.start()
+
+
+def tearDownModule():
+    _test_keys.stop()
+
+
+def _section(title):
+    return ContentSection(title=title, content=f"About {title}", key_points=["One", "Two"])
+
+
+def _content(topic, summary="Summary"):
+    return ContentResponse(topic=topic, summary=summary, sections=[_section("Intro"), _section("Core")])
+
+
+def _response(text, finish_reason=protos.Candidate.FinishReason.STOP):
+    return mock.Mock(text=text, candidates=[mock.Mock(finish_reason=finish_reason)])
+
+
+def _events(response):
+    """
+    Return the (event, data) pairs of a server-sent event response
+    """
+    chunks = response.streaming_content
+    if hasattr(chunks, '__aiter__'):
+        async def read():
+            return [chunk async for chunk in chunks]
+        # Run database calls on this thread, inside the test's transaction
+        chunks = async_to_sync(read)()
+    events = []
+    for block in b"".join(chunks).decode().split("\n\n"):
+        if block:
+            event, data = block.split("\n", 1)
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def _index(*topics, difficulty='intermediate'):
+    index = TopicIndex()
+    for content_id, topic in enumerate(topics, start=1):
+        index.add(content_id, normalize_topic(topic), difficulty)
+    return index
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def generate():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "content"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("optic", generate)))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(target=lambda: results.append(flight.do("optic", generate)))
+            for _ in range(3)
+        ]
+        for follower in followers:
+            follower.start()
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["content"] * 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_leader_error_is_raised_in_async_followers(self):
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.05)
+            raise RuntimeError("model unavailable")
+
+        async def run():
+            return await asyncio.gather(
+                flight.ado("optic", fail), flight.ado("optic", fail), return_exceptions=True
+            )
+
+        errors = asyncio.run(run())
+        self.assertEqual([str(error) for error in errors], ["model unavailable"] * 2)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_follower_times_out(self):
+        flight = SingleFlight()
+        call = flight.lead("optic")
+        with self.assertRaises(InFlightTimeout):
+            flight.do("optic", lambda: "content", timeout=0.01)
+        flight.finish("optic", call, "content")
+        self.assertEqual(flight.do("optic", lambda: "fresh"), "fresh")
+
+
+@override_settings(QUESTION_BANK_ENABLED=False, VIDEO_PREFETCH_ENABLED=False)
+class SharedContentTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(services, 'topic_index', TopicIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _client(self, username):
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user(username=username, password="pass"))
+        return client
+
+    def test_content_is_generated_once_and_shared_across_users(self):
+        generate = mock.AsyncMock(return_value=_content("Optics").model_dump())
+        with mock.patch.object(views, 'agenerate_content_for_topic', generate):
+            first = self._client("first").post('/api/generate-content/', {"topic": "Optics"}, format='json')
+            second_client = self._client("second")
+            second = second_client.post('/api/generate-content/', {"topic": "optics"}, format='json')
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual((first["X-Content-Match"], second["X-Content-Match"]), ("fresh", "exact"))
+        self.assertEqual(GeneratedContent.objects.count(), 1)
+        self.assertEqual(UserContent.objects.count(), 2)
+        self.assertEqual(len(second_client.get('/api/user-contents/').json()), 1)
+
+
+class TopicIndexTests(SimpleTestCase):
+    def test_case_spacing_punctuation_and_plurals_share_a_key(self):
+        keys = {normalize_topic(topic) for topic in (
+            "Quantum Physics", "quantum physics ", "Quantum  physics!", "quantum_physics",
+        )}
+        self.assertEqual(keys, {"quantum physic"})
+        self.assertEqual(normalize_topic("Binary Trees"), normalize_topic("binary tree"))
+        self.assertEqual(normalize_topic("Studies"), "study")
+
+    def test_symbols_that_name_other_topics_are_kept(self):
+        self.assertEqual(len({normalize_topic(topic) for topic in ("C", "C++", "C#")}), 3)
+        self.assertEqual(normalize_topic("Gas"), "gas")
+        self.assertEqual(normalize_topic("Analysis"), "analysis")
+
+    def test_spacing_variant_matches(self):
+        index = _index("Photosynthesis")
+        best = index.best_match(normalize_topic("photo synthesis"), 'intermediate', 0.9, variants_only=True)
+        self.assertEqual(best[0], 1)
+
+    def test_neighbouring_topics_never_match(self):
+        pairs = [
+            ("World War 2", "World War 1"),
+            ("Class 11/12 Physics", "Class 10 Physics"),
+            ("Inorganic Chemistry", "Organic Chemistry"),
+            ("Type 2 Diabetes", "Type 1 Diabetes"),
+        ]
+        for query, stored in pairs:
+            with self.subTest(query=query, stored=stored):
+                index = _index(stored)
+                for variants_only in (True, False):
+                    self.assertIsNone(
+                        index.best_match(normalize_topic(query), 'intermediate', 0.9, variants_only)
+                    )
+
+    def test_negating_prefix_word_never_matches(self):
+        index = _index("Linear Optics")
+        self.assertIsNone(index.best_match(normalize_topic("Non-linear Optics"), 'intermediate', 0.5))
+
+    def test_other_difficulty_does_not_match(self):
+        index = _index("Photosynthesis", difficulty='advanced')
+        self.assertIsNone(index.best_match(normalize_topic("photo synthesis"), 'intermediate', 0.9))
+
+    def test_local_add_does_not_move_synced_id(self):
+        index = TopicIndex()
+        index.sync([(1, "cell", 'intermediate')])
+        index.add(10, "gene", 'intermediate')
+        self.assertEqual(index.synced_id, 1)
+
+    def test_full_sync_is_due_after_resync_interval(self):
+        index = TopicIndex()
+        self.assertEqual(index.sync_since(), 0)
+        index.sync([(3, "cell", 'intermediate')], 0)
+        self.assertEqual(index.sync_since(), 3)
+        index.resync_interval = 0
+        self.assertEqual(index.sync_since(), 0)
+
+
+class FindStoredContentTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(services, 'topic_index', TopicIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _store(self, topic, difficulty='intermediate'):
+        return GeneratedContent.objects.create(topic=topic, content={}, difficulty_level=difficulty)
+
+    def test_exact_match(self):
+        content = self._store("Quantum Physics")
+        self.assertEqual(services.find_stored_content("quantum physic", 'intermediate'), (content, "exact"))
+
+    def test_topic_key_is_stored_with_the_content(self):
+        content = self._store("  Quantum  Physics! ")
+        self.assertEqual(GeneratedContent.objects.get(pk=content.pk).topic_key, "quantum physic")
+        self.assertEqual(services.find_stored_content("quantum physic", 'advanced'), (None, None))
+
+    def test_fuzzy_match_of_spacing_variant(self):
+        content = self._store("Photosynthesis")
+        self.assertEqual(
+            services.find_stored_content(normalize_topic("photo synthesis"), 'intermediate'),
+            (content, "fuzzy"),
+        )
+
+    def test_other_topic_is_not_served(self):
+        self._store("World War 1")
+        self.assertEqual(
+            services.find_stored_content(normalize_topic("World War 2"), 'intermediate'),
+            (None, None),
+        )
+
+    @override_settings(CONTENT_TOPIC_FUZZY_MATCH=True)
+    def test_fuzzy_matching_serves_misspellings_above_the_threshold(self):
+        content = self._store("Photosynthesis")
+        self._store("World War 1")
+        misspelled = normalize_topic("Photosinthesis")
+        self.assertEqual(services.find_stored_content(misspelled, 'intermediate'), (content, "fuzzy"))
+        self.assertEqual(services.find_stored_content(normalize_topic("World War 2"), 'intermediate'), (None, None))
+        with override_settings(CONTENT_TOPIC_MATCH_THRESHOLD=0.99):
+            self.assertEqual(services.find_stored_content(misspelled, 'intermediate'), (None, None))
+
+    def test_misspellings_are_not_served_without_fuzzy_matching(self):
+        self._store("Photosynthesis")
+        self.assertEqual(
+            services.find_stored_content(normalize_topic("Photosinthesis"), 'intermediate'),
+            (None, None),
+        )
+
+    def test_rows_stored_elsewhere_before_a_local_add_are_found(self):
+        self._store("Cell Biology")
+        services.find_stored_content("unrelated", 'intermediate')
+        # Stored by another process, so only found by syncing
+        other = self._store("Photosynthesis")
+        local = self._store("Gene Expression")
+        services.topic_index.add(local.id, local.topic_key, 'intermediate')
+        self.assertEqual(
+            services.find_stored_content(normalize_topic("photo synthesis"), 'intermediate'),
+            (other, "fuzzy"),
+        )
+
+
+class SingleCallTests(SimpleTestCase):
+    def test_fast_mode_analyzes_and_generates_in_one_structured_call(self):
+        text = json.dumps({
+            "analysis": {"recommended_difficulty": "beginner", "sections": ["Intro", "Core"]},
+            "content": _content("Optics").model_dump(),
+        })
+        model = mock.Mock()
+        model.generate_content.return_value = _response(text)
+        with mock.patch.object(llm_clients.llm_clients, 'generative_model', return_value=model):
+            content = ContentGenerator("Optics", difficulty="beginner").generate_content()
+
+        self.assertEqual(model.generate_content.call_count, 1)
+        config = model.generate_content.call_args.kwargs["generation_config"]
+        self.assertEqual(config["response_mime_type"], "application/json")
+        self.assertIn("response_schema", config)
+        self.assertEqual([section.title for section in content.sections], ["Intro", "Core"])
+
+
+class StreamOrderTests(SimpleTestCase):
+    def test_schema_orders_properties_as_declared_when_supported(self):
+        with mock.patch.object(schemas, 'SCHEMA_PROPERTY_ORDERING', True):
+            schema = schemas.gemini_response_schema(ContentResponse)
+        self.assertLess(schema["property_ordering"].index("summary"), schema["property_ordering"].index("sections"))
+
+    def test_schema_has_no_ordering_the_sdk_cannot_send(self):
+        with mock.patch.object(schemas, 'SCHEMA_PROPERTY_ORDERING', False):
+            self.assertNotIn("property_ordering", schemas.gemini_response_schema(ContentResponse))
+
+    def test_stream_prompt_lays_out_summary_before_sections_without_ordering(self):
+        generator = ContentGenerator("Optics")
+        with mock.patch('content_generation.content_generation.SCHEMA_PROPERTY_ORDERING', False):
+            config = generator._stream_config()
+            prompt = generator._stream_prompt()
+        # An unordered schema would put the sections first
+        self.assertNotIn("response_schema", config)
+        self.assertLess(prompt.index('"summary"'), prompt.rindex('"sections"'))
+
+    def test_sections_mode_streams_summary_first(self):
+        generator = ContentGenerator("Optics", mode="sections")
+        with mock.patch.object(generator, 'analyze_topic', return_value={"sections": ["Intro", "Core"]}), \
+                mock.patch.object(generator, 'generate_overview', return_value=ContentOverview(summary="Sum")), \
+                mock.patch.object(generator, 'generate_section', side_effect=lambda title, analysis: _section(title)):
+            events = list(generator.stream_content())
+        self.assertEqual(events[0], ("summary", "Sum"))
+        self.assertEqual(sorted(data["index"] for event, data in events if event == "section"), [0, 1])
+        self.assertEqual(events[-1][0], "content")
+        self.assertEqual([section.title for section in events[-1][1].sections], ["Intro", "Core"])
+
+    def test_async_stream_sends_sections_as_the_model_streams_them(self):
+        text = json.dumps({"analysis": {"sections": ["Intro", "Core"]}, "content": _content("Optics", "Sum").model_dump()})
+        pieces = [text[:len(text) // 2], text[len(text) // 2:]]
+
+        async def stream_content_async(prompt, generation_config):
+            for piece in pieces:
+                yield mock.Mock(text=piece)
+
+        async def stream():
+            return [event async for event in ContentGenerator("Optics", difficulty="beginner").astream_content()]
+
+        model = mock.Mock(stream_content_async=stream_content_async)
+        with mock.patch.object(llm_clients.llm_clients, 'agenerative_model', return_value=model):
+            events = asyncio.run(stream())
+        self.assertEqual([event for event, _ in events], ["summary", "section", "section", "content"])
+        self.assertEqual(events[0], ("summary", "Sum"))
+
+
+@override_settings(QUESTION_BANK_ENABLED=False, VIDEO_PREFETCH_ENABLED=False)
+class GenerateContentStreamTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="learner", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _stream(self, topic, mode="fast"):
+        return self.client.post(
+            '/api/generate-content/stream/', {"topic": topic, "mode": mode}, format='json'
+        )
+
+    def test_stream_uses_requested_mode_and_leads_the_generation(self):
+        modes = []
+        in_flight = []
+
+        async def astream_content(generator):
+            modes.append(generator.mode)
+            in_flight.append(views.content_inflight.in_flight())
+            yield "summary", "Summary"
+            yield "content", _content(generator.topic)
+
+        with mock.patch.object(ContentGenerator, 'astream_content', astream_content):
+            events = _events(self._stream("Optics", mode="quality"))
+
+        self.assertEqual(modes, ["quality"])
+        # Concurrent generate_content requests wait on the stream
+        self.assertEqual(in_flight, [1])
+        self.assertEqual(views.content_inflight.in_flight(), 0)
+        self.assertEqual([event for event, _ in events], ["summary", "done"])
+        self.assertTrue(GeneratedContent.objects.filter(topic_key="optic").exists())
+
+    def test_first_event_is_sent_before_generation_finishes(self):
+        read_first = {}
+
+        async def astream_content(generator):
+            yield "summary", "Summary"
+            # A buffered stream would only be read once this generator ends
+            await asyncio.wait_for(read_first["event"].wait(), 5)
+            yield "content", _content(generator.topic)
+
+        with mock.patch.object(ContentGenerator, 'astream_content', astream_content):
+            response = self._stream("Optics")
+
+            async def read():
+                read_first["event"] = asyncio.Event()
+                chunks = response.streaming_content
+                first = await anext(chunks)
+                read_first["event"].set()
+                return [first] + [chunk async for chunk in chunks]
+            chunks = async_to_sync(read)()
+
+        self.assertTrue(response.is_async)
+        self.assertTrue(chunks[0].startswith(b"event: summary"))
+        self.assertTrue(chunks[-1].startswith(b"event: done"))
+
+    def test_stream_waits_on_content_in_flight_and_replays_it(self):
+        key = ("optic", "intermediate")
+        call = views.content_inflight.lead(key)
+        content = GeneratedContent.objects.create(
+            topic="Optics", content=_content("Optics").model_dump(), difficulty_level="intermediate"
+        )
+        threading.Timer(0.1, views.content_inflight.finish, (key, call, content)).start()
+
+        with mock.patch.object(ContentGenerator, 'astream_content') as astream_content, \
+                mock.patch.object(views, 'afind_stored_content', mock.AsyncMock(return_value=(None, None))):
+            events = _events(self._stream("Optics"))
+
+        astream_content.assert_not_called()
+        self.assertEqual([event for event, _ in events], ["summary", "section", "section", "done"])
+        self.assertEqual(events[-1][1]["summary"], "Summary")
+
+    def test_stored_content_is_replayed_without_generating(self):
+        GeneratedContent.objects.create(
+            topic="Optics", content=_content("Optics").model_dump(), difficulty_level="intermediate"
+        )
+        with mock.patch.object(ContentGenerator, 'astream_content') as astream_content:
+            response = self._stream("optics")
+            events = _events(response)
+
+        astream_content.assert_not_called()
+        self.assertEqual(
+            (response["Content-Type"], response["Cache-Control"], response["X-Content-Match"]),
+            ("text/event-stream", "no-cache", "exact"),
+        )
+        self.assertEqual(events[0], ("summary", "Summary"))
+        self.assertEqual([data["index"] for event, data in events if event == "section"], [0, 1])
+        self.assertEqual(UserContent.objects.filter(user=self.user).count(), 1)
+
+    def test_failed_generation_ends_the_stream_with_an_error(self):
+        async def astream_content(generator):
+            yield "summary", "Summary"
+            raise ValueError("model unavailable")
+
+        with mock.patch.object(ContentGenerator, 'astream_content', astream_content), \
+                self.assertLogs('content_generation.views', 'ERROR'):
+            response = self._stream("Optics")
+            events = _events(response)
+
+        self.assertEqual(response["X-Content-Match"], "fresh")
+        self.assertEqual([event for event, _ in events], ["summary", "error"])
+        self.assertIn("model unavailable", events[-1][1]["error"])
+        self.assertEqual(views.content_inflight.in_flight(), 0)
+        self.assertFalse(GeneratedContent.objects.exists())
+
+
+class AsyncGenerationTests(SimpleTestCase):
+    def test_async_generation_only_uses_the_async_client(self):
+        model = mock.Mock()
+        model.generate_content_async = mock.AsyncMock(return_value=_response(json.dumps({
+            "analysis": {"sections": ["Intro", "Core"]}, "content": _content("Optics").model_dump(),
+        })))
+        registry = llm_clients.llm_clients
+        with mock.patch.object(registry, 'agenerative_model', return_value=model), \
+                mock.patch.object(registry, 'generative_model') as generative_model:
+            content = asyncio.run(agenerate_content_for_topic("Optics", "beginner"))
+
+        generative_model.assert_not_called()
+        self.assertEqual(model.generate_content_async.await_count, 1)
+        self.assertEqual(content["topic"], "Optics")
+
+    def test_unparseable_response_is_a_value_error(self):
+        model = mock.Mock()
+        model.generate_content_async = mock.AsyncMock(return_value=_response("not json at all"))
+        with mock.patch.object(llm_clients.llm_clients, 'agenerative_model', return_value=model):
+            with self.assertRaises(ValueError):
+                asyncio.run(agenerate_content_for_topic("Optics", "beginner"))
+
+
+@override_settings(QUESTION_BANK_ENABLED=False, CONTENT_JOB_MAX_ATTEMPTS=2)
+class ContentJobTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(services, 'topic_index', TopicIndex())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users = [CustomUser.objects.create_user(username=name, password="pass") for name in ("ada", "bo")]
+
+    def test_requests_for_queued_content_join_its_job(self):
+        first, created = jobs.enqueue_content_job("Optics", "intermediate", "fast", self.users[0])
+        second, joined = jobs.enqueue_content_job("optics", "intermediate", "fast", self.users[1])
+        self.assertEqual((created, joined), (True, False))
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(first.requested_by.count(), 2)
+
+    def test_job_is_claimed_once_and_recovered_after_its_lease_expires(self):
+        job, _ = jobs.enqueue_content_job("Optics", "intermediate", "fast", self.users[0])
+        self.assertEqual(jobs.claim_next_job("one").id, job.id)
+        self.assertIsNone(jobs.claim_next_job("two"))
+
+        ContentJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        recovered = jobs.claim_next_job("two")
+        self.assertEqual((recovered.id, recovered.worker, recovered.attempts), (job.id, "two", 2))
+
+    def test_finished_job_links_the_content_to_every_requester(self):
+        job, _ = jobs.enqueue_content_job("Optics", "intermediate", "fast", self.users[0])
+        jobs.enqueue_content_job("Optics", "intermediate", "fast", self.users[1])
+        claimed = jobs.claim_next_job("one")
+        with mock.patch.object(jobs, 'generate_content_for_topic', return_value=_content("Optics").model_dump()):
+            jobs.run_job(claimed, "one")
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ContentJob.DONE)
+        self.assertEqual(UserContent.objects.filter(content=job.result).count(), 2)
+
+    def test_failed_job_is_retried_then_marked_failed(self):
+        jobs.enqueue_content_job("Optics", "intermediate", "fast", self.users[0])
+        with mock.patch.object(jobs, 'generate_content_for_topic', side_effect=ValueError("model down")):
+            for expected in (ContentJob.QUEUED, ContentJob.FAILED):
+                claimed = jobs.claim_next_job("one")
+                jobs.run_job(claimed, "one")
+                claimed.refresh_from_db()
+                self.assertEqual(claimed.status, expected)
+        self.assertEqual(claimed.error, "model down")
+
+
+class SectionModeTests(SimpleTestCase):
+    def test_sections_are_generated_concurrently_and_assembled_in_planned_order(self):
+        generator = ContentGenerator("Optics", mode="sections")
+        analysis = {"sections": ["Intro", "Lenses", "Mirrors"]}
+        delays = {"Intro": 0.2, "Lenses": 0.1, "Mirrors": 0.0}
+        running = []
+
+        def generate_section(title, analysis):
+            running.append(title)
+            time.sleep(delays[title])
+            return _section(title)
+
+        started = time.monotonic()
+        with mock.patch.object(generator, 'analyze_topic', return_value=analysis), \
+                mock.patch.object(generator, 'generate_overview', return_value=ContentOverview(summary="Sum")), \
+                mock.patch.object(generator, 'generate_section', side_effect=generate_section):
+            content = generator.generate_content()
+
+        self.assertLess(time.monotonic() - started, 0.3)
+        self.assertEqual([section.title for section in content.sections], ["Intro", "Lenses", "Mirrors"])
+        self.assertEqual(content.summary, "Sum")
+
+    def test_invalid_section_is_retried_alone(self):
+        generator = ContentGenerator("Optics", mode="sections")
+        valid = json.dumps(_section("Lenses").model_dump())
+        model = mock.Mock()
+        model.generate_content.side_effect = [_response("{}"), _response(valid)]
+        with mock.patch.object(llm_clients.llm_clients, 'generative_model', return_value=model):
+            section = generator.generate_section("Lenses", {})
+        self.assertEqual(section.title, "Lenses")
+        self.assertEqual(model.generate_content.call_count, 2)
+
+    def test_truncated_section_is_retried_with_a_higher_token_limit(self):
+        generator = ContentGenerator("Optics", mode="sections")
+        valid = json.dumps(_section("Lenses").model_dump())
+        model = mock.Mock()
+        model.generate_content.side_effect = [
+            _response(valid[:40], protos.Candidate.FinishReason.MAX_TOKENS),
+            _response(valid),
+        ]
+        with mock.patch.object(llm_clients.llm_clients, 'generative_model', return_value=model):
+            section = generator.generate_section("Lenses", {})
+
+        self.assertEqual(section.key_points, ["One", "Two"])
+        limits = [call.kwargs["generation_config"]["max_output_tokens"] for call in model.generate_content.call_args_list]
+        self.assertEqual(limits, [generator.section_max_tokens, generator.section_max_tokens * 2])
+
+
+class JSONRepairTests(SimpleTestCase):
+    def test_mechanical_problems_are_repaired_locally(self):
+        cases = (
+            ('```json\n{"topic": "Optics"}\n```', {"topic": "Optics"}),
+            ('Here it is: {"topic": "Optics"} Hope it helps', {"topic": "Optics"}),
+            ("{'topic': 'Optics', 'done': True, 'next': None}", {"topic": "Optics", "done": True, "next": None}),
+            ('{"sections": ["Intro", "Core",],}', {"sections": ["Intro", "Core"]}),
+        )
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(json_repair.loads(text), expected)
+
+    def test_truncated_output_is_only_closed_when_allowed(self):
+        text = '{"sections": [{"title": "Intro", "content": "Light is'
+        with self.assertRaises(json_repair.TruncatedJSON):
+            json_repair.loads(text)
+        self.assertEqual(
+            json_repair.loads(text, allow_truncated=True),
+            {"sections": [{"title": "Intro", "content": "Light is"}]},
+        )
+
+    def test_content_cut_off_at_the_token_limit_is_rejected(self):
+        text = json.dumps({"analysis": {"sections": ["Intro"]}, "content": _content("Optics").model_dump()})
+        model = mock.Mock()
+        model.generate_content.return_value = _response(text, protos.Candidate.FinishReason.MAX_TOKENS)
+        with mock.patch.object(llm_clients.llm_clients, 'generative_model', return_value=model):
+            with self.assertRaises(json_repair.TruncatedJSON):
+                ContentGenerator("Optics").generate_content()
+
+    def test_unrepairable_text_raises(self):
+        with self.assertRaises(json.JSONDecodeError):
+            json_repair.loads("no json here")
+
+    def test_invalid_content_is_fixed_without_calling_the_model(self):
+        content = _content("Optics").model_dump()
+        content.update(difficulty_level="Medium", references=None)
+        content["sections"][0]["key_points"] = ["Only one"]
+        content["sections"][0]["content"] = "Light travels in straight lines. Lenses bend it."
+
+        generator = ContentGenerator("Optics", difficulty="advanced")
+        with mock.patch.object(generator, 'fix_content') as fix_content:
+            repaired = generator._validate(content)
+
+        fix_content.assert_not_called()
+        self.assertEqual(repaired.difficulty_level, "intermediate")
+        self.assertEqual(repaired.references, [])
+        self.assertEqual(len(repaired.sections[0].key_points), 2)
+
+    def test_missing_difficulty_is_counted_apart_from_a_miscased_one(self):
+        before = json_repair.repair_stats()
+        json_repair.repair_content({"references": []}, "advanced")
+        json_repair.repair_content({"references": [], "difficulty_level": "Hard"}, "advanced")
+        after = json_repair.repair_stats()
+        for repair in ("missing_difficulty", "difficulty_case"):
+            with self.subTest(repair=repair):
+                self.assertEqual(after.get(repair, 0) - before.get(repair, 0), 1)
+
+
+class RecommendedDifficultyTests(SimpleTestCase):
+    def _generate(self, recommended, difficulty="advanced"):
+        generator = ContentGenerator("Optics", difficulty=difficulty, mode="sections")
+        analysis = {"recommended_difficulty": recommended, "sections": ["Intro", "Core"]}
+        with mock.patch.object(generator, 'analyze_topic', return_value=analysis), \
+                mock.patch.object(generator, 'generate_overview', return_value=ContentOverview(summary="Sum")), \
+                mock.patch.object(generator, 'generate_section', side_effect=lambda title, analysis: _section(title)):
+            return generator.generate_content()
+
+    def test_recommended_difficulty_aliases_are_normalized(self):
+        for recommended, expected in (("medium", "intermediate"), ("Beginner", "beginner"), (" Hard ", "advanced")):
+            with self.subTest(recommended=recommended):
+                self.assertEqual(self._generate(recommended).difficulty_level, expected)
+
+    def test_unknown_recommendation_keeps_requested_difficulty(self):
+        self.assertEqual(self._generate("graduate").difficulty_level, "advanced")
+        self.assertEqual(self._generate(None).difficulty_level, "advanced")
+
+
+class LLMClientRegistryTests(SimpleTestCase):
+    def test_shared_clients_only_installed_on_checked_sdk_releases(self):
+        with mock.patch.object(llm_clients.genai, '__version__', '0.8.4'):
+            self.assertTrue(llm_clients._installs_clients())
+        for version in ('0.9.0', '1.0.0', 'dev'):
+            with self.subTest(version=version), mock.patch.object(llm_clients.genai, '__version__', version):
+                self.assertFalse(llm_clients._installs_clients())
+
+    def test_unchecked_sdk_release_keeps_default_clients(self):
+        with mock.patch.object(llm_clients, '_installs_clients', return_value=False):
+            registry = llm_clients.LLMClientRegistry()
+        model = registry.generative_model("gemini-2.0-flash")
+        self.assertIsNone(model._client)
+        self.assertIsNone(registry.agenerative_model("gemini-2.0-flash")._model._async_client)
+
+    def test_stats_count_clients_not_connections_for_gemini(self):
+        registry = llm_clients.LLMClientRegistry()
+        client = llm_clients._CountingClient(mock.Mock, registry, "gemini")
+        for _ in range(3):
+            client.generate_content()
+        self.assertEqual(registry.stats()["gemini"], {"requests": 3, "clients": 1})
+
+    def test_pydantic_ai_connections_come_from_the_pool(self):
+        registry = llm_clients.LLMClientRegistry()
+
+        async def requests():
+            for _ in range(3):
+                await registry._on_request(mock.Mock(extensions={}))
+            await registry._trace("connection.connect_tcp.complete", {})
+
+        asyncio.run(requests())
+        stats = registry.stats()["pydantic_ai"]
+        self.assertEqual((stats["requests"], stats["connections"], stats["reused"]), (3, 1, 2))
+
+    def test_models_are_shared_across_threads(self):
+        registry = llm_clients.LLMClientRegistry()
+        self.addCleanup(registry.close)
+        models = []
+        threads = [
+            threading.Thread(target=lambda: models.append(registry.generative_model("gemini-2.0-flash")))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len({id(model) for model in models}), 1)
+        self.assertIsNot(registry.generative_model("gemini-1.5-pro"), models[0])
+        self.assertIs(registry.agenerative_model("gemini-2.0-flash"), registry.agenerative_model("gemini-2.0-flash"))
+
+    def test_streamed_chunks_are_read_on_the_registry_loop(self):
+        registry = llm_clients.LLMClientRegistry()
+        self.addCleanup(registry.close)
+        threads = []
+
+        async def chunks():
+            for text in ("a", "b"):
+                threads.append(threading.current_thread().name)
+                yield text
+
+        async def generate_content_async(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            self.assertTrue(kwargs["stream"])
+            return chunks()
+
+        model = llm_clients._AsyncModel(mock.Mock(generate_content_async=generate_content_async), registry)
+
+        async def read():
+            return [chunk async for chunk in model.stream_content_async("prompt")]
+
+        self.assertEqual(asyncio.run(read()), ["a", "b"])
+        self.assertEqual(set(threads), {"llm-clients"})
+
+
+class GenerateQuestionsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        question_memory_cache.clear()
+
+    def _generate(self, **data):
+        return self.client.post('/api/generate-questions/', {"content": "Light bends.", **data}, format='json')
+
+    def test_malformed_numbers_are_rejected(self):
+        for data in ({"num_questions": "five"}, {"num_questions": 0}, {"num_questions": 500},
+                     {"content_id": "abc"}, {"content_id": -1}):
+            with self.subTest(data=data):
+                self.assertEqual(self._generate(**data).status_code, 400)
+
+    def test_malformed_batch_item_is_rejected(self):
+        response = self.client.post(
+            '/api/generate-questions/batch/',
+            {"items": [{"content": "Light bends."}, {"content": "Sound", "num_questions": "x"}]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Item 1", response.json()["error"])
+
+    def test_questions_are_served_when_caching_them_fails(self):
+        question = ResponseQuestions(
+            question="What bends light?", option_a="Lens", option_b="Rock", option_c="Wood",
+            option_d="Iron", answer_option="a",
+        )
+        with mock.patch.object(QuestionGeneratorAgent, 'generate_questions', return_value=[question]), \
+                mock.patch.object(QuestionSet.objects, 'bulk_create', side_effect=OperationalError("database is locked")), \
+                self.assertLogs('content_generation.views', 'WARNING') as logs:
+            response = self._generate(num_questions=1, difficulty="easy")
+        self.assertIn("database is locked", logs.output[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["questions"][0]["question"], "What bends light?")
+
+    def test_content_is_required_without_a_content_id(self):
+        response = self.client.post('/api/generate-questions/', {"num_questions": 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_content_id_is_not_found(self):
+        with mock.patch.object(QuestionGeneratorAgent, 'generate_questions') as generate_questions:
+            response = self.client.post('/api/generate-questions/', {"content_id": 999}, format='json')
+        self.assertEqual(response.status_code, 404)
+        generate_questions.assert_not_called()
+
+    def test_questions_are_generated_from_the_stored_content_of_a_content_id(self):
+        stored = GeneratedContent.objects.create(
+            topic="Optics", content=_content("Optics").model_dump(), difficulty_level="beginner"
+        )
+        question = ResponseQuestions(
+            question="What bends light?", option_a="Lens", option_b="Rock", option_c="Wood",
+            option_d="Iron", answer_option="a",
+        )
+        with mock.patch.object(QuestionGeneratorAgent, 'generate_questions', return_value=[question]) as generate_questions:
+            response = self.client.post(
+                '/api/generate-questions/', {"content_id": stored.id, "num_questions": 1, "difficulty": "hard"},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("About Intro", generate_questions.call_args.args[0])
+
+
+@override_settings(QUESTION_BATCH_CONCURRENCY=2)
+class BatchQuestionsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        question_memory_cache.clear()
+
+    def _batch(self, **data):
+        items = [{"content": f"Content {index}", "num_questions": 1, "difficulty": "easy"} for index in range(4)]
+        return self.client.post('/api/generate-questions/batch/', {"items": items, **data}, format='json')
+
+    def test_items_run_with_bounded_concurrency_and_fail_on_their_own(self):
+        running = []
+        peak = []
+
+        async def generate_questions(agent, content, num_questions, difficulty):
+            running.append(content)
+            peak.append(len(running))
+            await asyncio.sleep(0.05)
+            running.remove(content)
+            if content == "Content 2":
+                raise RuntimeError("model unavailable")
+            return [ResponseQuestions(
+                question=f"About {content}?", option_a="A", option_b="B", option_c="C",
+                option_d="D", answer_option="a",
+            )]
+
+        with mock.patch.object(QuestionGeneratorAgent, 'generate_questions', generate_questions):
+            results = self._batch().json()["results"]
+
+        self.assertEqual(max(peak), 2)
+        self.assertEqual([result["index"] for result in results], [0, 1, 2, 3])
+        self.assertIn("error", results[2])
+        self.assertEqual(results[3]["questions"][0]["question"], "About Content 3?")
+
+    def test_streamed_results_end_with_a_summary(self):
+        question = ResponseQuestions(
+            question="What bends light?", option_a="Lens", option_b="Rock", option_c="Wood",
+            option_d="Iron", answer_option="a",
+        )
+        with mock.patch.object(QuestionGeneratorAgent, 'generate_questions', return_value=[question]):
+            response = self._batch(stream=True)
+            events = _events(response)
+
+        self.assertEqual(sorted(data["index"] for event, data in events if event == "result"), [0, 1, 2, 3])
+        self.assertEqual(events[-1], ("done", {"succeeded": 4, "failed": 0}))
+
+
+class ChunkingTests(SimpleTestCase):
+    def _long_content(self):
+        content = _content("Optics").model_dump()
+        content["sections"] = [
+            {"title": f"Part {index}", "content": "Light bends in lenses. " * 40, "key_points": ["One", "Two"]}
+            for index in range(4)
+        ]
+        return content
+
+    def test_content_is_split_at_section_boundaries_within_the_budget(self):
+        chunks = chunk_content(self._long_content(), 600)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith("Topic: Optics"))
+            self.assertLessEqual(estimate_tokens(chunk), 600)
+        self.assertEqual(sum(chunk.count("Key points:") for chunk in chunks), 4)
+
+    def test_questions_are_allocated_in_proportion_to_chunk_size(self):
+        self.assertEqual(allocate_questions(["a" * 400, "b" * 400, "c" * 800], 5), [1, 1, 3])
+        self.assertEqual(sum(allocate_questions(["a" * 100] * 3, 10)), 10)
+
+    def test_long_content_is_asked_for_in_parallel_chunks(self):
+        def questions(count):
+            return [
+                ResponseQuestions(
+                    question=f"Which {word} question?", option_a="A", option_b="B", option_c="C",
+                    option_d="D", answer_option="a",
+                )
+                for word in ("first", "second", "third", "fourth", "fifth", "sixth")[:count]
+            ]
+
+        agent = QuestionGeneratorAgent()
+        calls = []
+
+        async def generate_chunk_questions(text, num_questions, difficulty, avoid=None):
+            calls.append(num_questions)
+            return questions(num_questions), 0
+
+        with mock.patch.object(QuestionGeneratorAgent, 'chunk_tokens', 600), \
+                mock.patch.object(agent, 'generate_chunk_questions', generate_chunk_questions), \
+                mock.patch.object(agent, 'top_up_rounds', 0):
+            asyncio.run(agent.generate_questions(json.dumps(self._long_content()), num_questions=4))
+
+        self.assertGreater(len(calls), 1)
+        self.assertEqual(sum(calls), 4)
+
+
+class NearDuplicateTests(SimpleTestCase):
+    def _question(self, text, options=("Newton", "Joule", "Watt", "Pascal")):
+        return ResponseQuestions(
+            question=text, option_a=options[0], option_b=options[1], option_c=options[2],
+            option_d=options[3], answer_option="a",
+        )
+
+    def _index(self, question):
+        index = QuestionIndex(QuestionGeneratorAgent.duplicate_threshold)
+        index.add(question, 1)
+        return index
+
+    def test_same_options_different_stem_is_not_a_duplicate(self):
+        index = self._index(self._question("What is the SI unit of force?"))
+        self.assertIsNone(index.find_duplicate(self._question("What is the SI unit of energy?")))
+
+    def test_reworded_question_is_a_duplicate(self):
+        index = self._index(self._question("What is the SI unit of force?"))
+        reworded = self._question("Which is the SI unit of forces?", ("Pascal", "Watt", "Newton", "Joule"))
+        self.assertEqual(index.find_duplicate(reworded), 1)
+
+    def test_local_add_does_not_move_synced_id(self):
+        index = QuestionIndex()
+        index.sync([mock.Mock(id=1, **self._question("What is the SI unit of force?").model_dump())])
+        index.add(self._question("What is the SI unit of power?"), 10)
+        self.assertEqual(index.synced_id, 1)
+        self.assertEqual(index.sync_since(), 1)
+        index.resync_interval = 0
+        self.assertEqual(index.sync_since(), 0)
+
+    def test_duplicates_are_dropped_and_only_the_shortfall_is_asked_for_again(self):
+        batches = [
+            [
+                self._question("What is the SI unit of force?"),
+                self._question("Which is the SI unit of forces?"),
+                self._question("What is the SI unit of pressure?"),
+            ],
+            [self._question("What is the SI unit of power?")],
+        ]
+        asked = []
+
+        async def generate_chunk_questions(text, num_questions, difficulty, avoid=None):
+            asked.append((num_questions, avoid))
+            return batches[len(asked) - 1], 0
+
+        agent = QuestionGeneratorAgent()
+        exclude = self._index(self._question("What is the SI unit of pressure?"))
+        with mock.patch.object(agent, 'generate_chunk_questions', generate_chunk_questions), \
+                mock.patch.object(agent, 'top_up_rounds', 1):
+            questions = asyncio.run(agent.generate_questions("Units", num_questions=2, exclude=exclude))
+
+        self.assertEqual(
+            [question.question for question in questions],
+            ["What is the SI unit of force?", "What is the SI unit of power?"],
+        )
+        self.assertEqual(asked, [(2, []), (1, ["What is the SI unit of force?"])])
+
+    def test_generic_stem_with_other_options_is_not_a_duplicate(self):
+        index = self._index(self._question("Which statement is correct?"))
+        other = self._question(
+            "Which statement is correct?", ("Light is a wave", "Sound needs air", "Ice sinks", "Mass is fixed")
+        )
+        self.assertIsNone(index.find_duplicate(other))
@@ -0,0 +1,175 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+# Anything that isn't a word character is treated as a separator. "+" and "#"
+# are kept so that "C", "C++" and "C#" stay different topics.
+_SEPARATORS = re.compile(r"[^\w+#]+")
+
+
+def _stem(word: str) -> str:
+    """
+    Very light suffix stripping so singular and plural forms share a key
+    """
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def normalize_topic(topic: str) -> str:
+    """
+    Build the canonical cache key for a topic.
+
+    "Quantum Physics", "quantum physics " and "Quantum  physics!" all map to
+    the same key.
+    """
+    words = _SEPARATORS.sub(" ", str(topic).casefold()).replace("_", " ").split()
+    return " ".join(_stem(word) for word in words)
+
+
+# Prefixes that turn a word into its opposite or complement, so "organic"
+# and "inorganic" are never treated as spellings of one topic
+_NEGATING_PREFIXES = ("in", "im", "il", "ir", "un", "non", "dis", "anti")
+_NUMBERS = re.compile(r"\d+")
+
+
+def _variant_key(key: str) -> str:
+    """
+    Fold a topic key over spacing, so "photo synthesis" and "photosynthesis"
+    (or "data structure" and "datastructures") share a variant key
+    """
+    return key.replace(" ", "")
+
+
+def _distinct_topics(a: str, b: str) -> bool:
+    """
+    Whether two topic keys name different topics however alike they look:
+    they have different numbers ("world war 1", "world war 2"), or one
+    negates a word of the other ("organic", "inorganic", "non linear")
+    """
+    if _NUMBERS.findall(a) != _NUMBERS.findall(b):
+        return True
+    words_a, words_b = set(a.split()), set(b.split())
+    for words, others in ((words_a - words_b, words_b), (words_b - words_a, words_a)):
+        for word in words:
+            if word in _NEGATING_PREFIXES:
+                return True
+            if any(word.startswith(prefix) and word[len(prefix):] in others for prefix in _NEGATING_PREFIXES):
+                return True
+    return False
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TopicIndex:
+    """
+    In-memory trigram index over stored topic keys for near-match lookups.
+
+    Candidates are found by trigram overlap and then ranked by edit
+    similarity, so a lookup only scores topics that share some trigrams with
+    the query instead of every stored topic. Topics with different numbers
+    or a negated word are never matched, however similar.
+
+    Rows stored by this process are added as they are stored, and rows
+    stored by other processes are picked up by syncing rows with ids above
+    sync_since(). Since rows can be committed out of id order, a full sync
+    is asked for every resync_interval seconds.
+    """
+
+    # Number of trigram candidates that are scored by edit similarity
+    max_candidates = 5
+    # Seconds between full syncs
+    resync_interval = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Set[Tuple[str, str]]] = defaultdict(set)
+        self._ids: Dict[Tuple[str, str], int] = {}
+        # Highest id synced from the database. Rows added locally don't
+        # move it, since rows other processes stored before them may not
+        # have been synced yet.
+        self.synced_id = 0
+        self._full_sync_at = None
+
+    def add(self, content_id: int, topic_key: str, difficulty: str) -> None:
+        """
+        Index a stored content row
+        """
+        entry = (topic_key, difficulty)
+        with self._lock:
+            self._ids[entry] = content_id
+            for gram in _trigrams(topic_key):
+                self._postings[gram].add(entry)
+
+    def sync_since(self) -> int:
+        """
+        Return the id above which stored rows should be synced, 0 when a
+        full sync is due
+        """
+        with self._lock:
+            if self._full_sync_at is None or time.monotonic() - self._full_sync_at >= self.resync_interval:
+                return 0
+            return self.synced_id
+
+    def sync(self, rows: Iterable[Tuple[int, str, str]], since: int = 0) -> None:
+        """
+        Index (id, topic_key, difficulty) rows stored with ids above since,
+        the value sync_since() returned
+        """
+        highest = since
+        for content_id, topic_key, difficulty in rows:
+            self.add(content_id, topic_key, difficulty)
+            highest = max(highest, content_id)
+        with self._lock:
+            self.synced_id = max(self.synced_id, highest)
+            if not since:
+                self._full_sync_at = time.monotonic()
+
+    def best_match(
+        self, topic_key: str, difficulty: str, threshold: float, variants_only: bool = False,
+    ) -> Optional[Tuple[int, float]]:
+        """
+        Return (content_id, similarity) of the closest stored topic at this
+        difficulty, or None if nothing reaches the threshold.
+
+        With variants_only, only topics that differ from topic_key in
+        spacing are matched, so "photo synthesis" finds "photosynthesis"
+        but "organic chemistry" doesn't find "biochemistry".
+        """
+        grams = _trigrams(topic_key)
+        shared = defaultdict(int)
+        with self._lock:
+            for gram in grams:
+                for entry in self._postings.get(gram, ()):
+                    if entry[1] == difficulty:
+                        shared[entry] += 1
+            ids = dict(self._ids)
+
+        # Rank by trigram Jaccard similarity, then confirm with edit similarity
+        candidates = sorted(
+            shared.items(),
+            key=lambda item: item[1] / (len(grams) + len(_trigrams(item[0][0])) - item[1]),
+            reverse=True,
+        )[:self.max_candidates]
+
+        best = None
+        for (key, _), _ in candidates:
+            if _variant_key(key) != _variant_key(topic_key):
+                if variants_only or _distinct_topics(topic_key, key):
+                    continue
+            similarity = SequenceMatcher(None, topic_key, key).ratio()
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (ids[(key, difficulty)], similarity)
+        return best
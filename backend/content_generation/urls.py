@@ -1,8 +1,17 @@
 from django.urls import path
-from .views import generate_content, generate_questions, user_contents
+from .views import (
+    generate_content, generate_content_stream, generate_content_job,
+    content_job_status, content_job_events, generate_questions, generate_questions_batch,
+    user_contents,
+)
 
 urlpatterns = [
     path('generate-content/', generate_content, name='generate_content'),
+    path('generate-content/stream/', generate_content_stream, name='generate_content_stream'),
+    path('generate-content/jobs/', generate_content_job, name='generate_content_job'),
+    path('generate-content/jobs/<int:job_id>/', content_job_status, name='content_job_status'),
+    path('generate-content/jobs/<int:job_id>/events/', content_job_events, name='content_job_events'),
     path('generate-questions/', generate_questions, name='generate_questions'),
+    path('generate-questions/batch/', generate_questions_batch, name='generate_questions_batch'),
     path('user-contents/', user_contents, name='user_contents'),
 ]
\ No newline at end of file
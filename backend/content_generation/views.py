@@ -1,83 +1,175 @@
 from adrf.decorators import api_view as drf_api_view
-from rest_framework.decorators import permission_classes, api_view
+from rest_framework.decorators import permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from .content_generation import generate_content_for_topic
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from .content_generation import ContentGenerator, agenerate_content_for_topic
 from .question_generation import QuestionGeneratorAgent
-from .models import GeneratedContent
-from .serializers import GeneratedContentSerializer
+from .inflight import SingleFlight, InFlightTimeout
+from .topics import normalize_topic
+from .models import GeneratedContent, UserContent, ContentJob
+from .services import afind_stored_content, astore_generated_content, arecord_user_content
+from .streaming import sse_event
+from .serializers import GeneratedContentSerializer, ContentJobSerializer
+from .jobs import enqueue_content_job
+from quizzes.cache import question_cache_key, aget_cached_questions, astore_questions
+from quizzes.bank import bank_difficulty, asample_bank_questions
+from quizzes.attempts import aserve_quiz, quiz_questions
+from quizzes.serializers import BankQuestionSerializer
+from quizzes.skills import skill_ratings
+from videos.prefetch import start_video_prefetch
+import asyncio
 import json
 import logging
+from contextlib import aclosing
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-@api_view(['POST'])
+# Concurrent requests for the same topic and difficulty share one generation
+content_inflight = SingleFlight()
+# Concurrent requests for the same questions share one generation
+question_inflight = SingleFlight()
+
+
+def parse_generation_request(data, user=None):
+    """
+    Validate the topic, difficulty and mode of a content generation request.
+
+    Without a difficulty, the level suited to the user's skill on the topic
+    is used, or intermediate if they have not taken a quiz yet. Returns ((topic, topic_key, difficulty, mode), None) on success or
+    (None, Response) with the error to return.
+    """
+    topic = data.get('topic')
+
+    # Validate input
+    if not topic:
+        return None, Response(
+            {"error": "A topic is required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Content is shared between users, so collapse stray whitespace in the topic
+    topic = " ".join(str(topic).split())
+    topic_key = normalize_topic(topic)
+
+    # Get optional difficulty parameter (default to the user's level)
+    difficulty = data.get('difficulty')
+    if not difficulty and user is not None and user.is_authenticated:
+        difficulty = skill_ratings.suggest_difficulty(user.id, topic_key)
+    difficulty = difficulty or 'intermediate'
+
+    # Validate difficulty
+    valid_difficulties = ["beginner", "intermediate", "advanced"]
+    if difficulty.lower() not in valid_difficulties:
+        return None, Response(
+            {"error": f"Difficulty must be one of: {', '.join(valid_difficulties)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Get optional generation mode
+    mode = data.get('mode', settings.CONTENT_GENERATION_MODE)
+    valid_modes = list(ContentGenerator.MODES)
+    if mode not in valid_modes:
+        return None, Response(
+            {"error": f"Mode must be one of: {', '.join(valid_modes)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return (topic, topic_key, difficulty.lower(), mode), None
+
+
+@drf_api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def generate_content(request):
+async def generate_content(request):
     """
     Generate educational content based on a provided topic.
     
     Expected POST data:
     {
         "topic": "The topic to generate content for",
-        "difficulty": "beginner|intermediate|advanced" (optional)
+        "difficulty": "beginner|intermediate|advanced" (optional),
+        "mode": "fast|quality|sections" (optional)
     }
     
+    "fast" mode generates the content in a single model call, "quality" mode
+    analyzes the topic in a separate call first, and "sections" mode analyzes the
+    topic and then generates every section concurrently.
+
     If the content for a topic with the specified difficulty level already exists
-    for the current user, it will be retrieved from the database instead of generating new content.
+    for any user, it will be retrieved from the database instead of generating new content,
+    and linked to the current user's content history.
+    Concurrent requests for the same topic and difficulty wait for a single generation.
+
+    Topics are compared in normalized form, and a sufficiently similar stored topic
+    is served as a near match. The X-Content-Match response header reports whether
+    the result was an "exact" or "fuzzy" match or "fresh" content.
+
+    While new content is generated, videos for the topic and each of its sections
+    are fetched in the background so the video-links calls that usually follow
+    are served from the cache.
     """
     try:
-        # Extract data from request
-        data = request.data
-        topic = data.get('topic')
-        
-        # Validate input
-        if not topic:
-            return Response(
-                {"error": "A topic is required"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Get optional difficulty parameter (default to intermediate)
-        difficulty = data.get('difficulty', 'intermediate')
-        
-        # Validate difficulty
-        valid_difficulties = ["beginner", "intermediate", "advanced"]
-        if difficulty.lower() not in valid_difficulties:
-            return Response(
-                {"error": f"Difficulty must be one of: {', '.join(valid_difficulties)}"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-            
+        # Extract and validate data from request
+        params, error_response = await sync_to_async(parse_generation_request)(request.data, request.user)
+        if error_response is not None:
+            return error_response
+        topic, topic_key, difficulty, mode = params
+
         # Check if content already exists for this topic and difficulty
-        try:
-            existing_content = GeneratedContent.objects.get(
-                topic=topic,
-                difficulty_level=difficulty.lower(),
-                user=request.user
-            )
-            logger.info(f"Retrieved existing content for topic: '{topic}' at {difficulty} level")
-            return Response(existing_content.content, status=status.HTTP_200_OK)
-        except GeneratedContent.DoesNotExist:
-            # Generate new content if it doesn't exist
-            logger.info(f"Generating new content for topic: '{topic}' at {difficulty} level")
-            content = generate_content_for_topic(topic, difficulty.lower())
-            
-            # Store the generated content in the database
-            new_content = GeneratedContent(
-                topic=topic,
-                content=content,
-                difficulty_level=difficulty.lower(),
-                user=request.user
+        content, match = await afind_stored_content(topic_key, difficulty)
+        if content is not None:
+            logger.info(f"Retrieved existing content ({match} match) for topic: '{topic}' at {difficulty} level")
+        else:
+            async def generate_and_store():
+                # Another request may have stored the content while we were waiting to lead
+                stored = await GeneratedContent.objects.filter(
+                    topic_key=topic_key,
+                    difficulty_level=difficulty
+                ).afirst()
+                if stored is not None:
+                    return stored
+
+                logger.info(f"Generating new content for topic: '{topic}' at {difficulty} level")
+                # Search for the topic's videos while the content is generated,
+                # and for its sections as soon as they are planned
+                prefetch = start_video_prefetch(topic)
+                try:
+                    generated = await agenerate_content_for_topic(
+                        topic, difficulty, mode, on_sections=prefetch.add_sections
+                    )
+                except BaseException:
+                    prefetch.cancel()
+                    raise
+                prefetch.add_sections(section.get('title') for section in generated.get('sections', []))
+
+                # Store the generated content in the database
+                return await astore_generated_content(topic, difficulty, generated)
+
+            # Only one request per topic and difficulty calls the model, the rest wait for it
+            content = await content_inflight.ado(
+                (topic_key, difficulty),
+                generate_and_store,
+                timeout=settings.CONTENT_GENERATION_INFLIGHT_TIMEOUT
             )
-            new_content.save()
-            logger.info(f"Saved new content to database for topic: '{topic}'")
-            
-            # Return the generated content
-            return Response(content, status=status.HTTP_200_OK)
-        
+            match = "fresh"
+
+        # Record the content in the user's history
+        await arecord_user_content(request.user, content)
+
+        response = Response(content.content, status=status.HTTP_200_OK)
+        response["X-Content-Match"] = match
+        return response
+
+    except InFlightTimeout as e:
+        logger.error(f"Content generation wait timed out: {str(e)}")
+        return Response(
+            {"error": "Content for this topic is still being generated, please try again shortly"},
+            status=status.HTTP_504_GATEWAY_TIMEOUT
+        )
     except ValueError as e:
         # Handle expected errors from content generation
         logger.error(f"Content generation error: {str(e)}")
@@ -93,6 +185,362 @@ def generate_content(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
     
+@drf_api_view(['POST'])
+@permission_classes([IsAuthenticated])
+async def generate_content_stream(request):
+    """
+    Generate educational content as a stream of server-sent events.
+
+    Accepts the same POST data as generate_content, and generates in the
+    same mode. Emits:
+    - "summary": the summary, as soon as it has been generated
+    - "section": each content section (with its "index"), as soon as it is complete and valid
+    - "done": the full validated content, after it has been stored
+    - "error": if generation fails part way through
+
+    Stored content is replayed as the same sequence of events. Like
+    generate_content, concurrent requests for the same topic and difficulty
+    share one generation: a stream that starts while the content is being
+    generated waits for it and then replays it.
+
+    Like every server-sent event endpoint, the stream is an async generator,
+    so events are only sent as they happen under an ASGI server.
+    """
+    params, error_response = await sync_to_async(parse_generation_request)(request.data, request.user)
+    if error_response is not None:
+        return error_response
+    topic, topic_key, difficulty, mode = params
+    user = request.user
+    key = (topic_key, difficulty)
+
+    async def stored_events(content):
+        yield sse_event("summary", content.content.get("summary", ""))
+        for index, section in enumerate(content.content.get("sections", [])):
+            yield sse_event("section", {"index": index, **section})
+        yield sse_event("done", content.content)
+
+    async def generate_and_store():
+        # Used when the generation this stream waited on has already finished
+        stored = await GeneratedContent.objects.filter(topic_key=topic_key, difficulty_level=difficulty).afirst()
+        if stored is not None:
+            return stored
+        generated = await agenerate_content_for_topic(topic, difficulty, mode)
+        return await astore_generated_content(topic, difficulty, generated)
+
+    async def followed_events():
+        logger.info(f"Waiting on content being generated for topic: '{topic}' at {difficulty} level")
+        try:
+            content = await content_inflight.ado(
+                key, generate_and_store, timeout=settings.CONTENT_GENERATION_INFLIGHT_TIMEOUT
+            )
+        except InFlightTimeout as e:
+            logger.error(f"Content generation wait timed out: {str(e)}")
+            yield sse_event("error", {"error": "Content for this topic is still being generated, please try again shortly"})
+            return
+        except Exception as e:
+            logger.exception(f"Error waiting on content: {str(e)}")
+            yield sse_event("error", {"error": f"Content generation failed: {str(e)}"})
+            return
+        await arecord_user_content(user, content)
+        async for event in stored_events(content):
+            yield event
+
+    async def generated_events():
+        # Lead the generation, or replay the one already in flight
+        call = content_inflight.lead(key)
+        if call is None:
+            async for event in followed_events():
+                yield event
+            return
+
+        content = None
+        error = InFlightTimeout(f"In-flight call for {key} was cancelled")
+        prefetch = start_video_prefetch(topic)
+        try:
+            logger.info(f"Streaming new content for topic: '{topic}' at {difficulty} level")
+            generator = ContentGenerator(
+                topic=topic, difficulty=difficulty, mode=mode, on_sections=prefetch.add_sections
+            )
+            async with aclosing(generator.astream_content()) as stream:
+                async for event, data in stream:
+                    if event == "content":
+                        content = await astore_generated_content(topic, difficulty, data.model_dump())
+                        await arecord_user_content(user, content)
+                        yield sse_event("done", content.content)
+                    else:
+                        if event == "section":
+                            prefetch.add_sections([data.get("title")])
+                        yield sse_event(event, data)
+        except (GeneratorExit, asyncio.CancelledError):
+            # The client disconnected
+            prefetch.cancel()
+            raise
+        except Exception as e:
+            prefetch.cancel()
+            error = ValueError(f"Content generation failed: {str(e)}")
+            logger.exception(f"Error streaming content: {str(e)}")
+            yield sse_event("error", {"error": f"Content generation failed: {str(e)}"})
+        finally:
+            # Hand the result to requests that waited on this stream
+            content_inflight.finish(key, call, content, None if content is not None else error)
+
+    content, match = await afind_stored_content(topic_key, difficulty)
+    if content is not None:
+        logger.info(f"Replaying existing content ({match} match) for topic: '{topic}' at {difficulty} level")
+        await arecord_user_content(user, content)
+        events = stored_events(content)
+    else:
+        match = "fresh"
+        events = generated_events()
+
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # Stop reverse proxies from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    response["X-Content-Match"] = match
+    return response
+
+
+@drf_api_view(['POST'])
+@permission_classes([IsAuthenticated])
+async def generate_content_job(request):
+    """
+    Queue content generation and return immediately with a job to follow.
+
+    Accepts the same POST data as generate_content. Returns 202 with the job,
+    which can be polled at generate-content/jobs/<job_id>/ or followed as
+    server-sent events at generate-content/jobs/<job_id>/events/. A request for
+    content that is already queued or running joins the existing job.
+
+    If the content already exists it is returned straight away with status "done"
+    and no job.
+    """
+    try:
+        params, error_response = await sync_to_async(parse_generation_request)(request.data, request.user)
+        if error_response is not None:
+            return error_response
+        topic, topic_key, difficulty, mode = params
+
+        content, match = await afind_stored_content(topic_key, difficulty)
+        if content is not None:
+            await arecord_user_content(request.user, content)
+            response = Response(
+                {"job_id": None, "status": ContentJob.DONE, "content": content.content},
+                status=status.HTTP_200_OK
+            )
+            response["X-Content-Match"] = match
+            return response
+
+        job, created = await sync_to_async(enqueue_content_job)(topic, difficulty, mode, request.user)
+        return Response(ContentJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    except Exception as e:
+        logger.exception(f"Error queueing content job: {str(e)}")
+        return Response(
+            {"error": f"Failed to queue content generation: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+async def get_user_job(job_id, user):
+    return await ContentJob.objects.select_related('result').filter(
+        id=job_id,
+        requested_by=user
+    ).afirst()
+
+
+@drf_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def content_job_status(request, job_id):
+    """
+    Get the status of a content generation job, with its content once done.
+    """
+    job = await get_user_job(job_id, request.user)
+    if job is None:
+        return Response(
+            {"error": "Job not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(ContentJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
+@drf_api_view(['GET'])
+@permission_classes([IsAuthenticated])
+async def content_job_events(request, job_id):
+    """
+    Follow a content generation job as server-sent events.
+
+    A "status" event is sent whenever the job changes, ending with a "done"
+    or "failed" event that carries the full job.
+    """
+    user = request.user
+    job = await get_user_job(job_id, user)
+    if job is None:
+        return Response(
+            {"error": "Job not found"},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    async def events(job):
+        last_update = None
+        while True:
+            if job.updated_at != last_update:
+                last_update = job.updated_at
+                data = ContentJobSerializer(job).data
+                if job.status in ContentJob.ACTIVE_STATUSES:
+                    yield sse_event("status", data)
+                else:
+                    yield sse_event(job.status, data)
+                    return
+            await asyncio.sleep(settings.CONTENT_JOB_POLL_INTERVAL)
+            job = await get_user_job(job_id, user)
+
+    response = StreamingHttpResponse(events(job), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+def serialize_question(question):
+    """
+    Convert a ResponseQuestions object to a dictionary with the answer text
+    """
+    # Determine the answer string based on the selected option
+    if question.answer_option.lower() == 'a':
+        answer_text = question.option_a
+    elif question.answer_option.lower() == 'b':
+        answer_text = question.option_b
+    elif question.answer_option.lower() == 'c':
+        answer_text = question.option_c
+    elif question.answer_option.lower() == 'd':
+        answer_text = question.option_d
+    else:
+        answer_text = ""
+
+    return {
+        'question': question.question,
+        'option_a': question.option_a,
+        'option_b': question.option_b,
+        'option_c': question.option_c,
+        'option_d': question.option_d,
+        'answer_option': question.answer_option,
+        'answer_string': answer_text
+    }
+
+async def suggest_question_difficulty(user, content_id=None, topic=None):
+    """
+    The difficulty suited to the user's skill on the quiz's topic, taken
+    from the stored content or the request, or "easy" for anonymous users
+    and users who have not taken a quiz yet
+    """
+    if user is None or not user.is_authenticated:
+        return 'easy'
+    topic_key = normalize_topic(topic) if topic else ''
+    if content_id is not None:
+        topic_key = await GeneratedContent.objects.filter(id=content_id).values_list(
+            'topic_key', flat=True
+        ).afirst() or topic_key
+    difficulty = await sync_to_async(skill_ratings.suggest_difficulty)(user.id, topic_key)
+    return difficulty or 'easy'
+
+def parse_question_request(data):
+    """
+    Validate the number of questions and the content id of a quiz request,
+    which needs content unless it names stored content with content_id.
+
+    Returns ((num_questions, content_id), None) on success or (None,
+    Response) with the error to return.
+    """
+    try:
+        num_questions = int(data.get('num_questions', 5))
+    except (TypeError, ValueError):
+        num_questions = None
+    if num_questions is None or not 1 <= num_questions <= settings.QUESTION_MAX_PER_QUIZ:
+        return None, Response(
+            {"error": f"num_questions must be a whole number from 1 to {settings.QUESTION_MAX_PER_QUIZ}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    content_id = data.get('content_id')
+    if content_id is not None:
+        try:
+            content_id = int(content_id)
+        except (TypeError, ValueError):
+            content_id = None
+        if content_id is None or content_id < 1:
+            return None, Response(
+                {"error": "content_id must be the id of stored content"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    elif not data.get('content'):
+        return None, Response(
+            {"error": "Either content or content_id is required"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    return (num_questions, content_id), None
+
+async def resolve_questions(content, num_questions, difficulty, content_id=None, user=None, topic=None):
+    """
+    Get the questions for one quiz request.
+
+    Without a difficulty, the one suited to the user's skill is used. The
+    quiz is sampled from the question bank when content_id is given, then
+    looked up in the question cache and only generated on a miss, from the
+    stored content if the request sent none. Raises
+    GeneratedContent.DoesNotExist if content_id isn't stored content.
+    Returns (serialized questions, source, quiz_key, difficulty) where
+    source is "bank", "memory", "database" or "miss". The quiz is stored as
+    served to the user and quiz_key is what its attempt is submitted with,
+    or None for an anonymous user. The questions are returned without their
+    answers, which stay on the server to score the attempt.
+    """
+    serialized_questions = source = cache_key = None
+    if content_id is not None:
+        stored = await GeneratedContent.objects.filter(id=content_id).values_list('content', flat=True).afirst()
+        if stored is None:
+            raise GeneratedContent.DoesNotExist(f"No stored content with id {content_id}")
+        content = content or stored
+    if not difficulty:
+        difficulty = await suggest_question_difficulty(user, content_id, topic)
+    level = bank_difficulty(difficulty)
+    if content_id is not None and level is not None:
+        questions = await asample_bank_questions(content_id, level, num_questions, user)
+        if questions is not None:
+            serialized_questions = BankQuestionSerializer(questions, many=True).data
+            source = "bank"
+
+    if serialized_questions is None:
+        # Serve repeat requests for the same content from the question cache
+        cache_key = question_cache_key(content, num_questions, difficulty)
+        serialized_questions, source = await aget_cached_questions(cache_key)
+
+    if serialized_questions is None:
+        async def generate_and_store():
+            agent = QuestionGeneratorAgent()
+            questions = await agent.generate_questions(
+                str(content),
+                num_questions=num_questions,
+                difficulty=difficulty
+            )
+            serialized = [serialize_question(question) for question in questions]
+            try:
+                await astore_questions(cache_key, num_questions, difficulty, serialized)
+            except Exception as e:
+                # The questions are paid for, so serve them even if they can't be cached
+                logger.warning(f"Error caching generated questions: {str(e)}")
+            return serialized
+
+        # Identical requests arriving together share one generation
+        serialized_questions = await question_inflight.ado(
+            cache_key,
+            generate_and_store,
+            timeout=settings.CONTENT_GENERATION_INFLIGHT_TIMEOUT
+        )
+        source = "miss"
+
+    quiz_key = await aserve_quiz(user, serialized_questions, difficulty, content_id, topic)
+    return quiz_questions(serialized_questions), source, quiz_key, difficulty
+
 @drf_api_view(['POST'])
 @permission_classes([AllowAny])
 async def generate_questions(request):
@@ -103,52 +551,44 @@ async def generate_questions(request):
     {
         "content": "The content to generate questions from",
         "num_questions": 5, (5 by default)
-        "difficulty": "beginner|intermediate|advanced" (optional)
+        "difficulty": "beginner|intermediate|advanced" (optional),
+        "content_id": 1 (optional, id of the stored content),
+        "topic": "..." (optional, used to pick a difficulty when none is given)
     }
+
+    When content_id is given, the quiz is sampled from that content's
+    question bank, leaving out questions the user has already been given,
+    and content may be left out. An unknown content_id is a 404.
     """
     try:
-        agent = QuestionGeneratorAgent()
         data = request.data
+        params, error_response = parse_question_request(data)
+        if error_response is not None:
+            return error_response
+        num_questions, content_id = params
         content = data.get('content', '')
-        num_questions = data.get('num_questions', 5)
-        difficulty = data.get('difficulty', 'easy')
-        
-        # Properly await the coroutine
-        questions = await agent.generate_questions(
-            str(content),
-            num_questions=num_questions,
-            difficulty=difficulty
+        difficulty = data.get('difficulty')
+
+        serialized_questions, source, quiz_key, difficulty = await resolve_questions(
+            content, num_questions, difficulty, content_id, request.user, data.get('topic')
         )
-        
-        # Convert each ResponseQuestions object to a dictionary
-        serialized_questions = []
-        for question in questions:
-            # Determine the answer string based on the selected option
-            if question.answer_option.lower() == 'a':
-                answer_text = question.option_a
-            elif question.answer_option.lower() == 'b':
-                answer_text = question.option_b
-            elif question.answer_option.lower() == 'c':
-                answer_text = question.option_c
-            elif question.answer_option.lower() == 'd':
-                answer_text = question.option_d
-            else:
-                answer_text = ""
-                
-            question_dict = {
-                'question': question.question,
-                'option_a': question.option_a,
-                'option_b': question.option_b,
-                'option_c': question.option_c,
-                'option_d': question.option_d,
-                'answer_option': question.answer_option,
-                'answer_string': answer_text
-            }
-            serialized_questions.append(question_dict)
-        
+
         # Return the serialized questions
-        return Response({"questions": serialized_questions}, status=status.HTTP_200_OK)
-        
+        response = Response(
+            {"questions": serialized_questions, "quiz_key": quiz_key, "difficulty": difficulty},
+            status=status.HTTP_200_OK
+        )
+        response['X-Question-Cache'] = source
+        return response
+
+    except GeneratedContent.DoesNotExist as e:
+        return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+    except InFlightTimeout as e:
+        logger.error(f"Question generation wait timed out: {str(e)}")
+        return Response(
+            {"error": "Question generation is taking longer than expected, please try again"},
+            status=status.HTTP_504_GATEWAY_TIMEOUT
+        )
     except Exception as e:
         logger.exception(f"Error generating questions: {str(e)}")
         return Response(
@@ -156,20 +596,116 @@ async def generate_questions(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
-@api_view(['GET'])
+@drf_api_view(['POST'])
+@permission_classes([AllowAny])
+async def generate_questions_batch(request):
+    """
+    Generate questions for many quizzes in one request.
+
+    Expected POST data:
+    {
+        "items": [
+            {"content": "...", "num_questions": 5, "difficulty": "beginner", "content_id": 1},
+            ...
+        ],
+        "stream": false (optional)
+    }
+
+    Items are processed concurrently, at most QUESTION_BATCH_CONCURRENCY at
+    a time, and each gets its own result or error, so one failure does not
+    fail the batch; a malformed item fails the request with 400 instead.
+    With "stream": true the results are sent as server-sent "result" events
+    as soon as each item completes, followed by a "done" event; otherwise
+    they are returned together in item order.
+    """
+    items = request.data.get('items')
+    if not isinstance(items, list) or not items:
+        return Response(
+            {"error": "items must be a non-empty list"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > settings.QUESTION_BATCH_MAX_ITEMS:
+        return Response(
+            {"error": f"A batch can have at most {settings.QUESTION_BATCH_MAX_ITEMS} items"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Reject malformed items up front, before any is generated
+    params = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return Response(
+                {"error": f"Item {index} must be an object"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        item_params, error_response = parse_question_request(item)
+        if error_response is not None:
+            return Response(
+                {"error": f"Item {index}: {error_response.data['error']}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        params.append(item_params)
+
+    user = request.user
+    semaphore = asyncio.Semaphore(settings.QUESTION_BATCH_CONCURRENCY)
+
+    async def run_item(index, item):
+        num_questions, content_id = params[index]
+        try:
+            async with semaphore:
+                questions, source, quiz_key, difficulty = await resolve_questions(
+                    item.get('content', ''),
+                    num_questions,
+                    item.get('difficulty'),
+                    content_id,
+                    user,
+                    item.get('topic')
+                )
+            return {
+                "index": index, "questions": questions, "source": source,
+                "quiz_key": quiz_key, "difficulty": difficulty,
+            }
+        except Exception as e:
+            logger.error(f"Error generating questions for batch item {index}: {str(e)}")
+            return {"index": index, "error": f"Failed to generate questions: {str(e)}"}
+
+    tasks = [run_item(index, item) for index, item in enumerate(items)]
+
+    if not request.data.get('stream', False):
+        results = await asyncio.gather(*tasks)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    async def events():
+        failed = 0
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            if "error" in result:
+                failed += 1
+                yield sse_event("error", result)
+            else:
+                yield sse_event("result", result)
+        yield sse_event("done", {"succeeded": len(tasks) - failed, "failed": failed})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@drf_api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def user_contents(request):
+async def user_contents(request):
     """
     Retrieve all GeneratedContent objects related to the authenticated user.
     
-    This endpoint returns all educational content generated by the current user.
+    This endpoint returns all educational content requested by the current user.
     """
     try:
         # Get the current authenticated user
         user = request.user
         
-        # Retrieve all GeneratedContent objects for this user
-        contents = GeneratedContent.objects.filter(user=user)
+        # Retrieve all GeneratedContent objects linked to this user
+        links = UserContent.objects.filter(user=user).select_related('content')
+        contents = [link.content async for link in links]
         
         # Serialize the data
         serializer = GeneratedContentSerializer(contents, many=True)
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -10,6 +11,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('SECRET_KEY')
+# The test suite runs without a configured key; nothing it signs outlives the run
+if not SECRET_KEY and sys.argv[1:2] == ['test']:
+    SECRET_KEY = 'insecure-test-only-key'
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
@@ -19,6 +23,138 @@ ALLOWED_HOSTS = []
 # API Keys
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 YOUTUBE_API_KEY = os.getenv('YOUTUBE_API_KEY')
+# URL of a local Gemini/YouTube stand-in (python -m benchmarks.standin) to use instead of
+# the real APIs; the clients read it from the environment
+API_STANDIN_URL = os.getenv('API_STANDIN_URL')
+
+# Content generation
+# Seconds a request waits for an identical in-flight generation before giving up
+CONTENT_GENERATION_INFLIGHT_TIMEOUT = float(os.getenv('CONTENT_GENERATION_INFLIGHT_TIMEOUT', 120))
+# "fast" generates content in one model call, "quality" analyzes the topic in a separate call first,
+# "sections" generates each section in its own concurrent call after the analysis; its
+# concurrency is set with the CONTENT_SECTION_CONCURRENCY environment variable
+CONTENT_GENERATION_MODE = os.getenv('CONTENT_GENERATION_MODE', 'fast')
+# Minimum similarity (0-1) for a stored topic to be served as a near match.
+# Only spacing variants of a topic ("photo synthesis") are matched unless
+# CONTENT_TOPIC_FUZZY_MATCH is set, which also serves misspellings and other
+# topics above the threshold that don't differ in a number or a negated word
+CONTENT_TOPIC_MATCH_THRESHOLD = float(os.getenv('CONTENT_TOPIC_MATCH_THRESHOLD', 0.9))
+CONTENT_TOPIC_FUZZY_MATCH = os.getenv('CONTENT_TOPIC_FUZZY_MATCH', 'false').lower() == 'true'
+
+# Content generation job queue (see the run_content_workers command)
+CONTENT_JOB_WORKERS = int(os.getenv('CONTENT_JOB_WORKERS', 2))
+CONTENT_JOB_POLL_INTERVAL = float(os.getenv('CONTENT_JOB_POLL_INTERVAL', 1.0))
+# Seconds a worker holds a job before it is considered crashed and the job is reclaimed
+CONTENT_JOB_LEASE_SECONDS = int(os.getenv('CONTENT_JOB_LEASE_SECONDS', 300))
+CONTENT_JOB_MAX_ATTEMPTS = int(os.getenv('CONTENT_JOB_MAX_ATTEMPTS', 3))
+
+# Generated question cache
+# Seconds a cached question set is served before it is regenerated
+QUESTION_CACHE_TTL = int(os.getenv('QUESTION_CACHE_TTL', 7 * 24 * 3600))
+# Maximum question sets kept in the database, least recently used are evicted first
+QUESTION_CACHE_MAX_ENTRIES = int(os.getenv('QUESTION_CACHE_MAX_ENTRIES', 10000))
+# Seconds between evictions of expired and excess question sets by a process
+QUESTION_CACHE_EVICT_INTERVAL = int(os.getenv('QUESTION_CACHE_EVICT_INTERVAL', 300))
+# Question sets kept in each process's in-memory cache
+QUESTION_CACHE_MEMORY_ENTRIES = int(os.getenv('QUESTION_CACHE_MEMORY_ENTRIES', 256))
+
+# Question bank pre-generated for every section of new content
+QUESTION_BANK_ENABLED = os.getenv('QUESTION_BANK_ENABLED', 'true').lower() == 'true'
+QUESTION_BANK_DIFFICULTIES = ['beginner', 'intermediate', 'advanced']
+# Questions generated per section and difficulty when content is stored
+QUESTION_BANK_PER_SECTION = int(os.getenv('QUESTION_BANK_PER_SECTION', 5))
+# Questions added per section when a user has few unseen questions left
+QUESTION_BANK_TOP_UP = int(os.getenv('QUESTION_BANK_TOP_UP', 3))
+QUESTION_BANK_LOW_WATERMARK = int(os.getenv('QUESTION_BANK_LOW_WATERMARK', 10))
+# Most questions a section's bank holds per difficulty; top-ups stop there
+QUESTION_BANK_MAX_PER_SECTION = int(os.getenv('QUESTION_BANK_MAX_PER_SECTION', 20))
+# Background threads filling banks, and concurrent model calls per bank
+QUESTION_BANK_WORKERS = int(os.getenv('QUESTION_BANK_WORKERS', 2))
+QUESTION_BANK_CONCURRENCY = int(os.getenv('QUESTION_BANK_CONCURRENCY', 4))
+# Banks whose near-duplicate index is kept in memory
+QUESTION_BANK_INDEXES = int(os.getenv('QUESTION_BANK_INDEXES', 512))
+
+# Most questions one quiz request can ask for
+QUESTION_MAX_PER_QUIZ = int(os.getenv('QUESTION_MAX_PER_QUIZ', 20))
+
+# Batch question generation
+QUESTION_BATCH_MAX_ITEMS = int(os.getenv('QUESTION_BATCH_MAX_ITEMS', 50))
+# Items of one batch generated at the same time
+QUESTION_BATCH_CONCURRENCY = int(os.getenv('QUESTION_BATCH_CONCURRENCY', 8))
+
+# Quiz attempts
+# Attempts and topic scores returned per page when no limit is given
+QUIZ_ATTEMPTS_PAGE_SIZE = int(os.getenv('QUIZ_ATTEMPTS_PAGE_SIZE', 20))
+
+# Leaderboards
+# Leaderboards kept ranked in each process's memory
+LEADERBOARD_BOARDS = int(os.getenv('LEADERBOARD_BOARDS', 256))
+# Seconds before a leaderboard in memory is rebuilt from the database
+LEADERBOARD_REBUILD_SECONDS = int(os.getenv('LEADERBOARD_REBUILD_SECONDS', 3600))
+# Seconds of entries re-read on each sync, to catch attempts whose transaction committed late
+LEADERBOARD_SYNC_LAG = int(os.getenv('LEADERBOARD_SYNC_LAG', 10))
+
+# Skill ratings, used to pick a difficulty when a request does not give one
+SKILL_INITIAL_RATING = float(os.getenv('SKILL_INITIAL_RATING', 1000))
+# Rating of each difficulty level (a user rated at the initial rating gets intermediate),
+# and the rating change per question answered
+SKILL_LEVEL_RATINGS = {'beginner': 650.0, 'intermediate': 850.0, 'advanced': 1050.0}
+SKILL_K_FACTOR = float(os.getenv('SKILL_K_FACTOR', 8))
+# Share of questions a user should answer correctly at the suggested difficulty
+SKILL_TARGET_SUCCESS = float(os.getenv('SKILL_TARGET_SUCCESS', 0.7))
+# Ratings kept in each process's memory, and seconds before they are re-read
+SKILL_CACHE_ENTRIES = int(os.getenv('SKILL_CACHE_ENTRIES', 10000))
+SKILL_CACHE_TTL = int(os.getenv('SKILL_CACHE_TTL', 3600))
+# Seconds between writes of changed ratings to the database
+SKILL_FLUSH_SECONDS = float(os.getenv('SKILL_FLUSH_SECONDS', 5))
+
+# YouTube video search cache
+# Seconds cached search results are served as they are
+VIDEO_CACHE_TTL = int(os.getenv('VIDEO_CACHE_TTL', 24 * 3600))
+# Seconds after that they are still served while being refreshed in the background
+VIDEO_CACHE_STALE_SECONDS = int(os.getenv('VIDEO_CACHE_STALE_SECONDS', 7 * 24 * 3600))
+# Topics kept in each process's in-memory cache
+VIDEO_CACHE_MEMORY_ENTRIES = int(os.getenv('VIDEO_CACHE_MEMORY_ENTRIES', 1024))
+# Background threads refreshing stale results, and seconds before a YouTube call times out
+VIDEO_REFRESH_WORKERS = int(os.getenv('VIDEO_REFRESH_WORKERS', 2))
+VIDEO_API_TIMEOUT = float(os.getenv('VIDEO_API_TIMEOUT', 10))
+# Video details (duration, statistics, embeddability) kept in each process's memory
+VIDEO_DETAILS_ENTRIES = int(os.getenv('VIDEO_DETAILS_ENTRIES', 10000))
+# Serve searches from the full-text index of every video fetched so far
+# (SQLite only) when it has at least the requested number of strong matches
+VIDEO_INDEX_ENABLED = os.getenv('VIDEO_INDEX_ENABLED', 'true').lower() == 'true'
+
+# YouTube quota, in API units per day (search.list costs 100, videos.list 1)
+VIDEO_QUOTA_DAILY = int(os.getenv('VIDEO_QUOTA_DAILY', 10000))
+# Units kept for searches users are waiting on; background refreshes and
+# video details stop when less than this is left
+VIDEO_QUOTA_RESERVE = int(os.getenv('VIDEO_QUOTA_RESERVE', 1000))
+# YouTube calls per second allowed by each process, with bursts of up to
+# VIDEO_API_BURST; 0 for no limit. A call waits at most VIDEO_API_MAX_WAIT for its turn
+VIDEO_API_RATE = float(os.getenv('VIDEO_API_RATE', 5))
+VIDEO_API_BURST = int(os.getenv('VIDEO_API_BURST', 10))
+VIDEO_API_MAX_WAIT = float(os.getenv('VIDEO_API_MAX_WAIT', 2))
+# Similarity a cached topic needs to be served for another topic when YouTube can't be called
+VIDEO_RELATED_MATCH_THRESHOLD = float(os.getenv('VIDEO_RELATED_MATCH_THRESHOLD', 0.75))
+
+# Video searches for a topic and its sections started while its content is generated
+VIDEO_PREFETCH_ENABLED = os.getenv('VIDEO_PREFETCH_ENABLED', 'true').lower() == 'true'
+# Background threads running them, searches per generation, and searches
+# queued per process before more are dropped
+VIDEO_PREFETCH_WORKERS = int(os.getenv('VIDEO_PREFETCH_WORKERS', 2))
+VIDEO_PREFETCH_MAX_TOPICS = int(os.getenv('VIDEO_PREFETCH_MAX_TOPICS', 8))
+VIDEO_PREFETCH_MAX_PENDING = int(os.getenv('VIDEO_PREFETCH_MAX_PENDING', 64))
+# Videos fetched per search, the video-links default
+VIDEO_PREFETCH_RESULTS = int(os.getenv('VIDEO_PREFETCH_RESULTS', 5))
+# Quota units prefetch searches can spend per day, out of VIDEO_QUOTA_DAILY
+VIDEO_PREFETCH_QUOTA_DAILY = int(os.getenv('VIDEO_PREFETCH_QUOTA_DAILY', 2000))
+
+# Batch video search
+VIDEO_BATCH_MAX_TOPICS = int(os.getenv('VIDEO_BATCH_MAX_TOPICS', 50))
+# Topics of one batch searched at the same time
+VIDEO_BATCH_CONCURRENCY = int(os.getenv('VIDEO_BATCH_CONCURRENCY', 8))
+# Seconds video IDs are collected before they are looked up together
+VIDEO_ENRICH_WINDOW = float(os.getenv('VIDEO_ENRICH_WINDOW', 0.05))
 
 # Application definition
 INSTALLED_APPS = [
@@ -51,6 +187,9 @@ MIDDLEWARE = [
 # CORS Settings
 CORS_ALLOW_ALL_ORIGINS = True  # For development only, don't use in production
 
+# Let the frontend read how generated content, questions and videos were served
+CORS_EXPOSE_HEADERS = ['X-Content-Match', 'X-Question-Cache', 'X-Video-Cache']
+
 # For production, specify allowed origins:
 # CORS_ALLOWED_ORIGINS = [
 #     "http://localhost:3000",
@@ -83,6 +222,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Wait for locks held by the content workers instead of failing immediately,
+        # and take the write lock when a transaction starts, so a transaction
+        # that reads before it writes can't fail to upgrade its lock
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
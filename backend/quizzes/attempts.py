@@ -0,0 +1,235 @@
+import logging
+import secrets
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from content_generation.models import GeneratedContent
+from content_generation.topics import normalize_topic
+from user_profiles.models import CustomUser
+from .leaderboards import attempt_boards
+from .models import LeaderboardEntry, QuizAttempt, ServedQuiz, TopicScore
+from .skills import skill_ratings
+
+logger = logging.getLogger(__name__)
+
+_OPTIONS = ('a', 'b', 'c', 'd')
+
+# Fields of a served question that are only kept on the server
+_ANSWER_FIELDS = ('answer_option', 'answer_string')
+
+
+def _option(value):
+    return str(value or '').strip().lower()[:1]
+
+
+def _running_mean(count_field, mean_field, score):
+    """
+    The mean after adding score, computed by the database from the current
+    row so concurrent updates cannot overwrite each other
+    """
+    return ExpressionWrapper(
+        F(mean_field) + (Value(score) - F(mean_field)) / (F(count_field) + Value(1.0)),
+        output_field=FloatField()
+    )
+
+
+def quiz_questions(questions):
+    """
+    The questions of a quiz as sent to the user, without their answers
+    """
+    return [
+        {name: value for name, value in question.items() if name not in _ANSWER_FIELDS}
+        for question in questions
+    ]
+
+
+def serve_quiz(user, questions, difficulty, content_id=None, topic=''):
+    """
+    Store a quiz served to user, so one attempt can be submitted for it.
+
+    Returns the quiz_key the attempt is submitted with, or None for an
+    anonymous user, who can't submit attempts.
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    content = None
+    if content_id is not None:
+        content = GeneratedContent.objects.filter(id=content_id).first()
+    served = ServedQuiz.objects.create(
+        key=secrets.token_urlsafe(24),
+        user=user,
+        content=content,
+        topic=content.topic if content is not None else str(topic or '').strip()[:255],
+        difficulty=difficulty,
+        questions=list(questions),
+    )
+    return served.key
+
+
+aserve_quiz = sync_to_async(serve_quiz)
+
+
+def score_answers(questions, answers):
+    """
+    Score answers to the questions of a served quiz, each given as
+    {"index" or "question_id", "answer_option"}.
+
+    Every question of the quiz is scored and unanswered ones count as
+    wrong. Raises ValueError for an answer to a question not in the quiz.
+    """
+    index_by_id = {
+        question['id']: index for index, question in enumerate(questions) if 'id' in question
+    }
+    answer_by_index = {}
+    for answer in answers:
+        try:
+            if answer.get('index') is not None:
+                index = int(answer['index'])
+            else:
+                index = index_by_id[int(answer['question_id'])]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Each answer needs the index or question_id of a question in the quiz")
+        if not 0 <= index < len(questions):
+            raise ValueError(f"The quiz has no question {index}")
+        answer_by_index[index] = _option(answer.get('answer_option'))
+
+    scored = []
+    for index, question in enumerate(questions):
+        answer_option = answer_by_index.get(index, '')
+        correct_option = _option(question.get('answer_option'))
+        scored_answer = {'index': index}
+        if 'id' in question:
+            scored_answer['question_id'] = question['id']
+        scored_answer.update(
+            answer_option=answer_option,
+            correct_option=correct_option,
+            correct=answer_option in _OPTIONS and answer_option == correct_option,
+        )
+        scored.append(scored_answer)
+    return scored
+
+
+def _increment_or_create(model, lookup, fields, values):
+    """
+    Apply the F-expression updates in fields to the row matching lookup,
+    or create it with values if it does not exist yet
+    """
+    rows = model.objects.filter(**lookup)
+    if rows.update(**fields):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **values)
+    except IntegrityError:
+        # A concurrent attempt created the row first
+        rows.update(**fields)
+
+
+def _update_topic_score(user, topic, topic_key, score, now):
+    _increment_or_create(
+        TopicScore,
+        dict(user=user, topic_key=topic_key),
+        dict(
+            attempts=F('attempts') + 1,
+            average_score=_running_mean('attempts', 'average_score', score),
+            best_score=Greatest(F('best_score'), Value(score)),
+            last_attempt_at=now,
+        ),
+        dict(topic=topic, attempts=1, average_score=score, best_score=score, last_attempt_at=now),
+    )
+
+
+def _update_leaderboards(user, topic_key, correct, score, now):
+    for board in attempt_boards(topic_key, now):
+        _increment_or_create(
+            LeaderboardEntry,
+            dict(board=board, user=user),
+            dict(
+                points=F('points') + correct,
+                attempts=F('attempts') + 1,
+                total_score=F('total_score') + score,
+                updated_at=now,
+            ),
+            dict(points=correct, attempts=1, total_score=score),
+        )
+
+
+def record_attempt(user, topic, content, difficulty, scored, served=None):
+    """
+    Store a scored attempt and update the user's totals, topic score,
+    leaderboard entries and skill ratings.
+
+    The attempt claims the served quiz it answers, and is not recorded if
+    another attempt claimed it first. The user's average score is updated
+    as a running mean in a single UPDATE, so concurrent submissions are
+    all counted.
+    """
+    total = len(scored)
+    if total == 0:
+        raise ValueError("An attempt needs at least one answer")
+    correct = sum(1 for answer in scored if answer['correct'])
+    score = 100.0 * correct / total
+    now = timezone.now()
+    topic_key = normalize_topic(topic)
+
+    with transaction.atomic():
+        if served is not None:
+            claimed = ServedQuiz.objects.filter(id=served.id, submitted_at__isnull=True).update(submitted_at=now)
+            if not claimed:
+                raise ValueError("An attempt was already submitted for this quiz")
+        attempt = QuizAttempt.objects.create(
+            user=user,
+            content=content,
+            topic=topic,
+            topic_key=topic_key,
+            difficulty=difficulty,
+            total_questions=total,
+            correct_answers=correct,
+            score=score,
+            answers=scored,
+        )
+        CustomUser.objects.filter(id=user.id).update(
+            tests_taken=F('tests_taken') + 1,
+            average_score=_running_mean('tests_taken', 'average_score', score),
+        )
+        _update_topic_score(user, topic, topic_key, score, now)
+        _update_leaderboards(user, topic_key, correct, score, now)
+        transaction.on_commit(
+            lambda: skill_ratings.record(user.id, topic_key, difficulty, total, correct)
+        )
+
+    logger.info(f"Recorded quiz attempt {attempt.id} for user {user.id}: {score:.0f}% on '{topic}'")
+    return attempt
+
+
+def submit_attempt(user, data):
+    """
+    Score and record a quiz submission, given as {"quiz_key", "topic"
+    (optional), "answers": [{"index" or "question_id", "answer_option"}]}.
+
+    quiz_key is the key returned with the quiz when it was served to the
+    user, and each served quiz takes one attempt. Raises ValueError for an
+    invalid submission.
+    """
+    answers = data.get('answers')
+    if not isinstance(answers, list) or not answers:
+        raise ValueError("answers must be a non-empty list")
+    if not all(isinstance(answer, dict) for answer in answers):
+        raise ValueError("Each answer must be an object")
+
+    quiz_key = data.get('quiz_key')
+    if not quiz_key:
+        raise ValueError("quiz_key is required")
+    served = ServedQuiz.objects.filter(key=str(quiz_key), user=user).select_related('content').first()
+    if served is None:
+        raise ValueError("This quiz was not served to you")
+    if served.submitted_at is not None:
+        raise ValueError("An attempt was already submitted for this quiz")
+
+    scored = score_answers(served.questions, answers)
+    topic = served.topic or str(data.get('topic') or '').strip()
+    if not topic:
+        raise ValueError("A topic is required for this quiz")
+    return record_attempt(user, topic, served.content, served.difficulty, scored, served)
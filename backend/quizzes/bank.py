@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import random
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from content_generation.chunking import section_text
+from content_generation.models import GeneratedContent
+from content_generation.near_duplicates import QuestionIndex
+from content_generation.question_generation import QuestionGeneratorAgent
+from .cache import LRUCache
+from .models import BankQuestion, SeenQuestion
+
+logger = logging.getLogger(__name__)
+
+# Background threads that fill question banks off the request path
+_bank_executor = ThreadPoolExecutor(
+    max_workers=settings.QUESTION_BANK_WORKERS, thread_name_prefix="question-bank"
+)
+# Contents whose bank is being filled, so a bank is not filled twice at once
+_filling = set()
+_filling_lock = threading.Lock()
+
+# Near-duplicate indexes over the questions in each bank, by (content id, difficulty)
+_bank_indexes = LRUCache(settings.QUESTION_BANK_INDEXES, settings.QUESTION_CACHE_TTL)
+
+# Question difficulties clients send, mapped to the bank's difficulties
+_DIFFICULTY_ALIASES = {
+    "easy": "beginner",
+    "medium": "intermediate",
+    "hard": "advanced",
+}
+
+
+def bank_difficulty(difficulty):
+    """
+    Return the bank difficulty for a requested one, or None if there is none
+    """
+    difficulty = str(difficulty).strip().lower()
+    difficulty = _DIFFICULTY_ALIASES.get(difficulty, difficulty)
+    return difficulty if difficulty in settings.QUESTION_BANK_DIFFICULTIES else None
+
+
+def bank_index(content_id, difficulty):
+    """
+    Return the near-duplicate index of a bank, synced with its stored questions
+    """
+    key = (content_id, difficulty)
+    index = _bank_indexes.get(key)
+    if index is None:
+        index = QuestionIndex(QuestionGeneratorAgent.duplicate_threshold)
+        _bank_indexes.set(key, index)
+    # Pick up questions stored since the last sync, including by other processes
+    since = index.sync_since()
+    index.sync(
+        BankQuestion.objects.filter(content_id=content_id, difficulty=difficulty, id__gt=since)
+        .order_by('id'),
+        since,
+    )
+    return index
+
+
+def _section_shortfalls(content, difficulties, top_up):
+    """
+    Return (section_index, section, difficulty, count) for every section
+    and difficulty whose bank needs more questions
+    """
+    sections = content.content.get('sections', []) if isinstance(content.content, dict) else []
+    counts = defaultdict(int)
+    rows = BankQuestion.objects.filter(content=content, difficulty__in=difficulties)
+    for section_index, difficulty in rows.values_list('section_index', 'difficulty'):
+        counts[section_index, difficulty] += 1
+
+    shortfalls = []
+    for section_index, section in enumerate(sections):
+        for difficulty in difficulties:
+            banked = counts[section_index, difficulty]
+            if top_up:
+                count = settings.QUESTION_BANK_TOP_UP
+            else:
+                count = settings.QUESTION_BANK_PER_SECTION - banked
+            # However many users have run out of unseen questions, a bank
+            # never grows past its maximum size
+            count = min(count, settings.QUESTION_BANK_MAX_PER_SECTION - banked)
+            if count > 0:
+                shortfalls.append((section_index, section, difficulty, count))
+    return shortfalls
+
+
+def _store_section_questions(content, section_index, section, difficulty, questions):
+    index = bank_index(content.id, difficulty)
+    rows = []
+    for question in questions:
+        answer_option = question.answer_option.strip().lower()[:1]
+        # Another section may have stored a near-duplicate in the meantime
+        if answer_option not in ('a', 'b', 'c', 'd') or index.find_duplicate(question) is not None:
+            continue
+        rows.append(BankQuestion(
+            content=content,
+            section_index=section_index,
+            section_title=section.get('title', '')[:255],
+            difficulty=difficulty,
+            question=question.question,
+            option_a=question.option_a,
+            option_b=question.option_b,
+            option_c=question.option_c,
+            option_d=question.option_d,
+            answer_option=answer_option,
+        ))
+    BankQuestion.objects.bulk_create(rows)
+    bank_index(content.id, difficulty)
+    return len(rows)
+
+
+async def afill_question_bank(content_id, difficulties=None, top_up=False):
+    """
+    Generate the missing bank questions for every section of a content.
+
+    By default each section is filled up to QUESTION_BANK_PER_SECTION
+    questions per difficulty; with top_up, QUESTION_BANK_TOP_UP more are
+    added to every section. No section gets more than
+    QUESTION_BANK_MAX_PER_SECTION. Sections are generated concurrently, at
+    most QUESTION_BANK_CONCURRENCY at a time.
+    """
+    difficulties = difficulties or settings.QUESTION_BANK_DIFFICULTIES
+    content = await GeneratedContent.objects.filter(id=content_id).afirst()
+    if content is None:
+        return 0
+    shortfalls = await sync_to_async(_section_shortfalls)(content, difficulties, top_up)
+
+    agent = QuestionGeneratorAgent()
+    semaphore = asyncio.Semaphore(settings.QUESTION_BANK_CONCURRENCY)
+
+    async def fill_section(section_index, section, difficulty, count):
+        try:
+            async with semaphore:
+                questions = await agent.generate_questions(
+                    section_text(section),
+                    num_questions=count,
+                    difficulty=difficulty,
+                    exclude=await sync_to_async(bank_index)(content_id, difficulty)
+                )
+        except Exception as e:
+            logger.error(f"Error generating bank questions for content {content_id}, section {section_index}: {str(e)}")
+            return 0
+        return await sync_to_async(_store_section_questions)(
+            content, section_index, section, difficulty, questions
+        )
+
+    stored = await asyncio.gather(*[fill_section(*shortfall) for shortfall in shortfalls])
+    if shortfalls:
+        logger.info(f"Added {sum(stored)} questions to the bank for content {content_id}")
+    return sum(stored)
+
+
+def fill_question_bank(content_id, difficulties=None, top_up=False):
+    """
+    Sync version of afill_question_bank
+    """
+    try:
+        return async_to_sync(afill_question_bank)(content_id, difficulties, top_up)
+    finally:
+        close_old_connections()
+
+
+def schedule_question_bank(content_id, difficulties=None, top_up=False):
+    """
+    Fill a content's question bank in the background.
+
+    Does nothing if the bank is disabled or is already being filled.
+    """
+    if not settings.QUESTION_BANK_ENABLED:
+        return
+    with _filling_lock:
+        if content_id in _filling:
+            return
+        _filling.add(content_id)
+
+    def run():
+        try:
+            fill_question_bank(content_id, difficulties, top_up)
+        except Exception as e:
+            logger.exception(f"Error filling the question bank for content {content_id}: {str(e)}")
+        finally:
+            with _filling_lock:
+                _filling.discard(content_id)
+
+    _bank_executor.submit(run)
+
+
+def _spread(questions, num_questions):
+    """
+    Pick num_questions questions, taking them from each section in turn
+    """
+    by_section = defaultdict(list)
+    for question in questions:
+        by_section[question.section_index].append(question)
+    for section_questions in by_section.values():
+        random.shuffle(section_questions)
+
+    picked = []
+    sections = sorted(by_section)
+    while len(picked) < num_questions and sections:
+        for section_index in list(sections):
+            if not by_section[section_index]:
+                sections.remove(section_index)
+                continue
+            picked.append(by_section[section_index].pop())
+            if len(picked) == num_questions:
+                break
+    return picked
+
+
+def sample_bank_questions(content_id, difficulty, num_questions, user=None):
+    """
+    Assemble a quiz from a content's question bank.
+
+    Questions are spread evenly over the sections and, for an
+    authenticated user, exclude questions they have already been given;
+    the sampled questions are then marked as seen. Returns None if the bank
+    does not hold enough questions, in which case it is topped up in the
+    background. It is also topped up when few unseen questions remain,
+    until it reaches its maximum size.
+    """
+    available = BankQuestion.objects.filter(content_id=content_id, difficulty=difficulty)
+    if user is not None and user.is_authenticated:
+        available = available.exclude(seen_by__user=user)
+    available = list(available)
+
+    remaining = len(available) - num_questions
+    if remaining < settings.QUESTION_BANK_LOW_WATERMARK:
+        banked = BankQuestion.objects.filter(content_id=content_id, difficulty=difficulty).exists()
+        schedule_question_bank(content_id, [difficulty], top_up=banked)
+    if remaining < 0:
+        return None
+
+    picked = _spread(available, num_questions)
+    if user is not None and user.is_authenticated:
+        SeenQuestion.objects.bulk_create(
+            [SeenQuestion(user=user, question=question) for question in picked],
+            ignore_conflicts=True
+        )
+    return picked
+
+
+asample_bank_questions = sync_to_async(sample_bank_questions)
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Hashable, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .models import QuestionSet
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    A thread-safe in-process LRU cache whose entries expire after ttl seconds
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Most recently used question sets, in front of the QuestionSet table
+question_memory_cache = LRUCache(
+    settings.QUESTION_CACHE_MEMORY_ENTRIES, settings.QUESTION_CACHE_TTL
+)
+
+
+def normalize_content(content) -> str:
+    """
+    Normalize the content questions are generated from, so that the same
+    content sent with different formatting maps to the same cache key
+    """
+    if isinstance(content, (dict, list)):
+        content = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    return " ".join(str(content).split())
+
+
+def question_cache_key(content, num_questions, difficulty) -> str:
+    """
+    Return the cache key of a question set
+    """
+    key = f"{num_questions}\x00{str(difficulty).strip().lower()}\x00{normalize_content(content)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _expires_before():
+    return timezone.now() - timedelta(seconds=settings.QUESTION_CACHE_TTL)
+
+
+def _remaining_ttl(question_set: QuestionSet) -> float:
+    age = (timezone.now() - question_set.created_at).total_seconds()
+    return max(settings.QUESTION_CACHE_TTL - age, 0)
+
+
+def get_cached_questions(cache_key):
+    """
+    Look up a cached question set.
+
+    Returns (questions, source) where source is "memory" or "database", or
+    (None, None) if the questions are not cached or have expired.
+    """
+    questions = question_memory_cache.get(cache_key)
+    if questions is not None:
+        return questions, "memory"
+
+    question_set = QuestionSet.objects.filter(
+        cache_key=cache_key, created_at__gte=_expires_before()
+    ).first()
+    if question_set is None:
+        return None, None
+
+    QuestionSet.objects.filter(id=question_set.id).update(
+        hits=F('hits') + 1, last_used_at=timezone.now()
+    )
+    question_memory_cache.set(cache_key, question_set.questions, _remaining_ttl(question_set))
+    return question_set.questions, "database"
+
+
+def store_questions(cache_key, num_questions, difficulty, questions):
+    """
+    Cache a newly generated question set, evicting old ones if an eviction
+    is due
+    """
+    question_memory_cache.set(cache_key, questions)
+    now = timezone.now()
+    # A single upsert statement, so concurrent stores don't contend for a write lock
+    QuestionSet.objects.bulk_create(
+        [QuestionSet(
+            cache_key=cache_key, num_questions=num_questions, difficulty=difficulty,
+            questions=questions, created_at=now, last_used_at=now,
+        )],
+        update_conflicts=True,
+        unique_fields=['cache_key'],
+        update_fields=['num_questions', 'difficulty', 'questions', 'created_at', 'last_used_at'],
+    )
+    evict_questions_if_due()
+
+
+# When question sets were last evicted by this process, from time.monotonic()
+_last_eviction = None
+_eviction_lock = threading.Lock()
+
+
+def evict_questions_if_due():
+    """
+    Evict question sets if this process hasn't in the last
+    QUESTION_CACHE_EVICT_INTERVAL seconds and isn't already. Returns
+    whether it did.
+    """
+    global _last_eviction
+    if not _eviction_lock.acquire(blocking=False):
+        return False
+    try:
+        now = time.monotonic()
+        if _last_eviction is not None and now - _last_eviction < settings.QUESTION_CACHE_EVICT_INTERVAL:
+            return False
+        _last_eviction = now
+        evict_questions()
+        return True
+    finally:
+        _eviction_lock.release()
+
+
+def evict_questions():
+    """
+    Delete expired question sets, then the least recently used ones beyond
+    QUESTION_CACHE_MAX_ENTRIES
+    """
+    expired, _ = QuestionSet.objects.filter(created_at__lt=_expires_before()).delete()
+    excess = QuestionSet.objects.count() - settings.QUESTION_CACHE_MAX_ENTRIES
+    evicted = 0
+    if excess > 0:
+        stale = QuestionSet.objects.order_by('last_used_at').values_list('id', flat=True)[:excess]
+        evicted, _ = QuestionSet.objects.filter(id__in=list(stale)).delete()
+    if expired or evicted:
+        logger.info(f"Evicted {expired} expired and {evicted} least recently used question sets")
+
+
+# Async counterparts used by the async views
+
+async def aget_cached_questions(cache_key):
+    """
+    Async version of get_cached_questions
+    """
+    questions = question_memory_cache.get(cache_key)
+    if questions is not None:
+        return questions, "memory"
+
+    question_set = await QuestionSet.objects.filter(
+        cache_key=cache_key, created_at__gte=_expires_before()
+    ).afirst()
+    if question_set is None:
+        return None, None
+
+    await QuestionSet.objects.filter(id=question_set.id).aupdate(
+        hits=F('hits') + 1, last_used_at=timezone.now()
+    )
+    question_memory_cache.set(cache_key, question_set.questions, _remaining_ttl(question_set))
+    return question_set.questions, "database"
+
+
+astore_questions = sync_to_async(store_questions)
@@ -0,0 +1,151 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.utils import timezone
+from .cache import LRUCache
+from .models import LeaderboardEntry
+
+WINDOWS = ('all', 'week', 'month')
+
+
+def board_name(window, topic_key=None, when=None):
+    """
+    Return the name of the leaderboard for a time window ("all", "week" or
+    "month") containing when, optionally restricted to a topic.
+
+    Raises ValueError for an unknown window.
+    """
+    when = timezone.localtime(when or timezone.now())
+    if window == 'all':
+        name = 'all'
+    elif window == 'week':
+        year, week, _ = when.isocalendar()
+        name = f"week:{year}-W{week:02d}"
+    elif window == 'month':
+        name = f"month:{when:%Y-%m}"
+    else:
+        raise ValueError(f"Unknown leaderboard window '{window}', expected one of {', '.join(WINDOWS)}")
+    return f"{name}/{topic_key}" if topic_key else name
+
+
+def attempt_boards(topic_key, when):
+    """
+    Return every leaderboard an attempt on topic_key made at when counts towards
+    """
+    return [
+        board_name(window, scope, when)
+        for window in WINDOWS
+        for scope in (None, topic_key)
+    ]
+
+
+class Ranking:
+    """
+    The users of one leaderboard kept in rank order.
+
+    Users are ranked by points, then by fewer attempts, then by id. Keys are
+    held in a sorted list, so a user's rank and any page of the leaderboard
+    are found by bisection instead of sorting or counting rows.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self._keys: List[Tuple[int, int, int]] = []
+        self._entries: Dict[int, Tuple[int, int, float]] = {}
+        self._total_score = 0.0
+        self._total_attempts = 0
+        self.synced_at = None
+
+    @staticmethod
+    def _key(user_id, points, attempts):
+        return (-points, attempts, user_id)
+
+    def set(self, user_id: int, points: int, attempts: int, total_score: float) -> None:
+        with self._lock:
+            old = self._entries.get(user_id)
+            if old is not None:
+                del self._keys[bisect_left(self._keys, self._key(user_id, old[0], old[1]))]
+                self._total_attempts -= old[1]
+                self._total_score -= old[2]
+            insort(self._keys, self._key(user_id, points, attempts))
+            self._entries[user_id] = (points, attempts, total_score)
+            self._total_attempts += attempts
+            self._total_score += total_score
+
+    def sync(self, rows) -> None:
+        """
+        Apply (user_id, points, attempts, total_score, updated_at) rows
+        """
+        for user_id, points, attempts, total_score, updated_at in rows:
+            self.set(user_id, points, attempts, total_score)
+            if self.synced_at is None or updated_at > self.synced_at:
+                self.synced_at = updated_at
+
+    def _entry(self, rank, user_id):
+        points, attempts, total_score = self._entries[user_id]
+        return {
+            'rank': rank,
+            'user_id': user_id,
+            'points': points,
+            'attempts': attempts,
+            'average_score': total_score / attempts if attempts else 0.0,
+        }
+
+    def rank(self, user_id: int) -> Optional[dict]:
+        """
+        Return a user's standing, with their 1-based rank, or None if they
+        are not on the leaderboard
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            position = bisect_left(self._keys, self._key(user_id, entry[0], entry[1]))
+            return self._entry(position + 1, user_id)
+
+    @property
+    def average_score(self) -> float:
+        with self._lock:
+            return self._total_score / self._total_attempts if self._total_attempts else 0.0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    def __getitem__(self, index: slice) -> List[dict]:
+        with self._lock:
+            start, stop, _ = index.indices(len(self._keys))
+            return [
+                self._entry(position + 1, key[2])
+                for position, key in zip(range(start, stop), self._keys[start:stop])
+            ]
+
+
+# Leaderboards read by this process, rebuilt from the database when they expire
+_rankings = LRUCache(settings.LEADERBOARD_BOARDS, settings.LEADERBOARD_REBUILD_SECONDS)
+
+
+def ranking(board):
+    """
+    Return the ranking of a leaderboard, synced with its stored entries.
+
+    A leaderboard is loaded from LeaderboardEntry when first read; after
+    that only the entries updated since the last read are fetched, which
+    also picks up attempts recorded by other processes.
+    """
+    board_ranking = _rankings.get(board)
+    if board_ranking is None:
+        board_ranking = Ranking()
+        _rankings.set(board, board_ranking)
+
+    with board_ranking.sync_lock:
+        rows = LeaderboardEntry.objects.filter(board=board)
+        if board_ranking.synced_at is not None:
+            # Look back a little for entries whose transaction committed late
+            since = board_ranking.synced_at - timedelta(seconds=settings.LEADERBOARD_SYNC_LAG)
+            rows = rows.filter(updated_at__gte=since)
+        board_ranking.sync(rows.values_list('user_id', 'points', 'attempts', 'total_score', 'updated_at'))
+    return board_ranking
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from content_generation.models import GeneratedContent
+from quizzes.bank import fill_question_bank
+
+
+class Command(BaseCommand):
+    help = "Generate the missing question bank questions for stored content"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'content_ids', nargs='*', type=int,
+            help="Contents to fill (all stored content by default)"
+        )
+
+    def handle(self, *args, **options):
+        contents = GeneratedContent.objects.order_by('id')
+        if options['content_ids']:
+            contents = contents.filter(id__in=options['content_ids'])
+
+        for content_id in contents.values_list('id', flat=True):
+            stored = fill_question_bank(content_id)
+            self.stdout.write(f"Content {content_id}: added {stored} question(s)")
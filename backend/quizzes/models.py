@@ -1,3 +1,216 @@
 from django.db import models
 
-# Create your models here.
+
+class QuestionSet(models.Model):
+    """
+    A cached set of generated multiple-choice questions.
+
+    Question sets are keyed by cache_key, a hash of the normalized content
+    the questions were generated from together with the number of questions
+    and the difficulty, so repeat requests for the same quiz are served
+    without calling the model.
+    """
+    cache_key = models.CharField(max_length=64, unique=True)
+    num_questions = models.PositiveIntegerField()
+    difficulty = models.CharField(max_length=20)
+    questions = models.JSONField(help_text="The serialized questions in JSON format")
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Question Set"
+        verbose_name_plural = "Question Sets"
+        ordering = ['-last_used_at']
+
+    def __str__(self):
+        return f"{self.num_questions} {self.difficulty} questions ({self.cache_key[:12]})"
+
+
+class BankQuestion(models.Model):
+    """
+    A question pre-generated from one section of a GeneratedContent.
+
+    Every section of new content gets a bank of questions at each
+    difficulty, so quizzes on stored content can be assembled by sampling
+    the bank instead of calling the model.
+    """
+    content = models.ForeignKey(
+        'content_generation.GeneratedContent', on_delete=models.CASCADE, related_name='bank_questions'
+    )
+    section_index = models.PositiveIntegerField()
+    section_title = models.CharField(max_length=255)
+    difficulty = models.CharField(max_length=20)
+    question = models.TextField()
+    option_a = models.TextField()
+    option_b = models.TextField()
+    option_c = models.TextField()
+    option_d = models.TextField()
+    answer_option = models.CharField(max_length=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Bank Question"
+        verbose_name_plural = "Bank Questions"
+        indexes = [
+            models.Index(fields=['content', 'difficulty', 'section_index']),
+        ]
+        ordering = ['content', 'section_index', 'id']
+
+    @property
+    def answer_string(self):
+        return getattr(self, f"option_{self.answer_option.lower()}", "")
+
+    def __str__(self):
+        return f"{self.question[:50]} ({self.difficulty})"
+
+
+class SeenQuestion(models.Model):
+    """
+    Records that a user has been given a bank question, so it is not
+    sampled for them again
+    """
+    user = models.ForeignKey('user_profiles.CustomUser', on_delete=models.CASCADE, related_name='seen_questions')
+    question = models.ForeignKey(BankQuestion, on_delete=models.CASCADE, related_name='seen_by')
+    seen_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'question']
+
+
+class ServedQuiz(models.Model):
+    """
+    A quiz as it was served to a user, who can submit one attempt for it.
+
+    The questions are kept here with their answers, which are not sent to
+    the user, and the attempt is scored over every one of them. key is the
+    quiz_key the user submits the attempt with.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey('user_profiles.CustomUser', on_delete=models.CASCADE, related_name='served_quizzes')
+    content = models.ForeignKey(
+        'content_generation.GeneratedContent', on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='served_quizzes'
+    )
+    topic = models.CharField(max_length=255, blank=True)
+    difficulty = models.CharField(max_length=20)
+    questions = models.JSONField(help_text="The served questions with their answers")
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the attempt is submitted, so a quiz is only scored once
+    submitted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Served Quiz"
+        verbose_name_plural = "Served Quizzes"
+
+    def __str__(self):
+        return f"{len(self.questions)} {self.difficulty} questions for {self.user}"
+
+
+class QuizAttempt(models.Model):
+    """
+    A user's scored submission of a quiz.
+
+    Answers are scored on the server against the stored questions. Each
+    attempt also updates the user's running totals and their TopicScore,
+    so reading a user's statistics never scans their attempts.
+    """
+    user = models.ForeignKey('user_profiles.CustomUser', on_delete=models.CASCADE, related_name='quiz_attempts')
+    content = models.ForeignKey(
+        'content_generation.GeneratedContent', on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='quiz_attempts'
+    )
+    topic = models.CharField(max_length=255)
+    topic_key = models.CharField(max_length=255, db_index=True)
+    difficulty = models.CharField(max_length=20)
+    total_questions = models.PositiveIntegerField()
+    correct_answers = models.PositiveIntegerField()
+    # Percentage of correct answers, 0-100
+    score = models.FloatField()
+    answers = models.JSONField(help_text="Each answer with the correct option")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Quiz Attempt"
+        verbose_name_plural = "Quiz Attempts"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.user} - {self.topic} ({self.score:.0f}%)"
+
+
+class TopicScore(models.Model):
+    """
+    A user's aggregate results on one topic, updated with every attempt
+    """
+    user = models.ForeignKey('user_profiles.CustomUser', on_delete=models.CASCADE, related_name='topic_scores')
+    topic = models.CharField(max_length=255)
+    topic_key = models.CharField(max_length=255)
+    attempts = models.PositiveIntegerField(default=0)
+    average_score = models.FloatField(default=0.0)
+    best_score = models.FloatField(default=0.0)
+    last_attempt_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Topic Score"
+        verbose_name_plural = "Topic Scores"
+        unique_together = ['user', 'topic_key']
+        ordering = ['-last_attempt_at']
+
+    def __str__(self):
+        return f"{self.user} - {self.topic} ({self.average_score:.0f}%)"
+
+
+class LeaderboardEntry(models.Model):
+    """
+    A user's standing on one leaderboard, updated with every attempt.
+
+    board names a leaderboard: "all", "week:2025-W07" or "month:2025-02",
+    optionally followed by "/" and a topic key for a topic's leaderboard.
+    Users are ranked by points, the number of questions they answered
+    correctly on the board.
+    """
+    board = models.CharField(max_length=300)
+    user = models.ForeignKey('user_profiles.CustomUser', on_delete=models.CASCADE, related_name='leaderboard_entries')
+    points = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    total_score = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Leaderboard Entry"
+        verbose_name_plural = "Leaderboard Entries"
+        unique_together = ['board', 'user']
+        indexes = [
+            models.Index(fields=['board', 'updated_at']),
+        ]
+
+    @property
+    def average_score(self):
+        return self.total_score / self.attempts if self.attempts else 0.0
+
+    def __str__(self):
+        return f"{self.user} on {self.board} ({self.points} points)"
+
+
+class SkillRating(models.Model):
+    """
+    An Elo-style estimate of a user's skill on a topic.
+
+    The row with an empty topic_key holds the user's overall rating. Ratings
+    are updated in memory with every attempt and written here in the
+    background (see quizzes.skills).
+    """
+    user = models.ForeignKey('user_profiles.CustomUser', on_delete=models.CASCADE, related_name='skill_ratings')
+    topic_key = models.CharField(max_length=255, blank=True)
+    rating = models.FloatField()
+    attempts = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Skill Rating"
+        verbose_name_plural = "Skill Ratings"
+        unique_together = ['user', 'topic_key']
+
+    def __str__(self):
+        return f"{self.user} - {self.topic_key or 'overall'} ({self.rating:.0f})"
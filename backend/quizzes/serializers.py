@@ -0,0 +1,38 @@
+from rest_framework import serializers
+from .models import BankQuestion, QuizAttempt, TopicScore
+
+class BankQuestionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for bank questions, in the same shape as generated questions.
+    """
+    answer_string = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = BankQuestion
+        fields = [
+            'id', 'question', 'option_a', 'option_b', 'option_c', 'option_d',
+            'answer_option', 'answer_string', 'section_index', 'section_title',
+        ]
+
+
+class QuizAttemptSerializer(serializers.ModelSerializer):
+    """
+    Serializer for scored quiz attempts.
+    """
+    class Meta:
+        model = QuizAttempt
+        fields = [
+            'id', 'content', 'topic', 'difficulty', 'total_questions',
+            'correct_answers', 'score', 'answers', 'created_at',
+        ]
+        read_only_fields = fields
+
+
+class TopicScoreSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a user's aggregate results on a topic.
+    """
+    class Meta:
+        model = TopicScore
+        fields = ['topic', 'attempts', 'average_score', 'best_score', 'last_attempt_at']
+        read_only_fields = fields
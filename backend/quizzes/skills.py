@@ -0,0 +1,191 @@
+import atexit
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from .bank import bank_difficulty
+from .cache import LRUCache
+from .models import SkillRating
+
+logger = logging.getLogger(__name__)
+
+# Topic key of a user's overall rating
+OVERALL = ''
+
+
+def expected_success(rating, difficulty_rating):
+    """
+    Probability that a user with rating answers a question of
+    difficulty_rating correctly
+    """
+    return 1.0 / (1.0 + 10 ** ((difficulty_rating - rating) / 400.0))
+
+
+def difficulty_rating(difficulty):
+    """
+    The rating of a difficulty, accepting both the content levels and the
+    easy/medium/hard question levels
+    """
+    level = bank_difficulty(difficulty) or 'intermediate'
+    return settings.SKILL_LEVEL_RATINGS[level]
+
+
+class SkillStore:
+    """
+    Per-(user, topic) skill ratings cached in memory with write-behind
+    persistence.
+
+    Each attempt updates the ratings in memory, treating every question as
+    one Elo game against the quiz's difficulty, so an update costs the same
+    however many attempts a user has. Changed ratings are written to
+    SkillRating by a background thread every SKILL_FLUSH_SECONDS, and when
+    the process exits. A topic's first rating starts from the user's
+    overall rating.
+    """
+
+    def __init__(self, max_entries, ttl, flush_interval):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._ratings = LRUCache(max_entries, ttl)
+        # Ratings changed since the last flush, by (user_id, topic_key)
+        self._dirty = {}
+        # Ratings being written by the current flush
+        self._flushing = {}
+        self._flusher = None
+
+    def _entry(self, user_id, topic_key):
+        """
+        Return the [rating, attempts] of a user on a topic, loading it from
+        the database if it is not in memory
+        """
+        key = (user_id, topic_key)
+        with self._lock:
+            entry = self._dirty.get(key) or self._flushing.get(key)
+        if entry is None:
+            entry = self._ratings.get(key)
+        if entry is None:
+            row = (
+                SkillRating.objects.filter(user_id=user_id, topic_key=topic_key)
+                .values_list('rating', 'attempts').first()
+            )
+            entry = list(row) if row else [settings.SKILL_INITIAL_RATING, 0]
+            self._ratings.set(key, entry)
+        return entry
+
+    def rating(self, user_id, topic_key=OVERALL):
+        """
+        Return (rating, attempts) of a user on a topic
+        """
+        entry = self._entry(user_id, topic_key)
+        with self._lock:
+            return tuple(entry)
+
+    def record(self, user_id, topic_key, difficulty, total_questions, correct_answers):
+        """
+        Update a user's topic and overall ratings with a scored attempt
+        """
+        opponent = difficulty_rating(difficulty)
+        overall = self._entry(user_id, OVERALL)
+        entries = [(OVERALL, overall)]
+        if topic_key:
+            entries.append((topic_key, self._entry(user_id, topic_key)))
+
+        with self._lock:
+            for key, entry in entries:
+                if entry[1] == 0 and key != OVERALL:
+                    entry[0] = overall[0]
+            for key, entry in entries:
+                expected = expected_success(entry[0], opponent)
+                entry[0] += settings.SKILL_K_FACTOR * (correct_answers - total_questions * expected)
+                entry[1] += 1
+                self._dirty[user_id, key] = entry
+                self._ratings.set((user_id, key), entry)
+        self._start_flusher()
+
+    def suggest_difficulty(self, user_id, topic_key=OVERALL):
+        """
+        Return the content level ("beginner", "intermediate" or "advanced")
+        at which the user is expected to answer SKILL_TARGET_SUCCESS of the
+        questions correctly, or None if they have no attempts yet.
+
+        Uses the user's topic rating, or their overall rating if they have
+        not taken a quiz on the topic.
+        """
+        rating, attempts = self.rating(user_id, topic_key) if topic_key else (None, 0)
+        if attempts == 0:
+            rating, attempts = self.rating(user_id, OVERALL)
+        if attempts == 0:
+            return None
+        return min(
+            settings.SKILL_LEVEL_RATINGS,
+            key=lambda level: abs(
+                expected_success(rating, settings.SKILL_LEVEL_RATINGS[level]) - settings.SKILL_TARGET_SUCCESS
+            )
+        )
+
+    def flush(self):
+        """
+        Write the ratings changed since the last flush to the database
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._flushing = dirty
+            rows = [
+                SkillRating(user_id=user_id, topic_key=topic_key, rating=entry[0], attempts=entry[1])
+                for (user_id, topic_key), entry in dirty.items()
+            ]
+        if not rows:
+            return 0
+        try:
+            self._write(rows)
+        finally:
+            with self._lock:
+                self._flushing = {}
+        return len(rows)
+
+    def _write(self, rows):
+        try:
+            SkillRating.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'topic_key'],
+                update_fields=['rating', 'attempts', 'updated_at'],
+            )
+        except Exception as e:
+            # Write rows one at a time so one bad row (e.g. a deleted user)
+            # does not lose the others
+            logger.warning(f"Error writing {len(rows)} skill ratings, retrying one by one: {str(e)}")
+            for row in rows:
+                try:
+                    SkillRating.objects.update_or_create(
+                        user_id=row.user_id, topic_key=row.topic_key,
+                        defaults={'rating': row.rating, 'attempts': row.attempts}
+                    )
+                except Exception as e:
+                    logger.error(f"Dropping skill rating of user {row.user_id} on '{row.topic_key}': {str(e)}")
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_forever, name="skill-ratings", daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.exception(f"Error flushing skill ratings: {str(e)}")
+            finally:
+                close_old_connections()
+
+
+skill_ratings = SkillStore(
+    settings.SKILL_CACHE_ENTRIES, settings.SKILL_CACHE_TTL, settings.SKILL_FLUSH_SECONDS
+)
@@ -1,3 +1,375 @@
-from django.test import TestCase
+import os
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from content_generation.models import GeneratedContent
+from content_generation.question_generation import QuestionGeneratorAgent
+from content_generation.schemas import ResponseQuestions
+from user_profiles.models import CustomUser
+from . import bank, cache, leaderboards
+from .attempts import serve_quiz
+from .cache import question_cache_key, question_memory_cache, store_questions
+from .models import BankQuestion, LeaderboardEntry, QuestionSet, QuizAttempt, SkillRating, TopicScore
+from .skills import SkillStore
 
-# Create your tests here.
+
+# The tests never reach Gemini, so a placeholder key stands in for the one read from the environment
+_test_keys = mock.patch.dict(os.environ, {"GEMINI_API_KEY": "test-key"})
+
+
+def setUpModule():
+    _test_keys.start()
+
+
+def tearDownModule():
+    _test_keys.stop()
+
+
+class StoreQuestionsTests(TestCase):
+    def setUp(self):
+        question_memory_cache.clear()
+        patcher = mock.patch.object(cache, '_last_eviction', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_store_upserts_and_keeps_hits(self):
+        store_questions("key", 5, "easy", [{"question": "Old?"}])
+        QuestionSet.objects.filter(cache_key="key").update(hits=3)
+        store_questions("key", 5, "easy", [{"question": "New?"}])
+
+        question_set = QuestionSet.objects.get(cache_key="key")
+        self.assertEqual(question_set.questions, [{"question": "New?"}])
+        self.assertEqual(question_set.hits, 3)
+        self.assertEqual(question_memory_cache.get("key"), [{"question": "New?"}])
+
+    @override_settings(QUESTION_CACHE_EVICT_INTERVAL=3600)
+    def test_eviction_runs_on_an_interval_not_every_store(self):
+        with mock.patch.object(cache, 'evict_questions') as evict:
+            for index in range(5):
+                store_questions(f"key {index}", 5, "easy", [])
+        self.assertEqual(evict.call_count, 1)
+
+    @override_settings(QUESTION_CACHE_MAX_ENTRIES=2, QUESTION_CACHE_EVICT_INTERVAL=0)
+    def test_least_recently_used_sets_are_evicted(self):
+        for index in range(3):
+            store_questions(f"key {index}", 5, "easy", [])
+        self.assertEqual(QuestionSet.objects.count(), 2)
+        self.assertFalse(QuestionSet.objects.filter(cache_key="key 0").exists())
+
+
+class QuestionCacheTests(TestCase):
+    def setUp(self):
+        question_memory_cache.clear()
+        self.client = APIClient()
+
+    def test_key_ignores_formatting_of_the_content(self):
+        self.assertEqual(
+            question_cache_key("Light  bends.\n", 5, "easy"), question_cache_key(" Light bends.", 5, "easy")
+        )
+        self.assertNotEqual(
+            question_cache_key("Light bends.", 5, "easy"), question_cache_key("Light bends.", 5, "hard")
+        )
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        question = ResponseQuestions(
+            question="What bends light?", option_a="Lens", option_b="Rock", option_c="Wood",
+            option_d="Iron", answer_option="a",
+        )
+        sources = []
+        with mock.patch.object(QuestionGeneratorAgent, 'generate_questions', return_value=[question]) as generate:
+            for clear_memory in (False, False, True):
+                if clear_memory:
+                    question_memory_cache.clear()
+                response = self.client.post(
+                    '/api/generate-questions/',
+                    {"content": "Light bends.", "num_questions": 1, "difficulty": "easy"},
+                    format='json',
+                )
+                sources.append(response['X-Question-Cache'])
+
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(sources, ["miss", "memory", "database"])
+        self.assertEqual(QuestionSet.objects.get().hits, 1)
+
+
+@override_settings(QUESTION_BANK_PER_SECTION=2, QUESTION_BANK_TOP_UP=3, QUESTION_BANK_MAX_PER_SECTION=4)
+class BankGrowthTests(TestCase):
+    def setUp(self):
+        self.content = GeneratedContent.objects.create(
+            topic="Optics", difficulty_level="intermediate",
+            content={"sections": [{"title": "Lenses", "content": "Lenses bend light."}]},
+        )
+
+    def _bank(self, count):
+        BankQuestion.objects.bulk_create([
+            BankQuestion(
+                content=self.content, section_index=0, difficulty="beginner", question=f"Question {index}?",
+                option_a="A", option_b="B", option_c="C", option_d="D", answer_option="a",
+            )
+            for index in range(count)
+        ])
+
+    def _shortfalls(self, top_up):
+        return [shortfall[3] for shortfall in bank._section_shortfalls(self.content, ["beginner"], top_up)]
+
+    def test_top_up_stops_at_the_maximum_bank_size(self):
+        self._bank(2)
+        self.assertEqual(self._shortfalls(top_up=True), [2])
+        self._bank(2)
+        self.assertEqual(self._shortfalls(top_up=True), [])
+
+    def test_full_bank_is_not_topped_up_however_often_users_run_out(self):
+        self._bank(4)
+        with mock.patch.object(QuestionGeneratorAgent, 'generate_questions') as generate:
+            for _ in range(3):
+                self.assertEqual(bank.fill_question_bank(self.content.id, ["beginner"], top_up=True), 0)
+        generate.assert_not_called()
+
+
+class BankSamplingTests(TestCase):
+    def setUp(self):
+        self.content = GeneratedContent.objects.create(
+            topic="Optics", difficulty_level="intermediate",
+            content={"sections": [{"title": "Lenses"}, {"title": "Mirrors"}]},
+        )
+        BankQuestion.objects.bulk_create([
+            BankQuestion(
+                content=self.content, section_index=section_index, difficulty="beginner",
+                question=f"Question {section_index}.{index}?", option_a="A", option_b="B",
+                option_c="C", option_d="D", answer_option="a",
+            )
+            for section_index in range(2) for index in range(3)
+        ])
+        self.user = CustomUser.objects.create_user(username="learner", password="pass")
+        patcher = mock.patch.object(bank, 'schedule_question_bank')
+        self.schedule = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_quiz_is_spread_over_sections(self):
+        picked = bank.sample_bank_questions(self.content.id, "beginner", 4, self.user)
+        self.assertEqual(sorted(question.section_index for question in picked), [0, 0, 1, 1])
+
+    def test_questions_a_user_was_given_are_not_repeated(self):
+        first = bank.sample_bank_questions(self.content.id, "beginner", 4, self.user)
+        second = bank.sample_bank_questions(self.content.id, "beginner", 2, self.user)
+        self.assertFalse({question.id for question in first} & {question.id for question in second})
+
+    def test_short_bank_is_topped_up_instead_of_served(self):
+        bank.sample_bank_questions(self.content.id, "beginner", 5, self.user)
+        self.assertIsNone(bank.sample_bank_questions(self.content.id, "beginner", 2, self.user))
+        self.schedule.assert_called_with(self.content.id, ["beginner"], top_up=True)
+
+
+def _question(text, answer_option="a"):
+    return {
+        "question": text, "option_a": "A", "option_b": "B", "option_c": "C", "option_d": "D",
+        "answer_option": answer_option, "answer_string": answer_option.upper(),
+    }
+
+
+class QuizAttemptTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="learner", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        question_memory_cache.clear()
+
+    def _serve(self, user=None):
+        questions = [_question("First?"), _question("Second?", "b"), _question("Third?", "c")]
+        return serve_quiz(user or self.user, questions, "beginner", topic="Optics")
+
+    def _submit(self, quiz_key, answers):
+        return self.client.post(
+            '/api/quiz-attempts/', {"quiz_key": quiz_key, "answers": answers}, format='json'
+        )
+
+    def test_unanswered_questions_count_as_wrong(self):
+        response = self._submit(self._serve(), [{"index": 0, "answer_option": "a"}])
+        self.assertEqual(response.status_code, 201)
+        attempt = QuizAttempt.objects.get()
+        self.assertEqual((attempt.total_questions, attempt.correct_answers), (3, 1))
+
+    def test_quiz_served_to_another_user_is_rejected(self):
+        other = CustomUser.objects.create_user(username="other", password="pass")
+        for quiz_key in (self._serve(other), "made-up"):
+            with self.subTest(quiz_key=quiz_key):
+                response = self._submit(quiz_key, [{"index": 0, "answer_option": "a"}])
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(QuizAttempt.objects.exists())
+
+    def test_quiz_takes_a_single_attempt(self):
+        quiz_key = self._serve()
+        answers = [{"index": index, "answer_option": option} for index, option in enumerate("abc")]
+        self.assertEqual(self._submit(quiz_key, answers).status_code, 201)
+        self.assertEqual(self._submit(quiz_key, answers).status_code, 400)
+
+        self.assertEqual(QuizAttempt.objects.count(), 1)
+        self.assertEqual(TopicScore.objects.get(user=self.user).attempts, 1)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.tests_taken, 1)
+
+    def test_scores_are_kept_as_running_means(self):
+        answers = [{"index": index, "answer_option": option} for index, option in enumerate("abc")]
+        self._submit(self._serve(), answers)
+        self._submit(self._serve(), [{"index": 0, "answer_option": "a"}])
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.tests_taken, 2)
+        self.assertAlmostEqual(self.user.average_score, (100.0 + 100.0 / 3) / 2)
+        score = TopicScore.objects.get(user=self.user, topic_key="optic")
+        self.assertEqual((score.attempts, score.best_score), (2, 100.0))
+        self.assertAlmostEqual(score.average_score, self.user.average_score)
+
+        attempts = self.client.get('/api/quiz-attempts/', {"limit": 1}).json()
+        self.assertEqual((attempts["count"], len(attempts["results"])), (2, 1))
+        self.assertEqual(attempts["results"][0]["correct_answers"], 1)
+        scores = self.client.get('/api/topic-scores/').json()
+        self.assertEqual([score["attempts"] for score in scores["results"]], [2])
+
+    def test_answer_to_a_question_not_in_the_quiz_is_rejected(self):
+        response = self._submit(self._serve(), [{"index": 3, "answer_option": "a"}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_served_questions_leave_out_answers(self):
+        question = ResponseQuestions(
+            question="What bends light?", option_a="Lens", option_b="Rock", option_c="Wood",
+            option_d="Iron", answer_option="a",
+        )
+        with mock.patch.object(QuestionGeneratorAgent, 'generate_questions', return_value=[question]):
+            response = self.client.post(
+                '/api/generate-questions/',
+                {"content": "Light bends.", "num_questions": 1, "difficulty": "easy", "topic": "Optics"},
+                format='json',
+            )
+        data = response.json()
+        self.assertNotIn("answer_option", data["questions"][0])
+        self.assertNotIn("answer_string", data["questions"][0])
+
+        response = self._submit(data["quiz_key"], [{"index": 0, "answer_option": "a"}])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["correct_answers"], 1)
+
+
+class LeaderboardReplayTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="replayer", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        questions = [_question("First?"), _question("Second?", "b")]
+        self.quiz_key = serve_quiz(self.user, questions, "beginner", topic="Replayed optics")
+
+    def _submit(self, answers):
+        return self.client.post(
+            '/api/quiz-attempts/', {"quiz_key": self.quiz_key, "answers": answers}, format='json'
+        )
+
+    def test_replayed_attempts_do_not_inflate_leaderboards(self):
+        self.assertEqual(self._submit([{"index": 0, "answer_option": "a"}]).status_code, 201)
+        # Replays of the same quiz, answered fully or partly, are turned away
+        for answers in ([{"index": 0, "answer_option": "a"}, {"index": 1, "answer_option": "b"}],
+                        [{"index": 1, "answer_option": "b"}]):
+            self.assertEqual(self._submit(answers).status_code, 400)
+
+        entries = LeaderboardEntry.objects.filter(user=self.user)
+        self.assertTrue(entries.exists())
+        for entry in entries:
+            self.assertEqual((entry.points, entry.attempts, entry.total_score), (1, 1, 50.0))
+
+        response = self.client.get('/api/leaderboard/me/', {"topic": "Replayed optics"})
+        self.assertEqual((response.json()["points"], response.json()["attempts"]), (1, 1))
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(leaderboards, '_rankings', cache.LRUCache(8, 60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.users = {}
+        # alice: 3 points in 1 attempt, bob: 3 points in 2 attempts, carol: 1 point
+        for username, results, topic in (
+            ("alice", ["abc"], "Ray optics"),
+            ("bob", ["ab", "a"], "Ray optics"),
+            ("carol", ["a"], "Ray optics"),
+            ("carol", ["abc"], "Mechanics"),
+        ):
+            user = self.users.get(username) or CustomUser.objects.create_user(username=username, password="pass")
+            self.users[username] = user
+            self.client.force_authenticate(user)
+            for options in results:
+                questions = [_question("First?"), _question("Second?", "b"), _question("Third?", "c")]
+                answers = [{"index": index, "answer_option": option} for index, option in enumerate(options)]
+                response = self.client.post(
+                    '/api/quiz-attempts/',
+                    {"quiz_key": serve_quiz(user, questions, "beginner", topic=topic), "answers": answers},
+                    format='json',
+                )
+                self.assertEqual(response.status_code, 201)
+
+    def test_users_are_ranked_by_points_then_fewer_attempts(self):
+        board = self.client.get('/api/leaderboard/', {"topic": "ray optics"}).json()
+        self.assertEqual(board["board"], "all/ray optic")
+        self.assertEqual([entry["username"] for entry in board["results"]], ["alice", "bob", "carol"])
+        self.assertEqual([entry["rank"] for entry in board["results"]], [1, 2, 3])
+
+        page = self.client.get('/api/leaderboard/', {"topic": "Ray Optics", "limit": 1, "offset": 1}).json()
+        self.assertEqual((page["count"], [entry["username"] for entry in page["results"]]), (3, ["bob"]))
+
+        overall = self.client.get('/api/leaderboard/', {"window": "week"}).json()
+        self.assertEqual([entry["username"] for entry in overall["results"]], ["carol", "alice", "bob"])
+
+    def test_my_rank_reports_the_users_standing(self):
+        self.client.force_authenticate(self.users["bob"])
+        standing = self.client.get('/api/leaderboard/me/', {"topic": "Ray optics"}).json()
+        self.assertEqual(
+            (standing["rank"], standing["points"], standing["attempts"], standing["participants"]),
+            (2, 3, 2, 3),
+        )
+        self.assertAlmostEqual(standing["average_score"], 50.0)
+
+        self.client.force_authenticate(CustomUser.objects.create_user(username="newcomer", password="pass"))
+        standing = self.client.get('/api/leaderboard/me/').json()
+        self.assertEqual((standing["rank"], standing["points"], standing["participants"]), (None, 0, 3))
+
+    def test_unknown_window_is_rejected(self):
+        for path in ('/api/leaderboard/', '/api/leaderboard/me/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path, {"window": "decade"}).status_code, 400)
+
+
+class SkillRatingTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="learner", password="pass")
+        self.store = SkillStore(100, 3600, 3600)
+        patcher = mock.patch.object(self.store, '_start_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_difficulty_follows_results(self):
+        self.assertIsNone(self.store.suggest_difficulty(self.user.id, "optic"))
+        for _ in range(15):
+            self.store.record(self.user.id, "optic", "intermediate", 10, 10)
+        self.assertEqual(self.store.suggest_difficulty(self.user.id, "optic"), "advanced")
+        for _ in range(15):
+            self.store.record(self.user.id, "optic", "beginner", 10, 0)
+        self.assertEqual(self.store.suggest_difficulty(self.user.id, "optic"), "beginner")
+
+    def test_new_topic_starts_from_the_overall_rating(self):
+        for _ in range(5):
+            self.store.record(self.user.id, "optic", "advanced", 10, 10)
+        overall, _ = self.store.rating(self.user.id)
+        self.store.record(self.user.id, "sound", "advanced", 10, 5)
+        sound, attempts = self.store.rating(self.user.id, "sound")
+        self.assertEqual(attempts, 1)
+        self.assertGreater(sound, settings.SKILL_INITIAL_RATING)
+        self.assertLess(abs(sound - overall), abs(sound - settings.SKILL_INITIAL_RATING))
+
+    def test_ratings_are_written_behind_and_read_back(self):
+        self.store.record(self.user.id, "optic", "beginner", 4, 4)
+        self.assertFalse(SkillRating.objects.exists())
+        self.assertEqual(self.store.flush(), 2)
+
+        reloaded = SkillStore(100, 3600, 3600)
+        self.assertEqual(reloaded.rating(self.user.id, "optic"), self.store.rating(self.user.id, "optic"))
+        self.assertEqual(self.store.flush(), 0)
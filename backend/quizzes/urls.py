@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('quiz-attempts/', views.quiz_attempts, name='quiz_attempts'),
+    path('topic-scores/', views.topic_scores, name='topic_scores'),
+    path('leaderboard/', views.leaderboard, name='leaderboard'),
+    path('leaderboard/me/', views.my_rank, name='my_rank'),
+]
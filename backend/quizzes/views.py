@@ -1,3 +1,129 @@
-from django.shortcuts import render
+from django.conf import settings
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from content_generation.topics import normalize_topic
+from user_profiles.models import CustomUser
+from .attempts import submit_attempt
+from .leaderboards import board_name, ranking
+from .serializers import QuizAttemptSerializer, TopicScoreSerializer
+import logging
 
-# Create your views here.
+logger = logging.getLogger(__name__)
+
+
+def _paginated(request, queryset, serializer_class):
+    paginator = LimitOffsetPagination()
+    paginator.default_limit = settings.QUIZ_ATTEMPTS_PAGE_SIZE
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(serializer_class(page, many=True).data)
+
+
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticated])
+def quiz_attempts(request):
+    """
+    GET: List the authenticated user's quiz attempts, newest first
+    POST: Submit answers to a quiz and get the scored attempt
+
+    Answers are scored on the server, over every question of the quiz as it
+    was served, so unanswered questions count as wrong. A quiz is submitted
+    once, with the quiz_key returned alongside its questions:
+    {"quiz_key": "...", "answers": [{"index": 0, "answer_option": "b"}, ...]}
+
+    Bank questions can be answered by "question_id" instead of "index". A
+    quiz served without a content_id or topic also needs the "topic".
+    """
+    if request.method == "GET":
+        attempts = request.user.quiz_attempts.all()
+        return _paginated(request, attempts, QuizAttemptSerializer)
+
+    try:
+        attempt = submit_attempt(request.user, request.data)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.exception(f"Error submitting quiz attempt: {str(e)}")
+        return Response(
+            {"error": f"Failed to submit quiz attempt: {str(e)}"},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return Response(QuizAttemptSerializer(attempt).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def topic_scores(request):
+    """
+    List the authenticated user's results per topic, most recent first
+    """
+    scores = request.user.topic_scores.all()
+    return _paginated(request, scores, TopicScoreSerializer)
+
+
+def _request_board(request):
+    """
+    The leaderboard named by the window and topic query parameters
+    """
+    topic = request.query_params.get('topic', '').strip()
+    window = request.query_params.get('window', 'all').strip().lower()
+    return board_name(window, normalize_topic(topic) if topic else None)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def leaderboard(request):
+    """
+    Page through a leaderboard, best first
+
+    Query parameters:
+    - window: "all" (default), "week" or "month" for the current week or month
+    - topic: restrict the leaderboard to one topic
+    - limit, offset: the page to return
+    """
+    try:
+        board = _request_board(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    board_ranking = ranking(board)
+    paginator = LimitOffsetPagination()
+    paginator.default_limit = settings.QUIZ_ATTEMPTS_PAGE_SIZE
+    entries = paginator.paginate_queryset(board_ranking, request)
+    usernames = dict(
+        CustomUser.objects.filter(id__in=[entry['user_id'] for entry in entries])
+        .values_list('id', 'username')
+    )
+    for entry in entries:
+        entry['username'] = usernames.get(entry['user_id'], '')
+
+    response = paginator.get_paginated_response(entries)
+    response.data['board'] = board
+    response.data['average_score'] = board_ranking.average_score
+    return response
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def my_rank(request):
+    """
+    Get the authenticated user's rank on a leaderboard
+
+    Takes the same window and topic query parameters as the leaderboard.
+    rank is null if the user has no attempts on the leaderboard.
+    """
+    try:
+        board = _request_board(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    board_ranking = ranking(board)
+    standing = board_ranking.rank(request.user.id) or {
+        'rank': None, 'user_id': request.user.id, 'points': 0, 'attempts': 0, 'average_score': 0.0,
+    }
+    standing['username'] = request.user.username
+    standing['board'] = board
+    standing['participants'] = len(board_ranking)
+    return Response(standing, status=status.HTTP_200_OK)
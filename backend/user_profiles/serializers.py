@@ -7,7 +7,9 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['id', 'username', 'email', 'password', 'first_name', 'last_name', 'tests_taken', 'average_score']
-        
+        # Quiz statistics are only updated by submitting quiz attempts
+        read_only_fields = ['tests_taken', 'average_score']
+
     def create(self, validated_data):
         # Remove password from validated data to handle separately
         password = validated_data.pop('password', None)
@@ -16,6 +18,15 @@ class UserSerializer(serializers.ModelSerializer):
         # Set password if provided
         if password:
             user.set_password(password)
-            user.save()
+            user.save(update_fields=['password'])
         return user
 
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Save only the edited fields, so a concurrent quiz attempt's
+        # update of the user's statistics is not overwritten
+        if validated_data:
+            instance.save(update_fields=list(validated_data))
+        return instance
+
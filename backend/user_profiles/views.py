@@ -119,7 +119,7 @@ def update_profile(request):
             # Handle password update separately if provided
             if password:
                 user.set_password(password)
-                user.save()
+                user.save(update_fields=['password'])
             
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
@@ -185,7 +185,7 @@ def change_password(request):
         
         # Set new password
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
         
         # Update token to force logout on other devices
         Token.objects.filter(user=user).delete()
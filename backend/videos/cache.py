@@ -0,0 +1,121 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from content_generation.topics import TopicIndex, normalize_topic
+from quizzes.cache import LRUCache
+from .models import VideoSearch
+
+logger = logging.getLogger(__name__)
+
+FRESH = "fresh"
+STALE = "stale"
+EXPIRED = "expired"
+RELATED = "related"
+
+# Most recently searched topics, in front of the VideoSearch table
+video_memory_cache = LRUCache(
+    settings.VIDEO_CACHE_MEMORY_ENTRIES,
+    settings.VIDEO_CACHE_TTL + settings.VIDEO_CACHE_STALE_SECONDS,
+)
+
+# Near-match index over cached topics, to find related results when YouTube can't be called
+video_topic_index = TopicIndex()
+
+# Duration, statistics and embeddability of recently returned videos, by video ID
+video_details_cache = LRUCache(settings.VIDEO_DETAILS_ENTRIES, settings.VIDEO_CACHE_TTL)
+
+
+def video_topic_key(query) -> str:
+    """
+    Return the cache key of a search query
+    """
+    return normalize_topic(query)[:255]
+
+
+def _state(fetched_at):
+    age = (timezone.now() - fetched_at).total_seconds()
+    if age < settings.VIDEO_CACHE_TTL:
+        return FRESH
+    if age < settings.VIDEO_CACHE_TTL + settings.VIDEO_CACHE_STALE_SECONDS:
+        return STALE
+    return None
+
+
+def _remaining_ttl(fetched_at) -> float:
+    age = (timezone.now() - fetched_at).total_seconds()
+    return max(settings.VIDEO_CACHE_TTL + settings.VIDEO_CACHE_STALE_SECONDS - age, 0)
+
+
+def get_cached_videos(topic_key, max_results, expired=False):
+    """
+    Look up the cached search results of a topic.
+
+    Returns (videos, state) where state is "fresh" or "stale", or
+    (None, None) if the topic is not cached, has expired, or was searched
+    for fewer results than max_results. With expired=True, results of any
+    age and size are returned instead of None, with state "expired" if
+    they are past the stale window.
+    """
+    entry = video_memory_cache.get(topic_key)
+    if entry is None:
+        searches = VideoSearch.objects.filter(topic_key=topic_key)
+        if not expired:
+            searches = searches.filter(fetched_at__gte=timezone.now() - timedelta(
+                seconds=settings.VIDEO_CACHE_TTL + settings.VIDEO_CACHE_STALE_SECONDS
+            ))
+        search = searches.first()
+        if search is None:
+            return None, None
+        entry = (search.videos, search.max_results, search.fetched_at)
+        if _state(search.fetched_at) is not None:
+            video_memory_cache.set(topic_key, entry, _remaining_ttl(search.fetched_at))
+
+    videos, searched_for, fetched_at = entry
+    state = _state(fetched_at)
+    if expired:
+        return videos[:max_results], state or EXPIRED
+    # A search for fewer results can't answer this one, unless YouTube had no more
+    if searched_for < max_results and len(videos) >= searched_for:
+        return None, None
+    if state is None:
+        return None, None
+    return videos[:max_results], state
+
+
+def find_related_videos(topic_key, max_results):
+    """
+    Return the cached results of the topic closest to topic_key, or None
+    if no cached topic is similar enough
+    """
+    # Pick up topics cached since the last lookup, including by other processes
+    since = video_topic_index.sync_since()
+    video_topic_index.sync(
+        ((search_id, key, '')
+         for search_id, key in VideoSearch.objects.filter(id__gt=since)
+         .order_by('id').values_list('id', 'topic_key')),
+        since,
+    )
+    best = video_topic_index.best_match(topic_key, '', settings.VIDEO_RELATED_MATCH_THRESHOLD)
+    if best is None:
+        return None
+    search = VideoSearch.objects.filter(id=best[0]).first()
+    return search.videos[:max_results] if search is not None else None
+
+
+def store_videos(topic_key, query, max_results, videos):
+    """
+    Cache the results of a search
+    """
+    fetched_at = timezone.now()
+    video_memory_cache.set(topic_key, (videos, max_results, fetched_at))
+    # A single upsert statement, so concurrent searches don't contend for a write lock
+    VideoSearch.objects.bulk_create(
+        [VideoSearch(
+            topic_key=topic_key, query=query[:255], max_results=max_results,
+            videos=videos, fetched_at=fetched_at,
+        )],
+        update_conflicts=True,
+        unique_fields=['topic_key'],
+        update_fields=['query', 'max_results', 'videos', 'fetched_at'],
+    )
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from asgiref.sync import sync_to_async
+from .cache import video_details_cache
+from .utils import VIDEOS_PER_LOOKUP, video_id_of
+
+logger = logging.getLogger(__name__)
+
+
+class VideoEnricher:
+    """
+    Adds duration, statistics and embeddability to search results, looking
+    up the videos of many searches together.
+
+    IDs asked for within window seconds of each other are sent in one
+    videos.list call, or as soon as VIDEOS_PER_LOOKUP are waiting, so the
+    searches of a batch share a few calls instead of making one each.
+    Details already in video_details_cache, or stored on the Video rows
+    recently, are not looked up again. Used from a single event loop, e.g.
+    for the length of one request.
+    """
+
+    def __init__(self, service, window):
+        self.service = service
+        self.window = window
+        # Futures of the IDs waiting to be looked up
+        self._pending = {}
+        self._flush_handle = None
+        self._lookups = set()
+
+    async def enrich(self, videos):
+        """
+        Return the videos with their details added. Videos whose details
+        could not be looked up are returned as they are.
+        """
+        details = await self.details([video_id_of(video) for video in videos])
+        return [
+            {**video, **details[video_id_of(video)]} if video_id_of(video) in details else video
+            for video in videos
+        ]
+
+    async def details(self, video_ids):
+        """
+        Return the details of the videos, by video ID
+        """
+        loop = asyncio.get_running_loop()
+        found = {}
+        waiting = {}
+        for video_id in video_ids:
+            cached = video_details_cache.get(video_id)
+            if cached is not None:
+                found[video_id] = cached
+                continue
+            future = self._pending.get(video_id)
+            if future is None:
+                future = loop.create_future()
+                self._pending[video_id] = future
+            waiting[video_id] = future
+
+        if len(self._pending) >= VIDEOS_PER_LOOKUP:
+            self._flush()
+        elif self._pending and self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+
+        for video_id, future in waiting.items():
+            # Shielded so a cancelled caller does not cancel the lookup for others
+            details = await asyncio.shield(future)
+            if details is not None:
+                found[video_id] = details
+        return found
+
+    def _flush(self):
+        """
+        Look up every waiting ID, VIDEOS_PER_LOOKUP per call
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        video_ids = list(pending)
+        for start in range(0, len(video_ids), VIDEOS_PER_LOOKUP):
+            chunk = {video_id: pending[video_id] for video_id in video_ids[start:start + VIDEOS_PER_LOOKUP]}
+            lookup = asyncio.ensure_future(self._lookup(chunk))
+            self._lookups.add(lookup)
+            lookup.add_done_callback(self._lookups.discard)
+
+    async def _lookup(self, futures):
+        try:
+            details = await sync_to_async(self.service.video_details, thread_sensitive=False)(list(futures))
+        except Exception as e:
+            logger.warning(f"Error looking up details of {len(futures)} videos: {str(e)}")
+            details = {}
+        for video_id, future in futures.items():
+            if video_id in details:
+                video_details_cache.set(video_id, details[video_id])
+            if not future.done():
+                future.set_result(details.get(video_id))
+
+    async def close(self):
+        """
+        Look up any IDs still waiting and wait for the lookups to finish
+        """
+        if self._pending:
+            self._flush()
+        if self._lookups:
+            await asyncio.gather(*self._lookups, return_exceptions=True)
@@ -0,0 +1,193 @@
+import logging
+import re
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Video
+
+logger = logging.getLogger(__name__)
+
+# SQLite FTS5 table over the title, description and topics of Video rows,
+# with the same rowid. Created on first use since it is not a Django model.
+FTS_TABLE = "videos_video_fts"
+
+# bm25 weights of the title, description and topics columns
+_WEIGHTS = (10.0, 1.0, 5.0)
+
+_WORDS = re.compile(r"\w+")
+
+# Databases whose FTS table exists, by name
+_created = set()
+_created_lock = threading.Lock()
+
+
+def index_available():
+    """
+    Whether the full-text index can be used with the default database
+    """
+    return settings.VIDEO_INDEX_ENABLED and connection.vendor == "sqlite"
+
+
+def _ensure_table():
+    name = connection.settings_dict["NAME"]
+    if name in _created:
+        return
+    with _created_lock:
+        if name in _created:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(title, description, topics, tokenize='porter unicode61')"
+            )
+            # Index videos stored before the table existed
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description, topics) "
+                f"SELECT id, title, description, topics FROM {Video._meta.db_table} "
+                f"WHERE id NOT IN (SELECT rowid FROM {FTS_TABLE})"
+            )
+        _created.add(name)
+
+
+def _search_text(query):
+    """
+    Return the words of a query as an FTS5 expression matching all of them
+    """
+    words = _WORDS.findall(str(query).casefold())
+    return " ".join(f'"{word}"' for word in words)
+
+
+def _as_result(video_id, title, thumbnail_url):
+    return {
+        "video_id": video_id,
+        "title": title,
+        "url": f"https://www.youtube.com/watch?v={video_id}",
+        "thumbnail_url": thumbnail_url,
+    }
+
+
+def index_videos(query, items):
+    """
+    Store the videos of a search.list response and add them to the index,
+    recording query as one of the searches that found them
+    """
+    if not items or not index_available():
+        return
+    _ensure_table()
+    query = " ".join(str(query).split())
+    by_id = {item["id"]["videoId"]: item for item in items}
+    existing = dict(Video.objects.filter(video_id__in=by_id).values_list("video_id", "topics"))
+
+    rows = []
+    for video_id, item in by_id.items():
+        snippet = item["snippet"]
+        topics = existing.get(video_id, "").splitlines()
+        if query.casefold() not in {topic.casefold() for topic in topics}:
+            topics.append(query)
+        rows.append(Video(
+            video_id=video_id,
+            title=snippet["title"][:255],
+            description=snippet.get("description", ""),
+            channel_title=snippet.get("channelTitle", "")[:255],
+            thumbnail_url=snippet["thumbnails"]["high"]["url"],
+            published_at=parse_datetime(snippet.get("publishedAt") or ""),
+            topics="\n".join(topics),
+            updated_at=timezone.now(),
+        ))
+
+    with transaction.atomic():
+        Video.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["video_id"],
+            update_fields=[
+                "title", "description", "channel_title", "thumbnail_url",
+                "published_at", "topics", "updated_at",
+            ],
+        )
+        indexed = list(
+            Video.objects.filter(video_id__in=by_id).values_list("id", "title", "description", "topics")
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in indexed])
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, description, topics) VALUES (%s, %s, %s, %s)",
+                indexed,
+            )
+
+
+def search_video_index(query, max_results, strict=True):
+    """
+    Return up to max_results indexed videos matching every word of query,
+    best first.
+
+    With strict=True the words must appear in a video's title or in a
+    search that found it, and an empty list is returned unless there are
+    max_results such videos, so the caller can tell the index can't answer
+    the query on its own. Otherwise descriptions count too and any matches
+    are returned.
+    """
+    if not index_available():
+        return []
+    text = _search_text(query)
+    if not text:
+        return []
+    _ensure_table()
+    if strict:
+        text = f"{{title topics}} : ({text})"
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT video.video_id, video.title, video.thumbnail_url "
+            f"FROM {FTS_TABLE} JOIN {Video._meta.db_table} AS video ON video.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s",
+            [text, *_WEIGHTS, max_results],
+        )
+        rows = cursor.fetchall()
+    if strict and len(rows) < max_results:
+        return []
+    return [_as_result(*row) for row in rows]
+
+
+def store_video_details(details):
+    """
+    Save details looked up with videos.list onto the stored videos
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        for video_id, fields in details.items():
+            Video.objects.filter(video_id=video_id).update(
+                duration=fields["duration"] or "",
+                duration_seconds=fields["duration_seconds"],
+                view_count=fields["view_count"],
+                like_count=fields["like_count"],
+                comment_count=fields["comment_count"],
+                embeddable=fields["embeddable"],
+                details_updated_at=now,
+            )
+
+
+def stored_video_details(video_ids):
+    """
+    Return the details of stored videos looked up within VIDEO_CACHE_TTL,
+    by video ID
+    """
+    since = timezone.now() - timedelta(seconds=settings.VIDEO_CACHE_TTL)
+    rows = Video.objects.filter(video_id__in=video_ids, details_updated_at__gte=since).values_list(
+        "video_id", "duration", "duration_seconds", "view_count", "like_count",
+        "comment_count", "embeddable",
+    )
+    return {
+        video_id: {
+            "duration": duration or None,
+            "duration_seconds": duration_seconds,
+            "view_count": view_count,
+            "like_count": like_count,
+            "comment_count": comment_count,
+            "embeddable": embeddable,
+        }
+        for video_id, duration, duration_seconds, view_count, like_count, comment_count, embeddable in rows
+    }
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from videos.utils import youtube_service
+
+
+class Command(BaseCommand):
+    help = "Search for a topic's videos as video-links does, through the cache and quota"
+
+    def add_arguments(self, parser):
+        parser.add_argument('topic', nargs='?', default="Ray Optics", help="Topic to search for")
+        parser.add_argument('--max-results', type=int, default=5, help="Videos to return")
+
+    def handle(self, *args, **options):
+        topic = options['topic']
+        self.stdout.write(f"Searching YouTube for: {topic}")
+        videos, source = youtube_service().search(topic, options['max_results'])
+        self.stdout.write(f"Served from: {source}")
+        for idx, video in enumerate(videos, start=1):
+            self.stdout.write(f"\nVideo {idx}:")
+            self.stdout.write(f"Title: {video['title']}")
+            self.stdout.write(f"URL: {video['url']}")
+            self.stdout.write(f"Thumbnail: {video['thumbnail_url']}")
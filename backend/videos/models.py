@@ -1,3 +1,80 @@
 from django.db import models
 
-# Create your models here.
+
+class VideoSearch(models.Model):
+    """
+    Cached YouTube search results for a topic.
+
+    Results are keyed by the normalized topic and served until they are
+    VIDEO_CACHE_TTL seconds old; for VIDEO_CACHE_STALE_SECONDS after that they
+    are still served while being refreshed in the background.
+    """
+    topic_key = models.CharField(max_length=255, unique=True)
+    query = models.CharField(max_length=255)
+    # Number of results that were requested from the API
+    max_results = models.PositiveIntegerField()
+    videos = models.JSONField(help_text="The videos found, in search order")
+    fetched_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Video Search"
+        verbose_name_plural = "Video Searches"
+
+    def __str__(self):
+        return f"{self.query} ({len(self.videos)} videos)"
+
+
+class QuotaUsage(models.Model):
+    """
+    YouTube Data API quota units spent on a day, in total (blank topic_key)
+    and per searched topic.
+
+    Days follow Pacific time, when YouTube resets quotas.
+    """
+    day = models.DateField()
+    topic_key = models.CharField(max_length=255, blank=True)
+    units = models.PositiveIntegerField(default=0)
+    calls = models.PositiveIntegerField(default=0)
+    # Calls turned away by the daily budget or the rate limit
+    rejected = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Quota Usage"
+        verbose_name_plural = "Quota Usage"
+        unique_together = ['day', 'topic_key']
+        ordering = ['-day', '-units']
+
+    def __str__(self):
+        return f"{self.day} {self.topic_key or 'total'}: {self.units} units"
+
+
+class Video(models.Model):
+    """
+    A video returned by a YouTube search, kept so later searches can be
+    answered from the local full-text index (videos/index.py).
+    """
+    video_id = models.CharField(max_length=32, unique=True)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    channel_title = models.CharField(max_length=255, blank=True)
+    thumbnail_url = models.URLField(max_length=500)
+    published_at = models.DateTimeField(null=True, blank=True)
+    # Searches the video was found by, one per line
+    topics = models.TextField(blank=True)
+    # Details from videos.list, once looked up
+    duration = models.CharField(max_length=32, blank=True)
+    duration_seconds = models.PositiveIntegerField(null=True, blank=True)
+    view_count = models.PositiveBigIntegerField(null=True, blank=True)
+    like_count = models.PositiveBigIntegerField(null=True, blank=True)
+    comment_count = models.PositiveBigIntegerField(null=True, blank=True)
+    embeddable = models.BooleanField(null=True, blank=True)
+    details_updated_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Video"
+        verbose_name_plural = "Videos"
+
+    def __str__(self):
+        return self.title
@@ -0,0 +1,116 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
+from django.db import close_old_connections
+from .cache import video_topic_key
+from .quota import QuotaExceeded, youtube_quota
+from .utils import youtube_service
+
+logger = logging.getLogger(__name__)
+
+# Background threads that prefetch videos while content is generated
+_prefetch_executor = ThreadPoolExecutor(
+    max_workers=settings.VIDEO_PREFETCH_WORKERS, thread_name_prefix="video-prefetch"
+)
+# Topics queued or being prefetched, so a topic is not searched twice at once
+_queued = set()
+_queued_lock = threading.Lock()
+
+
+def section_video_query(topic, title):
+    """
+    Return the video search for a section of a topic's content
+    """
+    return f"{topic} {title}"
+
+
+class VideoPrefetch:
+    """
+    The video searches started for one content generation.
+
+    Searches run on a small shared thread pool as prefetch quota calls, so
+    they never use the quota reserve or rate limit headroom kept for
+    searches users are waiting on, nor more than VIDEO_PREFETCH_QUOTA_DAILY
+    units a day, and they are skipped while the quota is under pressure.
+    At most VIDEO_PREFETCH_MAX_TOPICS are started per generation, and none
+    are queued while VIDEO_PREFETCH_MAX_PENDING are waiting in the process.
+    cancel() drops the searches that have not started yet.
+    """
+
+    def __init__(self, topic):
+        self.topic = topic
+        self._cancelled = threading.Event()
+        # (topic_key, future) of every queued search
+        self._searches = []
+
+    def add(self, query):
+        """
+        Queue a search for query, unless the prefetch is cancelled or full
+        """
+        if not settings.VIDEO_PREFETCH_ENABLED or self._cancelled.is_set():
+            return
+        topic_key = video_topic_key(query)
+        with _queued_lock:
+            if (
+                not topic_key
+                or topic_key in _queued
+                or len(_queued) >= settings.VIDEO_PREFETCH_MAX_PENDING
+                or len(self._searches) >= settings.VIDEO_PREFETCH_MAX_TOPICS
+            ):
+                return
+            _queued.add(topic_key)
+            self._searches.append((topic_key, _prefetch_executor.submit(self._run, query, topic_key)))
+
+    def add_sections(self, titles):
+        """
+        Queue a search for every section title of the topic
+        """
+        for title in titles:
+            if isinstance(title, str) and title.strip():
+                self.add(section_video_query(self.topic, title))
+
+    def cancel(self):
+        """
+        Drop the searches that have not started
+        """
+        self._cancelled.set()
+        for topic_key, future in self._searches:
+            # Searches that never run release their topics here
+            if future.cancel():
+                with _queued_lock:
+                    _queued.discard(topic_key)
+
+    def wait(self, timeout=None):
+        """
+        Wait for the queued searches to finish
+        """
+        wait([future for _, future in self._searches], timeout)
+
+    def _run(self, query, topic_key):
+        try:
+            if self._cancelled.is_set():
+                return
+            if youtube_quota.under_pressure():
+                logger.info(f"Not prefetching videos for '{query}': the YouTube quota is running low")
+                return
+            source = youtube_service().prefetch(query, settings.VIDEO_PREFETCH_RESULTS)
+            logger.info(f"Prefetched videos for '{query}' ({source})")
+        except QuotaExceeded as e:
+            logger.info(f"Not prefetching videos for '{query}': {str(e)}")
+        except Exception as e:
+            logger.warning(f"Error prefetching videos for '{query}': {str(e)}")
+        finally:
+            with _queued_lock:
+                _queued.discard(topic_key)
+            close_old_connections()
+
+
+def start_video_prefetch(topic):
+    """
+    Start prefetching the videos of a topic whose content is being
+    generated. Add its sections once they are known.
+    """
+    prefetch = VideoPrefetch(topic)
+    prefetch.add(topic)
+    return prefetch
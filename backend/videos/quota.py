@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+from zoneinfo import ZoneInfo
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import QuotaUsage
+
+logger = logging.getLogger(__name__)
+
+# YouTube resets quotas at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+# Quota units of each API call
+SEARCH_COST = 100
+DETAILS_COST = 1
+
+# Topic key of a day's total usage
+TOTAL = ''
+# Topic key of a day's prefetch usage; normalized topics never start with a space
+PREFETCH = ' prefetch'
+
+
+def quota_day(when=None):
+    """
+    Return the quota day containing when
+    """
+    return (when or timezone.now()).astimezone(QUOTA_TIMEZONE).date()
+
+
+class QuotaExceeded(Exception):
+    """
+    Raised when a YouTube call is turned away by the daily budget or the
+    rate limit, or YouTube reports the quota is used up
+    """
+
+
+class TokenBucket:
+    """
+    Allows rate calls per second on average, with bursts of up to burst
+    calls. A rate of 0 allows every call.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, timeout=0.0, keep=0):
+        """
+        Take a token, waiting up to timeout seconds for one. Returns False
+        if none was available in time. With keep, a token is only taken if
+        keep more are left for other callers.
+        """
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1 + keep:
+                    self._tokens -= 1
+                    return True
+                wait = (1 + keep - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+def _increment_or_create(lookup, **fields):
+    """
+    Add fields to the QuotaUsage row matching lookup, creating it if needed
+    """
+    rows = QuotaUsage.objects.filter(**lookup)
+    increments = {name: F(name) + value for name, value in fields.items()}
+    if rows.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            QuotaUsage.objects.create(**lookup, **fields)
+    except IntegrityError:
+        # Created by a concurrent call first
+        rows.update(**increments)
+
+
+class QuotaScheduler:
+    """
+    Accounts YouTube calls against a daily quota budget shared by every
+    process, and rate limits them per process.
+
+    Units are reserved with a conditional UPDATE of the day's total before a
+    call is made, so concurrent processes can't overspend the budget. The
+    last reserve units are kept for searches a user is waiting on:
+    background calls are turned away once less than that is left, and never
+    wait for or use the last half of the rate limit's burst. Prefetch calls
+    are background calls that can also spend no more than prefetch_budget
+    units a day, if it is set.
+    """
+
+    def __init__(self, daily_budget, reserve, rate, burst, max_wait, prefetch_budget=None):
+        self.daily_budget = daily_budget
+        self.reserve = reserve
+        self.prefetch_budget = prefetch_budget
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(rate, burst)
+        # Day on which YouTube reported the quota as used up, so later calls
+        # that day are turned away without a query
+        self._exhausted_on = None
+
+    def acquire(self, units, topic_key=TOTAL, background=False, prefetch=False):
+        """
+        Reserve units for a call on behalf of topic_key. A prefetch call is
+        always a background call.
+
+        Raises QuotaExceeded if the call would go over the budget, or could
+        not get a rate limit token within max_wait seconds.
+        """
+        day = quota_day()
+        background = background or prefetch
+        limit = self.daily_budget - (self.reserve if background else 0)
+        if self._exhausted_on == day:
+            self._reject(day, topic_key)
+            raise QuotaExceeded(f"The YouTube quota for {day} is used up")
+        if background:
+            allowed = self.bucket.take(0, keep=self.bucket.burst // 2)
+        else:
+            allowed = self.bucket.take(self.max_wait)
+        if not allowed:
+            self._reject(day, topic_key)
+            raise QuotaExceeded("Too many YouTube calls, try again shortly")
+
+        prefetch = prefetch and self.prefetch_budget is not None
+        if prefetch and not self._reserve(day, units, self.prefetch_budget, PREFETCH):
+            self._reject(day, topic_key)
+            raise QuotaExceeded(f"The video prefetch budget for {day} is used up")
+        if not self._reserve(day, units, limit):
+            if prefetch:
+                # Give back the prefetch units of a call that isn't made
+                QuotaUsage.objects.filter(day=day, topic_key=PREFETCH).update(
+                    units=F('units') - units, calls=F('calls') - 1
+                )
+            self._reject(day, topic_key)
+            raise QuotaExceeded(f"Not enough YouTube quota left for {day}")
+        if topic_key:
+            _increment_or_create(dict(day=day, topic_key=topic_key), units=units, calls=1)
+
+    def _reserve(self, day, units, limit, key=TOTAL):
+        rows = QuotaUsage.objects.filter(day=day, topic_key=key, units__lte=limit - units)
+        if rows.update(units=F('units') + units, calls=F('calls') + 1):
+            return True
+        if units > limit or QuotaUsage.objects.filter(day=day, topic_key=key).exists():
+            return False
+        try:
+            with transaction.atomic():
+                QuotaUsage.objects.create(day=day, topic_key=key, units=units, calls=1)
+            return True
+        except IntegrityError:
+            # The first call of the day from another process created the row
+            return bool(rows.update(units=F('units') + units, calls=F('calls') + 1))
+
+    def _reject(self, day, topic_key):
+        try:
+            for key in {TOTAL, topic_key}:
+                _increment_or_create(dict(day=day, topic_key=key), rejected=1)
+        except Exception as e:
+            logger.warning(f"Error counting a rejected YouTube call: {str(e)}")
+
+    def exhausted(self):
+        """
+        Record that YouTube reported the quota as used up, so every process
+        stops calling it for the rest of the day
+        """
+        day = quota_day()
+        self._exhausted_on = day
+        logger.warning(f"YouTube reported the quota for {day} is used up")
+        _increment_or_create(dict(day=day, topic_key=TOTAL), units=0)
+        QuotaUsage.objects.filter(day=day, topic_key=TOTAL, units__lt=self.daily_budget).update(
+            units=self.daily_budget
+        )
+
+    def remaining(self, day=None):
+        """
+        Return the units left in a day's budget, today's by default
+        """
+        used = (
+            QuotaUsage.objects.filter(day=day or quota_day(), topic_key=TOTAL)
+            .values_list('units', flat=True).first()
+        ) or 0
+        return max(self.daily_budget - used, 0)
+
+    def under_pressure(self):
+        """
+        Whether background calls are being turned away
+        """
+        return self._exhausted_on == quota_day() or self.remaining() < self.reserve
+
+    def usage(self, day=None, topics=20):
+        """
+        Return a day's quota usage: the budget, units used and left, calls
+        made and rejected, whether background calls are being turned away
+        now, the units prefetch used, and the topics that used the most units
+        """
+        day = day or quota_day()
+        rows = QuotaUsage.objects.filter(day=day)
+        total = rows.filter(topic_key=TOTAL).first()
+        prefetched = rows.filter(topic_key=PREFETCH).values_list('units', flat=True).first()
+        return {
+            'day': day.isoformat(),
+            'budget': self.daily_budget,
+            'reserve': self.reserve,
+            'used': total.units if total else 0,
+            'remaining': self.remaining(day),
+            'calls': total.calls if total else 0,
+            'rejected': total.rejected if total else 0,
+            'under_pressure': self.under_pressure(),
+            'prefetch_budget': self.prefetch_budget,
+            'prefetch_used': prefetched or 0,
+            'topics': list(
+                rows.exclude(topic_key__in=[TOTAL, PREFETCH]).order_by('-units')
+                .values('topic_key', 'units', 'calls', 'rejected')[:topics]
+            ),
+        }
+
+
+youtube_quota = QuotaScheduler(
+    settings.VIDEO_QUOTA_DAILY,
+    settings.VIDEO_QUOTA_RESERVE,
+    settings.VIDEO_API_RATE,
+    settings.VIDEO_API_BURST,
+    settings.VIDEO_API_MAX_WAIT,
+    settings.VIDEO_PREFETCH_QUOTA_DAILY,
+)
@@ -1,3 +1,262 @@
-from django.test import TestCase
+import asyncio
+import threading
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from . import index, prefetch, utils
+from .cache import store_videos, video_details_cache, video_memory_cache
+from .enrichment import VideoEnricher
+from .models import VideoSearch
+from .quota import QuotaExceeded, QuotaScheduler, TokenBucket
+from .utils import YouTubeService, duration_seconds, youtube_service
 
-# Create your tests here.
+
+def _video(video_id, title="Optics explained"):
+    return {
+        "video_id": video_id,
+        "title": title,
+        "url": f"https://www.youtube.com/watch?v={video_id}",
+        "thumbnail_url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+    }
+
+
+@override_settings(YOUTUBE_API_KEY="test-key", VIDEO_INDEX_ENABLED=False)
+class VideoCacheTests(TestCase):
+    def setUp(self):
+        video_memory_cache.clear()
+        self.service = YouTubeService()
+
+    def test_client_is_built_once_without_fetching_discovery(self):
+        with mock.patch('googleapiclient.discovery.build') as build, \
+                mock.patch.object(utils, '_service', None):
+            self.assertIs(youtube_service(), youtube_service())
+        build.assert_not_called()
+
+    def test_repeat_searches_are_served_from_the_cache(self):
+        with mock.patch.object(self.service, 'fetch_videos', return_value=[_video("a"), _video("b")]) as fetch:
+            sources = [self.service.search("Ray Optics", 2)[1] for _ in range(2)]
+            video_memory_cache.clear()
+            sources.append(self.service.search("ray  optics", 1)[1])
+        self.assertEqual(sources, ["miss", "fresh", "fresh"])
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_search_for_more_results_than_cached_is_a_miss(self):
+        store_videos("ray optic", "Ray Optics", 2, [_video("a"), _video("b")])
+        with mock.patch.object(self.service, 'fetch_videos', return_value=[_video("c")] * 5):
+            self.assertEqual(self.service.search("Ray Optics", 5)[1], "miss")
+
+    def test_stale_results_are_served_while_refreshed(self):
+        store_videos("ray optic", "Ray Optics", 2, [_video("a"), _video("b")])
+        VideoSearch.objects.update(fetched_at=timezone.now() - timedelta(seconds=settings.VIDEO_CACHE_TTL + 1))
+        video_memory_cache.clear()
+        with mock.patch.object(self.service, '_schedule_refresh') as refresh:
+            videos, source = self.service.search("Ray Optics", 2)
+        self.assertEqual((len(videos), source), (2, "stale"))
+        refresh.assert_called_once_with("Ray Optics", "ray optic", 2)
+
+
+class VideoEnricherTests(SimpleTestCase):
+    def setUp(self):
+        video_details_cache.clear()
+        self.service = mock.Mock()
+        self.service.video_details.side_effect = lambda video_ids: {
+            video_id: {"duration": "PT1M", "duration_seconds": 60} for video_id in video_ids
+        }
+
+    def _enrich(self, *searches):
+        async def run():
+            enricher = VideoEnricher(self.service, 0.05)
+            results = await asyncio.gather(*[enricher.enrich(videos) for videos in searches])
+            await enricher.close()
+            return results
+        return asyncio.run(run())
+
+    def test_searches_share_one_lookup(self):
+        results = self._enrich([_video("a"), _video("b")], [_video("b"), _video("c")])
+        self.service.video_details.assert_called_once()
+        self.assertEqual(sorted(self.service.video_details.call_args.args[0]), ["a", "b", "c"])
+        self.assertEqual(results[1][1]["duration_seconds"], 60)
+
+    def test_cached_details_are_not_looked_up_again(self):
+        self._enrich([_video("a")])
+        self._enrich([_video("a")])
+        self.assertEqual(self.service.video_details.call_count, 1)
+
+    def test_videos_are_returned_as_they_are_when_the_lookup_fails(self):
+        self.service.video_details.side_effect = RuntimeError("quota")
+        self.assertEqual(self._enrich([_video("a")]), [[_video("a")]])
+
+    def test_durations_are_parsed(self):
+        self.assertEqual(duration_seconds("PT1H2M3S"), 3723)
+        self.assertEqual(duration_seconds("P1DT30S"), 86430)
+        self.assertIsNone(duration_seconds("soon"))
+
+
+class QuotaSchedulerTests(TestCase):
+    def _scheduler(self):
+        return QuotaScheduler(daily_budget=250, reserve=100, rate=0, burst=1, max_wait=0)
+
+    def test_budget_is_not_overspent(self):
+        scheduler = self._scheduler()
+        scheduler.acquire(100, "ray optic")
+        scheduler.acquire(100, "ray optic")
+        with self.assertRaises(QuotaExceeded):
+            scheduler.acquire(100, "ray optic")
+        usage = scheduler.usage()
+        self.assertEqual((usage["used"], usage["remaining"], usage["rejected"]), (200, 50, 1))
+        self.assertEqual(usage["topics"][0]["units"], 200)
+
+    def test_background_calls_leave_the_reserve(self):
+        scheduler = self._scheduler()
+        scheduler.acquire(100, background=True)
+        with self.assertRaises(QuotaExceeded):
+            scheduler.acquire(100, background=True)
+        scheduler.acquire(100)
+
+    def test_prefetch_calls_have_their_own_budget(self):
+        scheduler = QuotaScheduler(daily_budget=1000, reserve=100, rate=0, burst=1, max_wait=0, prefetch_budget=200)
+        scheduler.acquire(100, "ray optic", prefetch=True)
+        scheduler.acquire(100, "lens", prefetch=True)
+        with self.assertRaises(QuotaExceeded):
+            scheduler.acquire(100, "mirror", prefetch=True)
+        # Searches users wait on and other background calls still have the rest of the day's budget
+        scheduler.acquire(100, "mirror")
+        scheduler.acquire(100, background=True)
+        usage = scheduler.usage()
+        self.assertEqual((usage["used"], usage["prefetch_used"]), (400, 200))
+        self.assertNotIn(" prefetch", [topic["topic_key"] for topic in usage["topics"]])
+
+    def test_prefetch_units_are_given_back_when_the_day_budget_turns_the_call_away(self):
+        scheduler = QuotaScheduler(daily_budget=250, reserve=100, rate=0, burst=1, max_wait=0, prefetch_budget=200)
+        scheduler.acquire(100)
+        with self.assertRaises(QuotaExceeded):
+            scheduler.acquire(100, prefetch=True)
+        self.assertEqual(scheduler.usage()["prefetch_used"], 0)
+
+    def test_reported_exhaustion_stops_later_calls(self):
+        scheduler = self._scheduler()
+        scheduler.exhausted()
+        self.assertEqual(scheduler.remaining(), 0)
+        with self.assertRaises(QuotaExceeded):
+            scheduler.acquire(1)
+
+    def test_token_bucket_limits_bursts(self):
+        bucket = TokenBucket(rate=1, burst=2)
+        self.assertEqual([bucket.take() for _ in range(3)], [True, True, False])
+        self.assertFalse(bucket.take(keep=1))
+
+
+@override_settings(YOUTUBE_API_KEY="test-key", VIDEO_INDEX_ENABLED=False)
+class QuotaFallbackTests(TestCase):
+    def setUp(self):
+        video_memory_cache.clear()
+        self.service = YouTubeService()
+
+    def test_expired_results_are_served_when_the_quota_runs_out(self):
+        store_videos("ray optic", "Ray Optics", 2, [_video("a"), _video("b")])
+        VideoSearch.objects.update(fetched_at=timezone.now() - timedelta(days=365))
+        video_memory_cache.clear()
+        with mock.patch.object(self.service, 'fetch_videos', side_effect=QuotaExceeded("used up")):
+            videos, source = self.service.search("Ray Optics", 2)
+        self.assertEqual((len(videos), source), (2, "expired"))
+
+    def test_nothing_cached_reports_the_quota(self):
+        with mock.patch.object(self.service, 'fetch_videos', side_effect=QuotaExceeded("used up")):
+            self.assertEqual(self.service.search("Ray Optics", 2), ([], "quota"))
+
+
+def _search_item(video_id, title, description=""):
+    return {
+        "id": {"videoId": video_id},
+        "snippet": {
+            "title": title,
+            "description": description,
+            "channelTitle": "Physics Channel",
+            "publishedAt": "2024-01-01T12:00:00Z",
+            "thumbnails": {"high": {"url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"}},
+        },
+    }
+
+
+@override_settings(YOUTUBE_API_KEY="test-key", VIDEO_INDEX_ENABLED=True)
+class VideoIndexTests(TestCase):
+    def setUp(self):
+        video_memory_cache.clear()
+        # The FTS table is rolled back with each test, so create it again
+        patcher = mock.patch.object(index, '_created', set())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        index.index_videos("ray optics", [
+            _search_item("a", "Refraction through lenses"),
+            _search_item("b", "Mirrors and reflection"),
+            _search_item("c", "Wave interference", "How lenses focus light"),
+        ])
+
+    def test_videos_are_found_by_title_or_the_search_that_found_them(self):
+        found = index.search_video_index("Ray Optics", 3)
+        self.assertEqual(sorted(video["video_id"] for video in found), ["a", "b", "c"])
+        self.assertEqual([video["video_id"] for video in index.search_video_index("lenses", 1)], ["a"])
+
+    def test_strict_search_needs_enough_results(self):
+        self.assertEqual(index.search_video_index("lenses", 2), [])
+        found = index.search_video_index("lenses", 2, strict=False)
+        self.assertEqual(sorted(video["video_id"] for video in found), ["a", "c"])
+
+    def test_search_is_answered_from_the_index_without_youtube(self):
+        service = YouTubeService()
+        with mock.patch.object(service, 'fetch_videos') as fetch:
+            videos, source = service.search("optics ray", 3)
+        fetch.assert_not_called()
+        self.assertEqual((len(videos), source), (3, "index"))
+
+
+@override_settings(VIDEO_PREFETCH_ENABLED=True, VIDEO_PREFETCH_MAX_TOPICS=3)
+class VideoPrefetchTests(SimpleTestCase):
+    def setUp(self):
+        self.service = mock.Mock()
+        self.service.prefetch.return_value = "miss"
+        self.quota = mock.Mock()
+        self.quota.under_pressure.return_value = False
+        for name, value in (('youtube_service', mock.Mock(return_value=self.service)), ('youtube_quota', self.quota)):
+            patcher = mock.patch.object(prefetch, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _queries(self):
+        return sorted(call.args[0] for call in self.service.prefetch.call_args_list)
+
+    def test_topic_and_sections_are_prefetched_up_to_the_limit(self):
+        started = prefetch.start_video_prefetch("Optics")
+        started.add_sections(["Lenses", "", "Mirrors", "Prisms"])
+        started.wait(5)
+        self.assertEqual(self._queries(), ["Optics", "Optics Lenses", "Optics Mirrors"])
+
+    def test_topic_already_queued_is_not_searched_twice(self):
+        release = threading.Event()
+        self.service.prefetch.side_effect = lambda query, max_results: release.wait(5)
+        first = prefetch.start_video_prefetch("Optics")
+        second = prefetch.start_video_prefetch("optics")
+        release.set()
+        first.wait(5)
+        second.wait(5)
+        self.assertEqual(self._queries(), ["Optics"])
+
+    def test_cancel_drops_searches_that_have_not_started(self):
+        release = threading.Event()
+        self.service.prefetch.side_effect = lambda query, max_results: release.wait(5)
+        started = prefetch.start_video_prefetch("Optics")
+        started.add_sections(["Lenses", "Mirrors"])
+        started.cancel()
+        release.set()
+        started.wait(5)
+        self.assertLess(len(self._queries()), 3)
+        self.assertEqual(prefetch._queued, set())
+
+    def test_nothing_is_prefetched_while_the_quota_is_under_pressure(self):
+        self.quota.under_pressure.return_value = True
+        started = prefetch.start_video_prefetch("Optics")
+        started.add_sections(["Lenses"])
+        started.wait(5)
+        self.service.prefetch.assert_not_called()
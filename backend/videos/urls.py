@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import video_links
+from .views import video_links, video_links_batch, video_quota
 
 urlpatterns = [
     path('video-links/', video_links, name='video_links'),
+    path('video-links/batch/', video_links_batch, name='video_links_batch'),
+    path('video-links/quota/', video_quota, name='video_quota'),
 ]
\ No newline at end of file
@@ -1,60 +1,343 @@
 # videos/youtube_service.py
+import json
+import logging
 import os
-# import django, sys
-from dotenv import load_dotenv
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import httplib2
+from django.conf import settings
+from django.db import close_old_connections
 import googleapiclient.discovery
+from googleapiclient.errors import HttpError
+from content_generation.inflight import SingleFlight
+from .cache import (
+    RELATED, STALE, find_related_videos, get_cached_videos, store_videos, video_topic_key,
+)
+from .index import index_videos, search_video_index, store_video_details, stored_video_details
+from .quota import DETAILS_COST, SEARCH_COST, QuotaExceeded, youtube_quota
 
-# Add parent directory to path so Python can find the core module
-# sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-# Set up Django settings
-# os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
-# django.setup()
+logger = logging.getLogger(__name__)
 
-# from django.conf import settings
+# The search.list and videos.list parts of YouTube's discovery document,
+# bundled so building the client needs no request to Google
+DISCOVERY_DOCUMENT = Path(__file__).parent / "discovery" / "youtube.v3.json"
+
+# Background threads that refresh stale search results off the request path
+_refresh_executor = ThreadPoolExecutor(
+    max_workers=settings.VIDEO_REFRESH_WORKERS, thread_name_prefix="video-refresh"
+)
+# Topics being refreshed, so a topic is not refreshed twice at once
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# Source of results found in the local full-text index
+INDEX = "index"
+
+# Coalesces concurrent searches for a topic that is not cached
+video_inflight = SingleFlight()
+
+# Most IDs videos.list accepts in one call
+VIDEOS_PER_LOOKUP = 50
+
+_DURATION = re.compile(r"^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+
+def duration_seconds(duration):
+    """
+    Convert an ISO 8601 duration such as "PT1H2M3S" to seconds, or None if
+    it can't be parsed
+    """
+    match = _DURATION.match(duration or "")
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def _count(statistics, name):
+    value = statistics.get(name)
+    return int(value) if value is not None else None
+
+
+def _error_reasons(error):
+    """
+    Return the reasons YouTube gave for an API error, e.g. "quotaExceeded"
+    """
+    try:
+        errors = json.loads(error.content.decode("utf-8"))["error"].get("errors", [])
+        return {item.get("reason") for item in errors}
+    except (ValueError, KeyError, AttributeError, TypeError):
+        return set()
+
+
+def video_id_of(video):
+    """
+    Return the YouTube ID of a search result
+    """
+    return video.get("video_id") or video["url"].rsplit("v=", 1)[-1]
 
-load_dotenv()
 
 class YouTubeService:
     def __init__(self):
-        # self.api_key = settings.YOUTUBE_API_KEY
-        self.api_key = os.getenv("YOUTUBE_API_KEY")
-        self.youtube = googleapiclient.discovery.build(
-            "youtube", "v3", developerKey=self.api_key
+        self.api_key = settings.YOUTUBE_API_KEY
+        # Send requests to the local API stand-in (benchmarks/standin.py) if one is set
+        standin_url = os.getenv("API_STANDIN_URL")
+        client_options = None
+        if standin_url:
+            client_options = {"api_endpoint": standin_url.rstrip("/")}
+            self.api_key = self.api_key or "standin"
+        self.youtube = googleapiclient.discovery.build_from_document(
+            DISCOVERY_DOCUMENT.read_text(encoding="utf-8"),
+            developerKey=self.api_key,
+            client_options=client_options,
         )
-    
-    def search_videos(self, query, max_results=5):
-        """Search for YouTube videos related to the query"""
+        # httplib2 connections can't be shared between threads
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = httplib2.Http(timeout=settings.VIDEO_API_TIMEOUT)
+            self._local.http = http
+        return http
+
+    def _execute(self, request, units, topic_key="", background=False, prefetch=False):
+        """
+        Execute an API request once the quota scheduler allows it. Raises
+        QuotaExceeded if it doesn't, or if YouTube reports the quota or rate
+        limit is exceeded.
+        """
+        youtube_quota.acquire(units, topic_key, background, prefetch)
         try:
-            search_response = self.youtube.search().list(
+            return request.execute(http=self._http())
+        except HttpError as e:
+            reasons = _error_reasons(e)
+            if reasons & {"quotaExceeded", "dailyLimitExceeded"}:
+                youtube_quota.exhausted()
+                raise QuotaExceeded("The YouTube quota is used up") from e
+            if reasons & {"rateLimitExceeded", "userRateLimitExceeded"}:
+                raise QuotaExceeded("YouTube is rate limiting requests") from e
+            raise
+
+    def fetch_videos(self, query, max_results=5, background=False, prefetch=False):
+        """
+        Search YouTube for videos, without the cache. Raises QuotaExceeded if
+        the quota doesn't allow it, and on API errors.
+        """
+        search_response = self._execute(
+            self.youtube.search().list(
                 q=query,
                 part="snippet",
                 type="video",
                 maxResults=max_results
-            ).execute()
-            
-            videos = []
-            for item in search_response.get("items", []):
-                video_id = item["id"]["videoId"]
-                video_data = {
-                    "title": item["snippet"]["title"],
-                    "url": f"https://www.youtube.com/watch?v={video_id}",
-                    "thumbnail_url": item["snippet"]["thumbnails"]["high"]["url"]
-                }
-                videos.append(video_data)
-            
-            return videos
+            ),
+            SEARCH_COST, video_topic_key(query), background, prefetch,
+        )
+
+        items = search_response.get("items", [])
+        try:
+            index_videos(query, items)
+        except Exception as e:
+            logger.warning(f"Error indexing videos for '{query}': {str(e)}")
+
+        videos = []
+        for item in items:
+            video_id = item["id"]["videoId"]
+            video_data = {
+                "video_id": video_id,
+                "title": item["snippet"]["title"],
+                "url": f"https://www.youtube.com/watch?v={video_id}",
+                "thumbnail_url": item["snippet"]["thumbnails"]["high"]["url"]
+            }
+            videos.append(video_data)
+        return videos
+
+    def fetch_video_details(self, video_ids):
+        """
+        Look up the duration, statistics and embeddability of up to
+        VIDEOS_PER_LOOKUP videos in one videos.list call. Returns details by
+        video ID, leaving out videos YouTube doesn't return.
+
+        Details are optional, so the lookup counts as a background call and
+        is turned away when the quota runs low. Raises QuotaExceeded then,
+        and on API errors.
+        """
+        if len(video_ids) > VIDEOS_PER_LOOKUP:
+            raise ValueError(f"videos.list takes at most {VIDEOS_PER_LOOKUP} IDs")
+        response = self._execute(
+            self.youtube.videos().list(
+                part="contentDetails,statistics,status",
+                id=",".join(video_ids),
+            ),
+            DETAILS_COST, background=True,
+        )
+
+        details = {}
+        for item in response.get("items", []):
+            duration = item.get("contentDetails", {}).get("duration")
+            statistics = item.get("statistics", {})
+            details[item["id"]] = {
+                "duration": duration,
+                "duration_seconds": duration_seconds(duration),
+                "view_count": _count(statistics, "viewCount"),
+                "like_count": _count(statistics, "likeCount"),
+                "comment_count": _count(statistics, "commentCount"),
+                "embeddable": item.get("status", {}).get("embeddable", False),
+            }
+        try:
+            store_video_details(details)
         except Exception as e:
-            print(f"Error searching YouTube: {e}")
-            return []
-
-# Test block to run the function when the script is executed directly
-if __name__ == "__main__":
-    service = YouTubeService()
-    topic = "Ray Optics"  # Example topic
-    print(f"Searching YouTube for: {topic}")
-    results = service.search_videos(topic)
-    for idx, video in enumerate(results, start=1):
-        print(f"\nVideo {idx}:")
-        print(f"Title: {video['title']}")
-        print(f"URL: {video['url']}")
-        print(f"Thumbnail: {video['thumbnail_url']}")
\ No newline at end of file
+            logger.warning(f"Error storing details of {len(details)} videos: {str(e)}")
+        return details
+
+    def video_details(self, video_ids):
+        """
+        Return the details of up to VIDEOS_PER_LOOKUP videos, from the stored
+        videos where they were looked up recently and from videos.list for
+        the rest
+        """
+        details = stored_video_details(video_ids)
+        missing = [video_id for video_id in video_ids if video_id not in details]
+        if missing:
+            details.update(self.fetch_video_details(missing))
+        return details
+
+    def _fetch_and_store(self, query, topic_key, max_results, background=False, prefetch=False):
+        videos = self.fetch_videos(query, max_results, background, prefetch)
+        try:
+            store_videos(topic_key, query, max_results, videos)
+        except Exception as e:
+            logger.warning(f"Error caching videos for '{query}': {str(e)}")
+        return videos
+
+    def search(self, query, max_results=5):
+        """
+        Search for YouTube videos related to the query, serving cached results
+        when there are any.
+
+        Returns (videos, source) where source is "fresh" or "stale" for cached
+        results, "index" for videos found in the local full-text index and
+        "miss" for results fetched from YouTube. Stale results are refreshed
+        in the background while the quota allows.
+
+        When YouTube can't be called, because of the quota or an error, the
+        topic's expired results ("expired"), weaker index matches ("index")
+        or the results of a similar cached topic ("related") are served
+        instead. Only if there are none is an
+        empty list returned, with source "quota" or "error".
+        """
+        topic_key = video_topic_key(query)
+        videos, state = get_cached_videos(topic_key, max_results)
+        if videos is not None:
+            if state == STALE:
+                self._schedule_refresh(query, topic_key, max_results)
+            return videos, state
+
+        videos = search_video_index(query, max_results)
+        if videos:
+            return videos, INDEX
+
+        try:
+            videos = video_inflight.do(
+                (topic_key, max_results),
+                lambda: self._fetch_and_store(query, topic_key, max_results),
+                timeout=settings.VIDEO_API_TIMEOUT * 2,
+            )
+            return videos, "miss"
+        except QuotaExceeded as e:
+            logger.warning(f"Not searching YouTube for '{query}': {str(e)}")
+            return self._fallback(query, topic_key, max_results, "quota")
+        except Exception as e:
+            logger.error(f"Error searching YouTube for '{query}': {str(e)}")
+            return self._fallback(query, topic_key, max_results, "error")
+
+    def _fallback(self, query, topic_key, max_results, failure):
+        """
+        Return the best results available without calling YouTube
+        """
+        videos, state = get_cached_videos(topic_key, max_results, expired=True)
+        if videos:
+            return videos, state
+        videos = search_video_index(query, max_results, strict=False)
+        if videos:
+            return videos, INDEX
+        videos = find_related_videos(topic_key, max_results)
+        if videos:
+            return videos, RELATED
+        return [], failure
+
+    def prefetch(self, query, max_results=5):
+        """
+        Make sure a later search for query is answered from the cache,
+        searching YouTube as a prefetch call if it must.
+
+        Returns how the results were found, as the source of search() does.
+        Raises QuotaExceeded if the quota or the prefetch budget doesn't
+        allow the call, and on API errors.
+        """
+        topic_key = video_topic_key(query)
+        videos, state = get_cached_videos(topic_key, max_results)
+        if videos is not None:
+            if state == STALE:
+                self._schedule_refresh(query, topic_key, max_results)
+            return state
+
+        videos = search_video_index(query, max_results)
+        if videos:
+            store_videos(topic_key, query, max_results, videos)
+            return INDEX
+
+        video_inflight.do(
+            (topic_key, max_results),
+            lambda: self._fetch_and_store(query, topic_key, max_results, prefetch=True),
+        )
+        return "miss"
+
+    def search_videos(self, query, max_results=5):
+        """Search for YouTube videos related to the query"""
+        videos, _ = self.search(query, max_results)
+        return videos
+
+    def _schedule_refresh(self, query, topic_key, max_results):
+        """
+        Refresh a topic's cached results in the background, unless they are
+        already being refreshed
+        """
+        with _refreshing_lock:
+            if topic_key in _refreshing:
+                return
+            _refreshing.add(topic_key)
+
+        def run():
+            try:
+                video_inflight.do(
+                    (topic_key, max_results),
+                    lambda: self._fetch_and_store(query, topic_key, max_results, background=True),
+                )
+            except Exception as e:
+                # The stale results stay cached until they expire
+                logger.warning(f"Error refreshing videos for '{query}': {str(e)}")
+            finally:
+                with _refreshing_lock:
+                    _refreshing.discard(topic_key)
+                close_old_connections()
+
+        _refresh_executor.submit(run)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def youtube_service():
+    """
+    Return the process's YouTube client, building it on first use
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = YouTubeService()
+    return _service
@@ -1,8 +1,33 @@
+from adrf.decorators import api_view as drf_api_view
 from rest_framework.decorators import permission_classes, api_view
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
-from .utils import YouTubeService
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import StreamingHttpResponse
+from content_generation.streaming import sse_event
+from .enrichment import VideoEnricher
+from .quota import quota_day, youtube_quota
+from .utils import youtube_service
+from datetime import date
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def parse_max_results(data):
+    """
+    Return the max_results of a request, default 5 and clamped to the 1-50
+    YouTube allows. Raises ValueError if it is not a number.
+    """
+    try:
+        return min(max(int(data.get('max_results', 5)), 1), 50)
+    except (TypeError, ValueError):
+        raise ValueError("max_results must be a number")
+
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -12,6 +37,12 @@ def video_links(request):
     
     Expects a JSON body with 'topic' field.
     Returns a list of video links with title, url, and thumbnail_url.
+    Results are cached per topic; the X-Video-Cache header says whether they
+    were served fresh or stale from the cache, found in the local video
+    index ("index"), or fetched ("miss"). When the
+    YouTube quota runs out, expired or related cached results are served
+    ("expired", "related"), and an empty list only if there are none
+    ("quota", "error").
     """
     # Get the topic from the request data
     topic = request.data.get('topic')
@@ -23,23 +54,128 @@ def video_links(request):
         )
     
     try:
-        # Initialize the YouTube service
-        youtube_service = YouTubeService()
-        
         # Get max_results parameter if provided (default to 5)
-        max_results = request.data.get('max_results', 5)
+        try:
+            max_results = parse_max_results(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Search for videos related to the topic
-        videos = youtube_service.search_videos(query=topic, max_results=max_results)
+        videos, source = youtube_service().search(query=topic, max_results=max_results)
         
         # Return the video data
         return Response({
             'topic': topic,
             'videos': videos
-        }, status=status.HTTP_200_OK)
+        }, status=status.HTTP_200_OK, headers={'X-Video-Cache': source})
     
     except Exception as e:
         return Response(
             {'error': f'Error fetching videos: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+
+def _search(topic, max_results):
+    """
+    Search for a topic's videos on a worker thread
+    """
+    try:
+        return youtube_service().search(query=topic, max_results=max_results)
+    finally:
+        close_old_connections()
+
+
+@drf_api_view(['POST'])
+@permission_classes([AllowAny])
+async def video_links_batch(request):
+    """
+    Fetch YouTube videos for many topics in one request.
+
+    Expected POST data:
+    {
+        "topics": ["Ray Optics", "Wave Optics", ...],
+        "max_results": 5 (optional),
+        "stream": false (optional)
+    }
+
+    Topics are searched concurrently, at most VIDEO_BATCH_CONCURRENCY at a
+    time, and every video gets its duration, statistics and embeddability
+    from videos.list, with the videos of all topics looked up together.
+    Each topic gets its own result or error. With "stream": true the
+    results are sent as server-sent "result" events as each topic
+    resolves, followed by a "done" event; otherwise they are returned
+    together in topic order.
+    """
+    topics = request.data.get('topics')
+    if not isinstance(topics, list) or not topics:
+        return Response(
+            {'error': 'topics must be a non-empty list'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(topics) > settings.VIDEO_BATCH_MAX_TOPICS:
+        return Response(
+            {'error': f'A batch can have at most {settings.VIDEO_BATCH_MAX_TOPICS} topics'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        max_results = parse_max_results(request.data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    search = sync_to_async(_search, thread_sensitive=False)
+    enricher = VideoEnricher(youtube_service(), settings.VIDEO_ENRICH_WINDOW)
+    semaphore = asyncio.Semaphore(settings.VIDEO_BATCH_CONCURRENCY)
+
+    async def run_topic(index, topic):
+        if not isinstance(topic, str) or not topic.strip():
+            return {'index': index, 'error': 'Each topic must be a non-empty string'}
+        async with semaphore:
+            videos, source = await search(topic, max_results)
+        if source in ('quota', 'error'):
+            error = 'YouTube quota exceeded' if source == 'quota' else 'Error fetching videos'
+            return {'index': index, 'topic': topic, 'error': error}
+        videos = await enricher.enrich(videos)
+        return {'index': index, 'topic': topic, 'videos': videos, 'source': source}
+
+    tasks = [run_topic(index, topic) for index, topic in enumerate(topics)]
+
+    if not request.data.get('stream', False):
+        results = await asyncio.gather(*tasks)
+        return Response({'results': results}, status=status.HTTP_200_OK)
+
+    async def events():
+        failed = 0
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            if 'error' in result:
+                failed += 1
+                yield sse_event('error', result)
+            else:
+                yield sse_event('result', result)
+        await enricher.close()
+        yield sse_event('done', {'succeeded': len(tasks) - failed, 'failed': failed})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def video_quota(request):
+    """
+    Report the YouTube quota used and left today, or on ?day=YYYY-MM-DD
+    (Pacific time), with the topics that used the most of it
+    """
+    day = quota_day()
+    if request.query_params.get('day'):
+        try:
+            day = date.fromisoformat(request.query_params['day'])
+        except ValueError:
+            return Response(
+                {'error': 'day must be a date in YYYY-MM-DD format'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    return Response(youtube_quota.usage(day), status=status.HTTP_200_OK)